@@ -1,52 +1,228 @@
+"""Application factory.
+
+Importing this module is cheap: it only creates the SQLAlchemy extension.
+create_app() builds a configured application without touching the
+database; schema creation and sample data are explicit CLI commands:
+
+    flask --app app init-db [--seed]
+    flask --app app seed-db
+    flask --app app compact-history
+    flask --app app startup-time
+
+`from app import app` still works and builds the default application on
+first use. Background services (history buffer, charts, session sweeper)
+start on the first request in each process, so they are never started in a
+pre-fork master; the async server (asgi.py) starts them from its lifespan.
+"""
 import os
 import logging
-from flask import Flask
-from flask_session import Session
+import subprocess
+import sys
+import threading
+import time
 from flask_sqlalchemy import SQLAlchemy
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
 
 # Initialize SQLAlchemy
 db = SQLAlchemy()
 
-# Create the Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "mtunes-secret-key")
+BLUEPRINT_MODULES = ('auth', 'songs', 'playlists', 'users', 'stream', 'covers', 'metrics')
+
+
+def create_app(config=None):
+    """Create the Flask app; config is a mapping applied over the defaults"""
+    from config import DB_PROFILE, SQLALCHEMY_DATABASE_URI, STARTUP_TIMING
+    timings = {}
+    started = last = time.perf_counter()
+
+    def phase(name):
+        nonlocal last
+        now = time.perf_counter()
+        timings[name] = now - last
+        last = now
+
+    from flask import Flask
+    import engine_profiles
+    import passwords
+    import sessions
+    import sql_metrics
+    phase('import_flask')
+
+    # Create the Flask app
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "mtunes-secret-key")
 
-# Import MySQL configuration
-from config import SQLALCHEMY_DATABASE_URI
+    # Configure MySQL database
+    app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["DB_PROFILE"] = DB_PROFILE
 
-# Configure MySQL database
-app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+    # Configure session; the backend is chosen by SESSION_BACKEND
+    app.config["SESSION_PERMANENT"] = False
+    app.config.update(config or {})
+    # Pool sizing and statement caching come from the engine profile
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_profiles.engine_options(
+        app.config["SQLALCHEMY_DATABASE_URI"], app.config["DB_PROFILE"]
+    ))
+    phase('config')
 
-# Initialize database with app
-db.init_app(app)
+    # Initialize database with app; no connection is made until first use
+    db.init_app(app)
+    engine_profiles.init_app(app, db)
+    sql_metrics.init_app(app, db)
+    sessions.init_app(app, db)
+    passwords.init_app(app)
+    phase('extensions')
 
-# Configure session
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SESSION_PERMANENT"] = False
-Session(app)
+    register_blueprints(app)
+    phase('blueprints')
 
-# Import routes
-from routes import auth, songs, playlists, users
+    register_commands(app)
+    _start_services_on_first_request(app)
+    phase('commands')
 
-# Register blueprints
-app.register_blueprint(auth.bp)
-app.register_blueprint(songs.bp)
-app.register_blueprint(playlists.bp)
-app.register_blueprint(users.bp)
+    timings['total'] = time.perf_counter() - started
+    app.config['STARTUP_TIMINGS'] = timings
+    if STARTUP_TIMING:
+        logger.info("create_app: %s", ', '.join(f'{name} {seconds * 1000:.1f}ms' for name, seconds in timings.items()))
+    return app
 
-# Initialize database and load sample data
-with app.app_context():
+
+def register_blueprints(app):
+    """Import the route modules and register their blueprints"""
+    import importlib
+    for name in BLUEPRINT_MODULES:
+        module = importlib.import_module(f'routes.{name}')
+        app.register_blueprint(module.bp)
+
+
+def init_db(seed=False):
+    """Create tables and search indexes, optionally loading sample data.
+
+    Also upgrades databases created before columns were added to existing
+    tables, since create_all() only creates missing tables.
+    """
+    import ingest_catalog
     import models
+    import search
     db.create_all()
-    models.init_sample_data()
+    ingest_catalog.ensure_schema(db)
+    models.Song.ensure_created_at()
+    models.PlaylistSong.ensure_positions()
+    search.ensure_search_index()
+    if seed:
+        models.init_sample_data()
+
+
+_services_lock = threading.Lock()
+
+
+def start_background_services(app):
+    """Start the history buffer, charts, session sweeper and catalog snapshot once per process"""
+    with _services_lock:
+        if app.extensions.get('hertz_services_pid') == os.getpid():
+            return
+        import charts
+        import history_buffer
+        import sessions
+        from config import CATALOG_SNAPSHOT_ENABLED
+        history_buffer.init_app(app)
+        charts.init_app(app)
+        sessions.start_sweeper(app)
+        if CATALOG_SNAPSHOT_ENABLED:
+            # Only imported when enabled, since it needs NumPy
+            import catalog_snapshot
+            catalog_snapshot.init_app(app)
+        app.extensions['hertz_services_pid'] = os.getpid()
+
+
+def _start_services_on_first_request(app):
+    started = threading.Event()
+
+    @app.before_request
+    def start_services():
+        # Started per process, so threads are never lost across a fork
+        if not started.is_set():
+            start_background_services(app)
+            started.set()
+
+
+def register_commands(app):
+    import click
+
+    @app.cli.command('init-db')
+    @click.option('--seed', is_flag=True, help="also load the sample songs, user and playlist")
+    def init_db_command(seed):
+        """Create the database schema and search index."""
+        init_db(seed=seed)
+        click.echo("Database initialized.")
+
+    @app.cli.command('seed-db')
+    def seed_db_command():
+        """Load sample data into an empty database."""
+        import models
+        models.init_sample_data()
+        click.echo("Sample data loaded.")
+
+    @app.cli.command('sweep-sessions')
+    def sweep_sessions_command():
+        """Delete expired server-side sessions."""
+        sweep = getattr(app.session_interface, 'sweep', None)
+        removed = sweep() if sweep is not None else 0
+        click.echo(f"Removed {removed} expired sessions.")
+
+    @app.cli.command('compact-history')
+    @click.option('--retention-days', type=int, help="days of raw plays to keep (default HISTORY_RETENTION_DAYS)")
+    def compact_history_command(retention_days):
+        """Roll up old play history into daily counts and prune it."""
+        import history_rollup
+        history_rollup.ensure_schema(db)
+        kwargs = {} if retention_days is None else {'retention_days': retention_days}
+        stats = history_rollup.compact_history(db, **kwargs)
+        click.echo(f"Compacted {stats['rows']} plays before {stats['cutoff']} into {stats['rollup_rows']} daily counts.")
+
+    @app.cli.command('startup-time')
+    @click.option('--runs', default=5, show_default=True, help="cold starts to measure")
+    def startup_time_command(runs):
+        """Measure cold-start time of create_app() in fresh interpreters."""
+        probe = (
+            "import time; t = time.perf_counter(); import app; a = app.create_app(); "
+            "print(time.perf_counter() - t, a.config['STARTUP_TIMINGS'])"
+        )
+        env = dict(os.environ, STARTUP_TIMING='0')
+        totals = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-c', probe], env=env, check=True,
+                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip().splitlines()[-1]
+            seconds, phases = output.split(' ', 1)
+            totals.append(float(seconds))
+            click.echo(f"{float(seconds) * 1000:.1f}ms  {phases}")
+        totals.sort()
+        click.echo(f"min {totals[0] * 1000:.1f}ms, median {totals[len(totals) // 2] * 1000:.1f}ms")
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `from app import app` builds the default application once, on first use
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Run through the importable module, so models share its db object
+    import app as application
+    dev_app = application.create_app()
+    with dev_app.app_context():
+        application.init_db(seed=True)
+    dev_app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,269 @@
+"""ASGI entry point with async handlers for the I/O-bound endpoints.
+
+    uvicorn asgi:app --workers 4
+    uvicorn --factory asgi:create_asgi_app
+
+Audio streaming (GET/HEAD /stream/<id>), the play events it records and
+catalog search (GET /songs/search?q=) run as Starlette handlers on an async
+engine (aiosqlite / aiomysql, see engine_profiles.create_async_engine), so a
+slow listener holds a coroutine rather than a worker thread. Each process
+has one async connection pool sized by the DB_PROFILE. Every other path is
+served by the unchanged Flask app, run by a2wsgi on ASGI_WSGI_THREADS
+threads, so the blueprints and the models API keep working as before.
+
+The async handlers share their HTTP logic with routes/stream.py and
+search.py, and read the same session cookie as Flask. Needs starlette,
+a2wsgi, uvicorn and the async driver for the database
+(pip install starlette a2wsgi uvicorn aiosqlite aiomysql).
+"""
+import asyncio
+import contextlib
+import datetime
+import logging
+import mimetypes
+import os
+from a2wsgi import WSGIMiddleware
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+from sqlalchemy import insert, select
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_range_header
+from config import AUDIO_OFFLOAD, ASGI_WSGI_THREADS, ASYNC_STREAM_BLOCK_SIZE
+import engine_profiles
+import history_buffer
+import recent_plays
+import song_cache
+
+logger = logging.getLogger(__name__)
+
+ASYNC_SEARCH_PATH = '/songs/search'
+
+
+async def get_songs(engine, song_ids):
+    """Async Song.get_many(): {song_id: payload} from song_cache, misses in one query"""
+    from models import Song
+    song_ids = list(dict.fromkeys(song_ids))
+    found, missing = song_cache.songs.get_many(song_ids)
+    if missing:
+        table = Song.__table__
+        async with engine.connect() as connection:
+            result = await connection.execute(
+                select(*[table.c[field] for field in Song.DICT_FIELDS]).where(table.c.id.in_(missing))
+            )
+            fetched = {row[0]: dict(zip(Song.DICT_FIELDS, row)) for row in result}
+        song_cache.songs.set_many(fetched)
+        found.update(fetched)
+    return {song_id: dict(found[song_id]) for song_id in song_ids if song_id in found}
+
+
+async def record_play(engine, user_id, song_id):
+    """Async History.add_entry(): queue the play, or insert it on the async engine"""
+    from models import History
+    buffer = history_buffer.get_buffer()
+    if buffer is not None:
+        # record() may block briefly for room; keep that off the event loop
+        play = await asyncio.to_thread(buffer.record, user_id, song_id)
+        played_at = play['played_at']
+    else:
+        played_at = datetime.datetime.utcnow()
+        async with engine.begin() as connection:
+            await connection.execute(insert(History.__table__).values(
+                user_id=user_id, song_id=song_id, played_at=played_at
+            ))
+    store = recent_plays.get_store()
+    if isinstance(store, recent_plays.LocalRecentPlays):
+        store.push(user_id, song_id, played_at)
+    else:
+        await asyncio.to_thread(store.push, user_id, song_id, played_at)
+
+
+async def session_user_id(request):
+    """user_id from the Flask session named by the request's cookie, or None"""
+    state = request.app.state
+    flask_app = state.flask_app
+    interface = flask_app.session_interface
+    value = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not value:
+        return None
+
+    import sessions
+    if isinstance(interface, sessions.SqlSessionInterface):
+        sid = value
+        if interface.use_signer:
+            try:
+                sid = interface._unsign(flask_app, sid)
+            except BadSignature:
+                return None
+        table = interface.table
+        async with state.engine.connect() as connection:
+            row = (await connection.execute(
+                select(table.c.data).where(table.c.session_id == interface._get_store_id(sid),
+                                           table.c.expires_at > datetime.datetime.utcnow())
+            )).first()
+        data = None if row is None else interface.serializer.decode(bytes(row.data))
+    elif isinstance(interface, SecureCookieSessionInterface):
+        serializer = interface.get_signing_serializer(flask_app)
+        try:
+            data = serializer.loads(value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return None
+    else:
+        # Memory and filesystem stores only have a synchronous API
+        data = await asyncio.to_thread(_open_session, flask_app, request.headers.get('cookie', ''))
+    return (data or {}).get('user_id')
+
+
+def _open_session(flask_app, cookie):
+    from flask import request
+    with flask_app.test_request_context(headers={'Cookie': cookie}):
+        return dict(flask_app.session_interface.open_session(flask_app, request) or {})
+
+
+async def _record_stream_play(request, song_id, start, stop=None):
+    # Same rules as routes/stream.py
+    from routes import stream
+    if not stream.starts_play(request.method, request.headers, start, stop):
+        return
+    user_id = await session_user_id(request)
+    if user_id is None or not stream.should_record_play(user_id, song_id):
+        return
+    try:
+        await record_play(request.app.state.engine, user_id, song_id)
+    except history_buffer.HistoryBufferFull:
+        logger.warning("Dropped play of song %s by user %s: history buffer full", song_id, user_id)
+
+
+def _stat_file(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat if os.path.isfile(path) else None
+
+
+async def _file_chunks(path, start, stop):
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        offset = start
+        while offset < stop:
+            chunk = await asyncio.to_thread(
+                os.pread, f.fileno(), min(ASYNC_STREAM_BLOCK_SIZE, stop - offset), offset
+            )
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def stream_song(request):
+    from routes import stream
+    state = request.app.state
+    song_id = request.path_params['song_id']
+    song = (await get_songs(state.engine, [song_id])).get(song_id)
+    if song is None:
+        return Response(status_code=404)
+    if song['file_path'].startswith(('http://', 'https://')):
+        return RedirectResponse(song['file_path'], status_code=302)
+
+    path, relative = stream.resolve_audio_path(state.flask_app, song['file_path'])
+    stat = await asyncio.to_thread(_stat_file, path) if path is not None else None
+    if stat is None:
+        return Response(status_code=404)
+    mimetype = mimetypes.guess_type(path)[0] or 'audio/mpeg'
+
+    if AUDIO_OFFLOAD:
+        byte_range = parse_range_header(request.headers.get('Range'))
+        await _record_stream_play(request, song_id, *(byte_range.ranges[0] if byte_range else (0, None)))
+        return Response(status_code=200, headers=stream.offload_headers(path, relative), media_type=mimetype)
+
+    size = stat.st_size
+    etag, last_modified = stream.file_validators(stat)
+    status, start, stop = stream.evaluate_request(request.headers, etag, last_modified, size)
+    headers = stream.response_headers(status, etag, last_modified, start, stop, size)
+    if status in (304, 416):
+        return Response(status_code=status, headers=headers)
+
+    headers['Content-Length'] = str(stop - start)
+    await _record_stream_play(request, song_id, start, stop)
+    if request.method == 'HEAD':
+        return Response(status_code=status, headers=headers, media_type=mimetype)
+    return StreamingResponse(_file_chunks(path, start, stop), status_code=status, headers=headers,
+                             media_type=mimetype)
+
+
+def _int_param(request, name):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return None
+
+
+async def search_songs(request):
+    import search
+    state = request.app.state
+    statement = search.search_statement(
+        request.query_params.get('q', ''), page=_int_param(request, 'page'),
+        per_page=_int_param(request, 'per_page'), backend=state.search_backend
+    )
+    if statement is None:
+        return JSONResponse([])
+    async with state.engine.connect() as connection:
+        song_ids = [row[0] for row in await connection.execute(*statement)]
+    songs = await get_songs(state.engine, song_ids)
+    return JSONResponse([songs[song_id] for song_id in song_ids if song_id in songs])
+
+
+def _detect_search_backend(flask_app):
+    import search
+    from app import db
+    with flask_app.app_context():
+        try:
+            return search._get_backend()
+        finally:
+            db.session.remove()
+
+
+def create_asgi_app(flask_app=None):
+    """Starlette app with the async handlers in front of the Flask app"""
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(asgi_app):
+        from app import start_background_services
+        state = asgi_app.state
+        state.engine = engine_profiles.create_async_engine(
+            flask_app.config['SQLALCHEMY_DATABASE_URI'], flask_app.config['DB_PROFILE']
+        )
+        state.search_backend = await asyncio.to_thread(_detect_search_backend, flask_app)
+        start_background_services(flask_app)
+        try:
+            yield
+        finally:
+            await state.engine.dispose()
+
+    asgi_app = Starlette(routes=[
+        Route('/stream/{song_id:int}', stream_song, methods=['GET', 'HEAD']),
+        Route(ASYNC_SEARCH_PATH, search_songs, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)),
+    ], lifespan=lifespan)
+    asgi_app.state.flask_app = flask_app
+    return asgi_app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `uvicorn asgi:app` builds the default application once, on first use
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_asgi_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
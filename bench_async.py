@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Hertz Sync vs Async Serving Benchmark
+
+Compares how many concurrent audio streams the synchronous WSGI server and
+the async server (asgi.py under uvicorn) can hold while staying responsive.
+Both servers run one process against the same temporary SQLite database
+and a large test file. At each concurrency level the benchmark:
+
+- opens that many GET /stream/<id> connections that read slowly, the way
+  a listener's player buffers ahead, and keeps them open for --duration
+  seconds;
+- meanwhile probes HEAD /stream/<id> on fresh connections every
+  --probe-interval seconds and records the probe latency.
+
+A stream counts as started when its response headers arrive within
+--timeout and before the level ends. The sync server is gunicorn with
+gthread workers when gunicorn is installed, otherwise the threaded
+development server.
+
+Usage:
+    python bench_async.py
+    python bench_async.py --concurrency 50 200 1000 --duration 10 --threads 32
+    python bench_async.py --servers async --json bench_results/async.json
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+AUDIO_URL = '/static/audio/bench.mp3'
+READ_SIZE = 16 * 1024
+
+
+def bench_config():
+    return {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.environ['BENCH_DB'],
+        'SESSION_BACKEND': 'cookie',
+        'SQL_METRICS_ENABLED': False,
+    }
+
+
+def bench_app():
+    """WSGI app serving the benchmark database and audio directory"""
+    from app import create_app
+    app = create_app(bench_config())
+    app.static_folder = os.environ['BENCH_STATIC']
+    return app
+
+
+def bench_asgi_app():
+    """ASGI app (asgi.py) in front of bench_app()"""
+    import asgi
+    return asgi.create_asgi_app(bench_app())
+
+
+def prepare(workdir, file_size):
+    """Create the database and a sparse audio file; returns the song id"""
+    from app import create_app, db, init_db
+    from models import Song
+    os.environ['BENCH_DB'] = os.path.join(workdir, 'bench.db')
+    os.environ['BENCH_STATIC'] = os.path.join(workdir, 'static')
+    os.makedirs(os.path.join(os.environ['BENCH_STATIC'], 'audio'))
+    with open(os.path.join(os.environ['BENCH_STATIC'], 'audio', 'bench.mp3'), 'wb') as f:
+        f.truncate(file_size)
+    app = create_app(bench_config())
+    with app.app_context():
+        init_db()
+        song = Song(title='Bench', artist='Bench', album='Bench', genre='Test', duration=600,
+                    file_path=AUDIO_URL)
+        db.session.add(song)
+        db.session.commit()
+        song_id = song.id
+        db.engine.dispose()
+    return song_id
+
+
+def server_command(kind, port, threads):
+    if kind == 'async':
+        return [sys.executable, '-m', 'uvicorn', '--factory', 'bench_async:bench_asgi_app',
+                '--port', str(port), '--log-level', 'warning', '--no-access-log',
+                '--limit-concurrency', '100000', '--backlog', '4096']
+    if importlib.util.find_spec('gunicorn') is not None:
+        return [sys.executable, '-m', 'gunicorn', 'bench_async:bench_app()', '--bind', f'127.0.0.1:{port}',
+                '--worker-class', 'gthread', '--workers', '1', '--threads', str(threads),
+                '--backlog', '4096', '--log-level', 'warning']
+    return [sys.executable, '-c', f"import bench_async; bench_async.bench_app().run(port={port}, threaded=True)"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+async def _connect(port):
+    sock = socket.socket()
+    # A small receive buffer keeps the server from pushing the whole file at once
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, READ_SIZE)
+    sock.setblocking(False)
+    try:
+        await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+    except OSError:
+        sock.close()
+        raise
+    return await asyncio.open_connection(sock=sock)
+
+
+async def _request(port, method, path, timeout):
+    """Send a request; returns (reader, writer, status) once the headers arrive"""
+    reader, writer = await asyncio.wait_for(_connect(port), timeout)
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n'.encode())
+    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    return reader, writer, int(head.split(b' ', 2)[1])
+
+
+async def slow_stream(port, path, until, timeout, read_interval):
+    """Hold a stream open until the deadline; returns True if it started before the deadline"""
+    writer = None
+    try:
+        # Headers that only arrive once other streams have closed don't count
+        reader, writer, status = await _request(port, 'GET', path, min(timeout, until - time.monotonic()))
+        if status != 200:
+            return False
+        while time.monotonic() < until:
+            if not await reader.read(READ_SIZE):
+                break
+            await asyncio.sleep(read_interval)
+        return True
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        return False
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def probe(port, path, timeout):
+    """Latency in ms of one HEAD request on a new connection, or None on failure"""
+    started = time.perf_counter()
+    writer = None
+    try:
+        _, writer, status = await _request(port, 'HEAD', path, timeout)
+        return (time.perf_counter() - started) * 1000 if status == 200 else None
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run_level(port, path, concurrency, duration, timeout, probe_interval, read_interval):
+    until = time.monotonic() + duration
+    streams = [asyncio.ensure_future(slow_stream(port, path, until, timeout, read_interval))
+               for _ in range(concurrency)]
+    # Let the streams connect before probing
+    await asyncio.sleep(min(1.0, duration / 4))
+    latencies = []
+    failures = 0
+    while time.monotonic() < until:
+        latency = await probe(port, path, timeout)
+        if latency is None:
+            failures += 1
+        else:
+            latencies.append(latency)
+        await asyncio.sleep(probe_interval)
+    started = sum(await asyncio.gather(*streams))
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'streams_started': started,
+        'probes': len(latencies) + failures,
+        'probe_failures': failures,
+        'probe_median_ms': statistics.median(latencies) if latencies else None,
+        'probe_p95_ms': latencies[max(int(len(latencies) * 0.95) - 1, 0)] if latencies else None,
+    }
+
+
+def run_server(kind, song_id, levels, args):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    server = subprocess.Popen(server_command(kind, port, args.threads), cwd=ROOT, env=env)
+    try:
+        wait_for_port(port)
+        results = []
+        for concurrency in levels:
+            result = asyncio.run(run_level(port, f'/stream/{song_id}', concurrency, args.duration,
+                                           args.timeout, args.probe_interval, args.read_interval))
+            results.append(result)
+            median = result['probe_median_ms']
+            print(f"{kind:<7}{concurrency:>8}{result['streams_started']:>10}"
+                  f"{result['probe_failures']:>8}/{result['probes']:<6}"
+                  f"{median if median is not None else float('nan'):>12.1f}"
+                  f"{result['probe_p95_ms'] if median is not None else float('nan'):>12.1f}", flush=True)
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare concurrent stream capacity of the sync and async servers")
+    parser.add_argument('--servers', nargs='+', choices=('sync', 'async'), default=['sync', 'async'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[10, 50, 200, 500])
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds each level holds its streams")
+    parser.add_argument('--threads', type=int, default=32, help="threads of the sync gthread worker")
+    parser.add_argument('--timeout', type=float, default=5.0, help="seconds to wait for response headers")
+    parser.add_argument('--probe-interval', type=float, default=0.1)
+    parser.add_argument('--read-interval', type=float, default=0.2, help="pause between a stream's reads")
+    parser.add_argument('--file-size', type=int, default=256 * 1024 * 1024, help="bytes in the test audio file")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='hertz-bench-async-')
+    try:
+        song_id = prepare(workdir, args.file_size)
+        print(f"{'server':<7}{'streams':>8}{'started':>10}{'probe fail':>14}{'median ms':>12}{'p95 ms':>12}")
+        results = {kind: run_server(kind, song_id, args.concurrency, args) for kind in args.servers}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Hertz Session Backend Benchmark
+
+Measures the per-request cost of each session backend (see sessions.py)
+with a minimal Flask app and the test client, against a baseline route
+that never touches the session. Three request kinds are timed for every
+backend:
+
+- read:   reads the session (logged-in page view; no store write)
+- write:  modifies the session on every request
+- login:  starts a new session, stores it and clears the cookie jar
+
+The 'sql' backend uses a temporary SQLite database unless --database-uri
+is given.
+
+Usage:
+    python bench_sessions.py
+    python bench_sessions.py --requests 5000 --backends sql cookie
+    python bench_sessions.py --database-uri mysql+pymysql://user:pw@host/hertz
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from flask import Flask, session
+from flask_sqlalchemy import SQLAlchemy
+import sessions
+
+
+def build_app(backend, database_uri):
+    db = SQLAlchemy()
+    app = Flask(__name__)
+    app.secret_key = 'bench-secret'
+    app.config.update(
+        SESSION_BACKEND=backend,
+        SESSION_PERMANENT=True,
+        SESSION_FILE_DIR=tempfile.mkdtemp(prefix='hertz-sessions-'),
+        SQLALCHEMY_DATABASE_URI=database_uri,
+    )
+    db.init_app(app)
+    if backend == 'sql':
+        # A private table definition keeps the benchmark independent of models
+        table = db.Table(
+            'sessions',
+            db.Column('session_id', db.String(255), primary_key=True),
+            db.Column('data', db.LargeBinary, nullable=False),
+            db.Column('expires_at', db.DateTime, nullable=False, index=True),
+        )
+        with app.app_context():
+            db.create_all()
+        app.session_interface = sessions.SqlSessionInterface(app, db, table)
+    else:
+        sessions.init_app(app, db)
+
+    @app.route('/baseline')
+    def baseline():
+        return 'ok'
+
+    @app.route('/login')
+    def login():
+        session['user_id'] = 1
+        return 'ok'
+
+    @app.route('/read')
+    def read():
+        return str(session.get('user_id'))
+
+    @app.route('/write')
+    def write():
+        session['hits'] = session.get('hits', 0) + 1
+        return 'ok'
+
+    return app
+
+
+def time_requests(client, path, count, fresh=False):
+    """Return per-request latencies in microseconds"""
+    samples = []
+    cookie_name = client.application.config['SESSION_COOKIE_NAME']
+    for _ in range(count):
+        if fresh:
+            client.delete_cookie(cookie_name)
+        started = time.perf_counter()
+        client.get(path)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def run(backends, count, database_uri=None):
+    results = {}
+    tmpdir = tempfile.mkdtemp(prefix='hertz-bench-')
+    for backend in backends:
+        uri = database_uri or 'sqlite:///' + os.path.join(tmpdir, f'{backend}.db')
+        app = build_app(backend, uri)
+        client = app.test_client()
+        client.get('/login')
+        time_requests(client, '/read', min(count, 200))  # warm up
+
+        baseline = statistics.median(time_requests(client, '/baseline', count))
+        result = {'baseline_us': baseline}
+        for kind, path, fresh in (('read', '/read', False), ('write', '/write', False), ('login', '/login', True)):
+            samples = sorted(time_requests(client, path, count, fresh))
+            result[kind] = {
+                'median_us': statistics.median(samples),
+                'p95_us': samples[int(len(samples) * 0.95) - 1],
+                'overhead_us': statistics.median(samples) - baseline,
+            }
+        results[backend] = result
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-request session overhead across backends")
+    parser.add_argument('--requests', type=int, default=2000, help="requests per measurement")
+    parser.add_argument('--backends', nargs='+', default=list(sessions.BACKENDS), choices=sessions.BACKENDS)
+    parser.add_argument('--database-uri', help="database for the sql backend (default: temporary SQLite)")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.backends, args.requests, args.database_uri)
+    print(f"{'backend':<12}{'kind':<8}{'median us':>12}{'p95 us':>12}{'overhead us':>14}")
+    for backend, result in results.items():
+        for kind in ('read', 'write', 'login'):
+            r = result[kind]
+            print(f"{backend:<12}{kind:<8}{r['median_us']:>12.1f}{r['p95_us']:>12.1f}{r['overhead_us']:>14.1f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Hertz Data-Access Benchmark
+
+Times the data-access hot paths on synthetic SQLite datasets
+(generate_dataset.py) at one or more scales and writes the results as JSON,
+so runs from different commits can be compared:
+
+- Song.search, Song.get_all, Playlist.to_dict, History.get_by_user,
+  History.recently_played (cold and repeat views) and
+  Rating.get_average_for_song
+- export_mysql.py (SQLite to SQL script), parsing that script with
+  initialize_db.py's statement tokenizer, and ingest_catalog.py upserts
+
+Datasets are cached in --data-dir by scale and seed, so repeated runs skip
+generation. Each operation is repeated and reported as min / median / p95
+/ mean milliseconds.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --scales small medium large --output bench_results/run.json
+    python benchmark.py --compare bench_results/base.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from generate_dataset import SCALES, WORDS
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'hertz-bench')
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_results')
+# Slower than this ratio against --compare is reported as a regression
+REGRESSION_RATIO = 1.2
+INGEST_RECORDS = 10000
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def measure(fn, repeat, setup=None):
+    """Run fn repeat times; setup(i) runs untimed before each call and returns fn's args"""
+    samples = []
+    for i in range(repeat):
+        args = setup(i) if setup else ()
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'repeat': repeat,
+        'min_ms': samples[0],
+        'median_ms': statistics.median(samples),
+        'p95_ms': samples[max(int(len(samples) * 0.95) - 1, 0)],
+        'mean_ms': statistics.fmean(samples),
+    }
+
+
+def dataset(data_dir, scale, seed):
+    """Return (path, counts, generate seconds) of a cached or newly generated dataset"""
+    from app import create_app, db, init_db
+    import generate_dataset
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'hertz-{scale}-{seed}.db')
+    meta_path = path + '.json'
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return path, meta['counts'], meta['generate_seconds']
+    for stale in (path, meta_path):
+        if os.path.exists(stale):
+            os.remove(stale)
+    app = create_app(_app_config(path, 'bulk-load'))
+    started = time.perf_counter()
+    with app.app_context():
+        init_db()
+        counts = generate_dataset.generate(db, seed=seed, **SCALES[scale])
+        db.engine.dispose()
+    seconds = time.perf_counter() - started
+    with open(meta_path, 'w') as f:
+        json.dump({'counts': counts, 'generate_seconds': seconds}, f)
+    return path, counts, seconds
+
+
+def _app_config(path, profile='dev'):
+    return {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        'DB_PROFILE': profile,
+        'SESSION_BACKEND': 'memory',
+        'SQL_METRICS_ENABLED': False,
+    }
+
+
+def run_scale(path, counts, repeat, seed):
+    from app import create_app, db
+    from models import History, Playlist, Rating, Song
+    import export_mysql
+    import ingest_catalog
+    import initialize_db
+    import recent_plays
+    import song_cache
+
+    rng = random.Random(seed)
+    app = create_app(_app_config(path))
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='hertz-bench-')
+
+    def fresh(make_args):
+        # Each call starts from an empty identity map, song cache and recent plays
+        def setup(i):
+            db.session.expunge_all()
+            song_cache.songs.clear()
+            recent_plays.get_store().clear()
+            return make_args(i)
+        return setup
+
+    with app.app_context():
+        terms = [rng.choice(WORDS) for _ in range(repeat)]
+        results['song_search'] = measure(Song.search, repeat, fresh(lambda i: (terms[i],)))
+        results['song_get_all'] = measure(Song.get_all, max(repeat // 10, 3), fresh(lambda i: ()))
+
+        playlist_ids = [rng.randint(1, counts['playlists']) for _ in range(repeat)]
+        results['playlist_to_dict'] = measure(
+            lambda playlist_id: Playlist.get_by_id(playlist_id).to_dict(), repeat,
+            fresh(lambda i: (playlist_ids[i],))
+        )
+        user_ids = [rng.randint(1, counts['users']) for _ in range(repeat)]
+        results['history_get_by_user'] = measure(History.get_by_user, repeat, fresh(lambda i: (user_ids[i],)))
+        results['history_recently_played_cold'] = measure(
+            History.recently_played, repeat, fresh(lambda i: (user_ids[i],))
+        )
+        # Repeat views: every user's buffer and songs are cached
+        for user_id in user_ids:
+            History.recently_played(user_id)
+        results['history_recently_played_repeat'] = measure(
+            History.recently_played, repeat, lambda i: (user_ids[i],)
+        )
+        song_ids = [rng.randint(1, counts['songs']) for _ in range(repeat)]
+        results['rating_average_for_song'] = measure(
+            Rating.get_average_for_song, repeat, fresh(lambda i: (song_ids[i],))
+        )
+
+        # Export / import scripts
+        dump_path = os.path.join(workdir, 'dump.sql')
+
+        def export():
+            with open(dump_path, 'w', encoding='utf-8') as out:
+                export_mysql.export_data_to_mysql(out, path)
+        results['export_mysql'] = measure(export, 1)
+        results['export_mysql']['bytes'] = os.path.getsize(dump_path)
+
+        def parse_dump():
+            with open(dump_path, encoding='utf-8') as f:
+                return sum(1 for _ in initialize_db.iter_sql_statements(f))
+        results['import_parse'] = measure(parse_dump, 1)
+
+        # Re-ingesting existing songs exercises the upsert path without changing the data
+        feed_path = os.path.join(workdir, 'feed.jsonl')
+        with open(feed_path, 'w', encoding='utf-8') as f:
+            for song in Song.query.order_by(Song.id).limit(INGEST_RECORDS):
+                f.write(json.dumps({field: getattr(song, field) for field in Song.UPSERT_FIELDS}) + '\n')
+        db.session.remove()
+        results['ingest_catalog'] = measure(lambda: ingest_catalog.ingest([feed_path]), 1)
+        results['ingest_catalog']['records'] = min(INGEST_RECORDS, counts['songs'])
+        db.engine.dispose()
+    return results
+
+
+def compare(current, baseline_path):
+    """Print median changes against a previous result file; returns the regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nCompared with {baseline_path} ({baseline['meta']['commit']}):")
+    for scale, result in current['scales'].items():
+        previous = baseline['scales'].get(scale)
+        if previous is None:
+            continue
+        for operation, timing in result['operations'].items():
+            old = previous['operations'].get(operation)
+            if old is None or not old['median_ms']:
+                continue
+            ratio = timing['median_ms'] / old['median_ms']
+            flag = '  REGRESSION' if ratio >= REGRESSION_RATIO else ''
+            print(f"  {scale:<8}{operation:<26}{old['median_ms']:>10.2f} -> {timing['median_ms']:>10.2f} ms"
+                  f"  x{ratio:.2f}{flag}")
+            if flag:
+                regressions.append((scale, operation, ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Hertz data-access hot paths on synthetic data")
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=50, help="repetitions per query benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where generated datasets are cached")
+    parser.add_argument('--output', help="result file (default: bench_results/<commit>.json)")
+    parser.add_argument('--compare', help="previous result file to compare against")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    import sqlalchemy
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'scales': {},
+    }
+    for scale in args.scales:
+        path, counts, generate_seconds = dataset(args.data_dir, scale, args.seed)
+        print(f"[{scale}] {', '.join(f'{k}={v}' for k, v in counts.items())}", flush=True)
+        operations = run_scale(path, counts, args.repeat, args.seed)
+        report['scales'][scale] = {'counts': counts, 'generate_seconds': generate_seconds, 'operations': operations}
+        for operation, timing in operations.items():
+            print(f"  {operation:<26}median {timing['median_ms']:>10.2f} ms   p95 {timing['p95_ms']:>10.2f} ms",
+                  flush=True)
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        sys.exit(1 if compare(report, args.compare) else 0)
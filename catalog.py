@@ -0,0 +1,83 @@
+"""Catalog record validation and normalization.
+
+Shared by the Song model and the bulk ingestion script. This module must
+stay free of app/database imports, because ingestion worker processes
+import it to parse records.
+"""
+import hashlib
+import re
+import unicodedata
+
+# Column -> maximum length, matching the songs table
+TEXT_FIELDS = {
+    'title': 255,
+    'artist': 255,
+    'album': 255,
+    'genre': 100,
+    'file_path': 500,
+    'album_cover': 500,
+}
+REQUIRED_FIELDS = ('title', 'artist', 'file_path')
+SONG_FIELDS = ('title', 'artist', 'album', 'genre', 'duration', 'file_path', 'album_cover')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def normalize_text(value):
+    """NFC-normalize, trim and collapse whitespace; empty strings become None"""
+    if value is None:
+        return None
+    value = _WHITESPACE.sub(' ', unicodedata.normalize('NFC', str(value))).strip()
+    return value or None
+
+
+def parse_duration(value):
+    """Duration in seconds from an int, a numeric string or "[h:]m:ss" """
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise InvalidRecord(f"invalid duration: {value!r}")
+    if isinstance(value, (int, float)):
+        seconds = int(round(value))
+    else:
+        text = str(value).strip()
+        try:
+            if ':' in text:
+                seconds = 0
+                for part in text.split(':'):
+                    seconds = seconds * 60 + int(part)
+            else:
+                seconds = int(round(float(text)))
+        except ValueError:
+            raise InvalidRecord(f"invalid duration: {value!r}")
+    if seconds < 0:
+        raise InvalidRecord(f"invalid duration: {value!r}")
+    return seconds
+
+
+def catalog_key(artist, album, title):
+    """Natural key of a song: SHA-1 of its case-folded artist, album and title"""
+    parts = [(normalize_text(part) or '').casefold() for part in (artist, album, title)]
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def normalize_record(record):
+    """Return a songs row (dict with SONG_FIELDS and catalog_key) or raise InvalidRecord"""
+    if not isinstance(record, dict):
+        raise InvalidRecord("record is not an object")
+    row = {}
+    for field, max_length in TEXT_FIELDS.items():
+        value = normalize_text(record.get(field))
+        if value is not None and len(value) > max_length:
+            raise InvalidRecord(f"{field} longer than {max_length} characters")
+        row[field] = value
+    for field in REQUIRED_FIELDS:
+        if row[field] is None:
+            raise InvalidRecord(f"missing {field}")
+    row['duration'] = parse_duration(record.get('duration'))
+    row['catalog_key'] = catalog_key(row['artist'], row['album'], row['title'])
+    return row
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Hertz Columnar Catalog Snapshot
+
+An immutable, column-oriented copy of the songs table's browse metadata
+(id, duration, created_at, genre, artist, album) as NumPy arrays ordered by
+song id. Strings are dictionary-encoded: each column keeps a sorted list of
+its distinct values and an int32 code per song, so genre filters are
+integer comparisons and an artist or album prefix is a contiguous range of
+codes. query() filters and sorts with vectorized operations and returns
+song ids; browsing never touches the database, and Song.get_many() serves
+the page's payloads from song_cache.
+
+Each build is written to its own generation directory under
+CATALOG_SNAPSHOT_DIR as .npy files, and CURRENT names the newest one.
+Workers load it with np.load(mmap_mode='r'), so every process shares one
+read-only copy through the page cache (and forked workers share it
+copy-on-write).
+
+Refreshes are incremental: only songs added after the previous build's
+(created_at, id) watermark are read, through ix_songs_created_at_id. If the
+row count then disagrees with the table (songs deleted, or inserted with an
+older created_at), or CATALOG_SNAPSHOT_FULL_REBUILD_INTERVAL has passed, the
+snapshot is rebuilt from scratch. That full rebuild also picks up edits to
+existing songs.
+
+Usage:
+    python catalog_snapshot.py                 # incremental refresh
+    python catalog_snapshot.py --full
+    python catalog_snapshot.py --genre Pop --artist-prefix the --order-by duration
+"""
+
+import argparse
+import atexit
+import bisect
+import datetime
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from config import (CATALOG_SNAPSHOT_DIR, CATALOG_SNAPSHOT_REFRESH_INTERVAL,
+                    CATALOG_SNAPSHOT_FULL_REBUILD_INTERVAL, CATALOG_SNAPSHOT_KEEP)
+
+logger = logging.getLogger(__name__)
+
+STRING_COLUMNS = ('genre', 'artist', 'album')
+NUMERIC_COLUMNS = {'id': np.int64, 'duration': np.int32, 'created_at': np.int64}
+# Sort keys accepted by query(); string columns sort by their dictionary order
+ORDERINGS = ('id', 'created_at', 'duration') + STRING_COLUMNS
+# Code / value stored for a NULL; sorts before everything else
+MISSING = -1
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = 'build.lock'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# The snapshot loaded by this process, if any
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def _fold(value):
+    return value.casefold()
+
+
+def _sort_key(value):
+    return (_fold(value), value)
+
+
+def _micros(value):
+    return (value - _EPOCH) // datetime.timedelta(microseconds=1) if value is not None else MISSING
+
+
+def _from_micros(value):
+    return _EPOCH + datetime.timedelta(microseconds=int(value))
+
+
+class CatalogSnapshot:
+    """Immutable column arrays for every song, ordered by song id"""
+
+    def __init__(self, columns, dictionaries, meta):
+        self.columns = columns  # name -> ndarray; string columns hold codes
+        self.dictionaries = dictionaries  # string column -> sorted distinct values
+        self.meta = meta
+        self._folded = {column: [_fold(value) for value in values] for column, values in dictionaries.items()}
+        self._codes = {column: {value: code for code, value in enumerate(values)}
+                       for column, values in dictionaries.items()}
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    @property
+    def ids(self):
+        return self.columns['id']
+
+    def prefix_codes(self, column, prefix):
+        """(lo, hi) code range of the values in column starting with prefix, ignoring case"""
+        folded = self._folded[column]
+        prefix = _fold(prefix)
+        return bisect.bisect_left(folded, prefix), bisect.bisect_left(folded, prefix + '\U0010ffff')
+
+    def mask(self, genres=None, min_duration=None, max_duration=None, artist_prefix=None, album_prefix=None):
+        """Boolean mask over the snapshot rows matching every given filter"""
+        mask = np.ones(len(self), dtype=bool)
+        if genres is not None:
+            codes = [self._codes['genre'][genre] for genre in genres if genre in self._codes['genre']]
+            mask &= np.isin(self.columns['genre'], codes)
+        duration = self.columns['duration']
+        if min_duration is not None:
+            mask &= duration >= min_duration
+        if max_duration is not None:
+            mask &= (duration <= max_duration) & (duration != MISSING)
+        for column, prefix in (('artist', artist_prefix), ('album', album_prefix)):
+            if prefix:
+                lo, hi = self.prefix_codes(column, prefix)
+                codes = self.columns[column]
+                mask &= (codes >= lo) & (codes < hi)
+        return mask
+
+    def query(self, order_by='id', descending=False, offset=0, limit=None, **filters):
+        """Ids of the songs matching the filters (see mask()), sorted, one slice at a time.
+
+        Ties keep id order. Raises ValueError for an unknown order_by.
+        """
+        if order_by not in ORDERINGS:
+            raise ValueError(f"Unsupported catalog ordering: {order_by}")
+        positions = np.flatnonzero(self.mask(**filters)) if filters else np.arange(len(self))
+        if order_by != 'id':
+            keys = self.columns[order_by][positions].astype(np.int64)
+            positions = positions[np.argsort(-keys if descending else keys, kind='stable')]
+        elif descending:
+            positions = positions[::-1]
+        stop = None if limit is None else offset + limit
+        return self.ids[positions[offset:stop]].tolist()
+
+    def count(self, **filters):
+        return int(np.count_nonzero(self.mask(**filters))) if filters else len(self)
+
+    def stats(self):
+        return {
+            'songs': len(self),
+            'generation': self.meta.get('generation'),
+            'built_at': self.meta['built_at'],
+            'full_built_at': self.meta['full_built_at'],
+            'age_seconds': time.time() - self.meta['built_at'],
+            **{f'{column}_values': len(values) for column, values in self.dictionaries.items()},
+        }
+
+    def save(self, root):
+        """Write a new generation under root and make it CURRENT; returns its name"""
+        # Names sort in build order
+        now = time.time_ns()
+        generation = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now // 10 ** 9))}.{now % 10 ** 9:09d}-{os.getpid()}"
+        tmp_dir = os.path.join(root, generation + '.tmp')
+        os.makedirs(tmp_dir)
+        for name, values in self.columns.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(values))
+        with open(os.path.join(tmp_dir, 'dictionaries.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.dictionaries, f, ensure_ascii=False)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(dict(self.meta, generation=generation), f)
+        os.rename(tmp_dir, os.path.join(root, generation))
+        # The pointer moves last, so readers never see a half-written generation
+        pointer = os.path.join(root, CURRENT_FILE)
+        with open(pointer + '.tmp', 'w') as f:
+            f.write(generation)
+        os.replace(pointer + '.tmp', pointer)
+        return generation
+
+    @classmethod
+    def load(cls, root, mmap=True):
+        """The CURRENT generation under root, memory-mapped read-only; None if there is none"""
+        try:
+            with open(os.path.join(root, CURRENT_FILE)) as f:
+                directory = os.path.join(root, f.read().strip())
+        except FileNotFoundError:
+            return None
+        columns = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None)
+            for name in tuple(NUMERIC_COLUMNS) + STRING_COLUMNS
+        }
+        with open(os.path.join(directory, 'dictionaries.json'), encoding='utf-8') as f:
+            dictionaries = json.load(f)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(columns, dictionaries, meta)
+
+
+def _prune(root, keep, current):
+    generations = sorted(
+        name for name in os.listdir(root)
+        if os.path.isdir(os.path.join(root, name)) and name != current
+    )
+    # Processes that still map a removed generation keep reading it until they reload
+    for name in generations[:max(len(generations) - (keep - 1), 0)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _read_songs(db, watermark=None):
+    from sqlalchemy import and_, or_, select
+    from models import Song
+    table = Song.__table__
+    stmt = select(table.c.id, table.c.duration, table.c.created_at, *[table.c[column] for column in STRING_COLUMNS])
+    if watermark is not None:
+        created_at, song_id = _from_micros(watermark[0]), watermark[1]
+        stmt = stmt.where(or_(table.c.created_at > created_at,
+                              and_(table.c.created_at == created_at, table.c.id > song_id)))
+    return db.session.execute(stmt.order_by(table.c.created_at, table.c.id)).all()
+
+
+def _encode(values, dictionary):
+    index = {value: code for code, value in enumerate(dictionary)}
+    return np.fromiter((MISSING if value is None else index[value] for value in values),
+                       dtype=np.int32, count=len(values))
+
+
+def build(db, previous=None, full_rebuild_interval=CATALOG_SNAPSHOT_FULL_REBUILD_INTERVAL):
+    """Return a snapshot current with the songs table, reusing previous when possible.
+
+    Returns previous itself when no songs were added since it was built.
+    """
+    from sqlalchemy import func, select
+    from models import Song
+    now = time.time()
+    if previous is not None and now - previous.meta['full_built_at'] >= full_rebuild_interval:
+        previous = None
+    watermark = previous.meta['watermark'] if previous is not None else None
+    rows = _read_songs(db, watermark)
+    total = db.session.execute(select(func.count()).select_from(Song.__table__)).scalar()
+
+    if previous is not None and len(previous) + len(rows) != total:
+        logger.info("Catalog snapshot out of step with the songs table (%d + %d != %d); rebuilding",
+                    len(previous), len(rows), total)
+        return build(db, None, full_rebuild_interval)
+    if previous is not None and not rows:
+        return previous
+
+    with_dates = [row for row in rows if row.created_at is not None]
+    if with_dates:
+        last = with_dates[-1]
+        watermark = [_micros(last.created_at), last.id]
+
+    columns = {}
+    dictionaries = {}
+    for position, column in enumerate(STRING_COLUMNS, start=3):
+        new_values = [row[position] for row in rows]
+        old_dictionary = previous.dictionaries[column] if previous is not None else []
+        dictionary = sorted(set(old_dictionary).union(value for value in new_values if value is not None),
+                            key=_sort_key)
+        new_codes = _encode(new_values, dictionary)
+        if previous is not None:
+            # Old codes move to their value's position in the merged dictionary
+            remap = np.append(_encode(old_dictionary, dictionary), MISSING).astype(np.int32)
+            new_codes = np.concatenate([remap[previous.columns[column]], new_codes])
+        columns[column] = new_codes
+        dictionaries[column] = dictionary
+    for position, (column, dtype) in enumerate(NUMERIC_COLUMNS.items()):
+        values = (row[position] for row in rows)
+        if column == 'created_at':
+            values = (_micros(value) for value in values)
+        elif column == 'duration':
+            values = (MISSING if value is None else value for value in values)
+        array = np.fromiter(values, dtype=dtype, count=len(rows))
+        if previous is not None:
+            array = np.concatenate([previous.columns[column], array])
+        columns[column] = array
+
+    # Rows arrive in created_at order; the snapshot is ordered by id
+    order = np.argsort(columns['id'], kind='stable')
+    columns = {name: values[order] for name, values in columns.items()}
+    meta = {
+        'built_at': now,
+        'full_built_at': previous.meta['full_built_at'] if previous is not None else now,
+        'watermark': watermark,
+    }
+    return CatalogSnapshot(columns, dictionaries, meta)
+
+
+def refresh(db, root=None, full=False):
+    """Bring the published snapshot up to date, load it in this process and return it.
+
+    Builds are serialized across processes with a lock file, so concurrent
+    workers publish each change once and otherwise just load the result.
+    """
+    global _snapshot
+    root = root or CATALOG_SNAPSHOT_DIR
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        previous = None if full else CatalogSnapshot.load(root)
+        snapshot = build(db, previous)
+        if snapshot is not previous:
+            generation = snapshot.save(root)
+            _prune(root, CATALOG_SNAPSHOT_KEEP, generation)
+            logger.info("Published catalog snapshot %s (%d songs)", generation, len(snapshot))
+        db.session.remove()
+    loaded = CatalogSnapshot.load(root)
+    with _snapshot_lock:
+        _snapshot = loaded
+    return loaded
+
+
+def get_snapshot():
+    """The snapshot loaded by this process, or None before the first refresh"""
+    return _snapshot
+
+
+class SnapshotRefresher:
+    """Background thread that keeps this process's snapshot current"""
+
+    def __init__(self, app, db, interval=CATALOG_SNAPSHOT_REFRESH_INTERVAL):
+        self.app = app
+        self.db = db
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='catalog-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        # Refresh at once, so browsing is available soon after startup
+        while True:
+            try:
+                with self.app.app_context():
+                    refresh(self.db)
+            except Exception:
+                logger.exception("Catalog snapshot refresh failed")
+            if self._stop.wait(self.interval):
+                break
+
+
+_refresher = None
+
+
+def init_app(app):
+    """Load the published snapshot and start refreshing it if CATALOG_SNAPSHOT_ENABLED is set"""
+    global _snapshot, _refresher
+    from config import CATALOG_SNAPSHOT_ENABLED
+    from app import db
+    if not CATALOG_SNAPSHOT_ENABLED or _refresher is not None:
+        return _snapshot
+    if os.path.isdir(CATALOG_SNAPSHOT_DIR):
+        _snapshot = CatalogSnapshot.load(CATALOG_SNAPSHOT_DIR)
+    _refresher = SnapshotRefresher(app, db)
+    _refresher.start()
+    atexit.register(_refresher.stop)
+    return _snapshot
+
+
+if __name__ == "__main__":
+    from app import app, db
+
+    parser = argparse.ArgumentParser(description="Refresh and query the columnar catalog snapshot")
+    parser.add_argument('--full', action='store_true', help="rebuild from scratch")
+    parser.add_argument('--genre', action='append', dest='genres', help="may be repeated")
+    parser.add_argument('--min-duration', type=int)
+    parser.add_argument('--max-duration', type=int)
+    parser.add_argument('--artist-prefix')
+    parser.add_argument('--album-prefix')
+    parser.add_argument('--order-by', choices=ORDERINGS, default='id')
+    parser.add_argument('--descending', action='store_true')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        started = time.perf_counter()
+        snapshot = refresh(db, full=args.full)
+    print(f"Snapshot {snapshot.meta['generation']}: {len(snapshot)} songs, "
+          f"refreshed in {time.perf_counter() - started:.2f}s")
+    filters = {name: getattr(args, name) for name in
+               ('genres', 'min_duration', 'max_duration', 'artist_prefix', 'album_prefix')
+               if getattr(args, name) is not None}
+    started = time.perf_counter()
+    song_ids = snapshot.query(order_by=args.order_by, descending=args.descending, limit=args.limit, **filters)
+    print(f"{snapshot.count(**filters)} matching songs, queried in {(time.perf_counter() - started) * 1000:.2f}ms")
+    print(' '.join(str(song_id) for song_id in song_ids))
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Hertz Trending Charts
+
+Keeps time-decayed play counters per song for each chart window and serves
+global, per-genre and per-artist top-K charts from a precomputed snapshot.
+
+A play at time t contributes exp(-(now - t) / window) to a song's score, so
+recent plays dominate and old ones fade out without being stored. Counters
+are updated incrementally by tailing new rows of the history table (which
+also picks up plays written by other workers or the history buffer), and a
+background thread rebuilds the top-K snapshot every CHARTS_REFRESH_INTERVAL
+seconds. Requests only ever read the snapshot.
+
+The genre and artist of charted songs are cached. Songs edited through the
+ORM or re-ingested are dropped from that cache by models.py; everything is
+reloaded every CHARTS_SONG_META_TTL seconds to catch edits made elsewhere.
+
+Usage:
+    python charts.py                  # backfill from history and print charts
+    python charts.py --window 7d --genre Pop
+"""
+
+import argparse
+import atexit
+import collections
+import datetime
+import heapq
+import logging
+import math
+import threading
+import time
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Rebase counters once the scale factor grows past exp(REBASE_EXPONENT)
+REBASE_EXPONENT = 50.0
+# Scores below this are dropped when counters are rebased
+MIN_SCORE = 1e-4
+
+# The engine started by init_app, if any
+_engine = None
+
+
+class ChartEngine:
+    def __init__(self, windows, top_k=100, chunk_size=5000, id_overlap=1000, meta_ttl=600):
+        self.windows = dict(windows)
+        self.top_k = top_k
+        self.meta_ttl = meta_ttl
+        self.chunk_size = chunk_size
+        # History ids can become visible out of order when transactions
+        # commit late, so each refresh re-reads this many ids back
+        self.id_overlap = id_overlap
+
+        self._lock = threading.Lock()
+        self._reset()
+        self.snapshot = {'generated_at': None, 'charts': {}}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _reset(self):
+        # counters[window][song_id] = sum of exp((t - reference) / seconds)
+        self._counters = {name: collections.defaultdict(float) for name in self.windows}
+        self._reference = {name: None for name in self.windows}
+        self._last_id = 0
+        self._recent_ids = collections.deque()
+        self._recent_id_set = set()
+        # song_id -> (genre, artist)
+        self._song_meta = {}
+        self._song_meta_loaded = time.monotonic()
+
+    def _add_play(self, song_id, played_at):
+        timestamp = played_at.timestamp()
+        for name, seconds in self.windows.items():
+            reference = self._reference[name]
+            if reference is None:
+                reference = self._reference[name] = timestamp
+            exponent = (timestamp - reference) / seconds
+            if exponent > REBASE_EXPONENT:
+                self._rebase(name, timestamp)
+                exponent = 0.0
+            self._counters[name][song_id] += math.exp(exponent)
+
+    def _rebase(self, name, reference):
+        """Move a window's reference time forward, pruning faded counters"""
+        factor = math.exp((self._reference[name] - reference) / self.windows[name])
+        counters = collections.defaultdict(float)
+        for song_id, value in self._counters[name].items():
+            value *= factor
+            if value >= MIN_SCORE:
+                counters[song_id] = value
+        self._counters[name] = counters
+        self._reference[name] = reference
+
+    def _remember_id(self, history_id):
+        self._recent_ids.append(history_id)
+        self._recent_id_set.add(history_id)
+        while self._recent_ids and self._recent_ids[0] < self._last_id - self.id_overlap:
+            self._recent_id_set.discard(self._recent_ids.popleft())
+
+    def _ingest(self, query):
+        from models import History
+        ingested = 0
+        for history_id, song_id, played_at in query.order_by(History.id).yield_per(self.chunk_size):
+            if history_id in self._recent_id_set:
+                continue
+            if played_at is not None:
+                self._add_play(song_id, played_at)
+            self._last_id = max(self._last_id, history_id)
+            self._remember_id(history_id)
+            ingested += 1
+        return ingested
+
+    def invalidate_song_meta(self, song_ids=None):
+        """Reload the genre and artist of these songs (all songs when None) on the next refresh"""
+        if song_ids is None:
+            self._song_meta = {}
+            return
+        for song_id in song_ids:
+            self._song_meta.pop(song_id, None)
+
+    def _load_song_meta(self):
+        from models import Song
+        if time.monotonic() - self._song_meta_loaded >= self.meta_ttl:
+            self._song_meta = {}
+            self._song_meta_loaded = time.monotonic()
+        song_ids = set()
+        for counters in self._counters.values():
+            song_ids.update(counters)
+        missing = [song_id for song_id in song_ids if song_id not in self._song_meta]
+        for start in range(0, len(missing), self.chunk_size):
+            rows = db.session.query(Song.id, Song.genre, Song.artist).filter(
+                Song.id.in_(missing[start:start + self.chunk_size])
+            )
+            for song_id, genre, artist in rows:
+                self._song_meta[song_id] = (genre, artist)
+
+    def backfill(self, now=None):
+        """Rebuild all counters from the history table and recompute the charts"""
+        from models import History
+        now = now or datetime.datetime.utcnow()
+        # Plays older than ten of the longest window contribute under exp(-10)
+        since = now - datetime.timedelta(seconds=10 * max(self.windows.values()))
+        with self._lock:
+            self._reset()
+            query = db.session.query(History.id, History.song_id, History.played_at).filter(
+                History.played_at >= since
+            )
+            ingested = self._ingest(query)
+            # Older ids are still skipped by later refreshes
+            self._last_id = max(self._last_id, db.session.query(db.func.max(History.id)).scalar() or 0)
+            self._recompute(now)
+        logger.info("Backfilled trending charts from %d plays", ingested)
+        return ingested
+
+    def refresh(self, now=None):
+        """Ingest plays recorded since the last refresh and recompute the charts"""
+        from models import History
+        now = now or datetime.datetime.utcnow()
+        with self._lock:
+            query = db.session.query(History.id, History.song_id, History.played_at).filter(
+                History.id > self._last_id - self.id_overlap
+            )
+            ingested = self._ingest(query)
+            self._recompute(now)
+        return ingested
+
+    def _recompute(self, now):
+        self._load_song_meta()
+        # End the read transaction so the next refresh sees newly committed plays
+        db.session.rollback()
+        timestamp = now.timestamp()
+        charts = {}
+        for name, seconds in self.windows.items():
+            reference = self._reference[name]
+            if reference is None:
+                charts[name] = {'global': [], 'genre': {}, 'artist': {}}
+                continue
+            scale = math.exp((reference - timestamp) / seconds)
+            by_genre = collections.defaultdict(list)
+            by_artist = collections.defaultdict(list)
+            scored = []
+            for song_id, value in self._counters[name].items():
+                entry = (value * scale, song_id)
+                scored.append(entry)
+                genre, artist = self._song_meta.get(song_id, (None, None))
+                if genre:
+                    by_genre[genre].append(entry)
+                if artist:
+                    by_artist[artist].append(entry)
+            charts[name] = {
+                'global': self._top(scored),
+                'genre': {genre: self._top(entries) for genre, entries in by_genre.items()},
+                'artist': {artist: self._top(entries) for artist, entries in by_artist.items()}
+            }
+        # Swap in the new snapshot in one assignment so readers never see a partial one
+        self.snapshot = {'generated_at': now, 'charts': charts}
+
+    def _top(self, entries):
+        return [
+            {'song_id': song_id, 'score': round(score, 6)}
+            for score, song_id in heapq.nlargest(self.top_k, entries)
+        ]
+
+    def get_chart(self, window='24h', genre=None, artist=None, limit=None):
+        """Return [{'song_id', 'score'}] from the latest snapshot, hottest first"""
+        if window not in self.windows:
+            raise ValueError(f"Unknown chart window: {window}")
+        chart = self.snapshot['charts'].get(window)
+        if chart is None:
+            return []
+        if genre:
+            entries = chart['genre'].get(genre, [])
+        elif artist:
+            entries = chart['artist'].get(artist, [])
+        else:
+            entries = chart['global']
+        return entries[:limit] if limit else entries
+
+    def start(self, app, interval):
+        """Backfill, then refresh the snapshot every interval seconds in the background"""
+        def run():
+            with app.app_context():
+                try:
+                    self.backfill()
+                except Exception:
+                    logger.exception("Trending chart backfill failed")
+                while not self._stop.wait(interval):
+                    try:
+                        self.refresh()
+                    except Exception:
+                        db.session.rollback()
+                        logger.exception("Trending chart refresh failed")
+                db.session.remove()
+
+        self._thread = threading.Thread(target=run, name='trending-charts', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def get_engine():
+    """Return the running chart engine, or None when charts are disabled"""
+    return _engine
+
+
+def invalidate_song_meta(song_ids=None):
+    """Tell the running chart engine, if any, that songs changed genre or artist"""
+    if _engine is not None:
+        _engine.invalidate_song_meta(song_ids)
+
+
+def create_engine():
+    from config import CHARTS_WINDOWS, CHARTS_TOP_K, CHARTS_SONG_META_TTL
+    return ChartEngine(CHARTS_WINDOWS, top_k=CHARTS_TOP_K, meta_ttl=CHARTS_SONG_META_TTL)
+
+
+def init_app(app):
+    """Start the background chart engine if CHARTS_ENABLED is set"""
+    global _engine
+    from config import CHARTS_ENABLED, CHARTS_REFRESH_INTERVAL
+    if not CHARTS_ENABLED or _engine is not None:
+        return _engine
+    _engine = create_engine()
+    _engine.start(app, CHARTS_REFRESH_INTERVAL)
+    atexit.register(_engine.stop)
+    return _engine
+
+
+if __name__ == "__main__":
+    from app import app
+    from models import Song
+
+    parser = argparse.ArgumentParser(description="Rebuild trending charts from play history")
+    parser.add_argument('--window', default='24h')
+    parser.add_argument('--genre')
+    parser.add_argument('--artist')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        engine = create_engine()
+        started = time.perf_counter()
+        plays = engine.backfill()
+        print(f"Backfilled {plays} plays in {time.perf_counter() - started:.2f}s")
+        for position, entry in enumerate(engine.get_chart(args.window, args.genre, args.artist, args.limit), start=1):
+            song = db.session.get(Song, entry['song_id'])
+            title = f"{song.title} - {song.artist}" if song else f"song {entry['song_id']}"
+            print(f"{position:3d}. {title} ({entry['score']:.3f})")
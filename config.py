@@ -20,6 +20,221 @@ if not os.path.exists('/var/run/mysqld/mysqld.sock'):
     sqlite_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hertz.db')
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{sqlite_path}"
 
+# Database engine profiles (see engine_profiles.py); DB_PROFILE picks one
+DB_PROFILE = os.environ.get('DB_PROFILE', 'dev')
+DB_PROFILES = {
+    # Small pool, quick failure when it runs dry
+    'dev': {
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_timeout': 10,
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+        'query_cache_size': 500,
+        'sqlite_cached_statements': 128,
+        'sqlite_pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -16000,  # KiB
+            'mmap_size': 64 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+    },
+    # Size pool_size + max_overflow to threads per worker
+    'prod': {
+        'pool_size': 20,
+        'max_overflow': 10,
+        'pool_timeout': 5,
+        'pool_recycle': 1800,
+        'pool_pre_ping': True,
+        'query_cache_size': 2000,
+        'sqlite_cached_statements': 512,
+        'sqlite_pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -65536,
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+    },
+    # Few long-lived connections for ingestion and migration scripts
+    'bulk-load': {
+        'pool_size': 2,
+        'max_overflow': 0,
+        'pool_timeout': 60,
+        'pool_recycle': 3600,
+        'pool_pre_ping': False,
+        'query_cache_size': 500,
+        'sqlite_cached_statements': 256,
+        'sqlite_pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'OFF',
+            'busy_timeout': 30000,
+            'cache_size': -262144,
+            'mmap_size': 1024 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+# Pool checkouts that wait longer than this are logged
+DB_POOL_WAIT_WARN_MS = float(os.environ.get('DB_POOL_WAIT_WARN_MS', '100'))
+
+# Catalog search settings
+# Relative weight of each field when ranking full-text matches
+SEARCH_FIELD_WEIGHTS = {
+    "title": 10.0,
+    "artist": 5.0,
+    "album": 2.0
+}
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Catalog listing settings
+CATALOG_PAGE_SIZE = 50
+CATALOG_MAX_PAGE_SIZE = 500
+# Rows fetched per round trip when streaming the full catalog
+CATALOG_STREAM_CHUNK_SIZE = 1000
+
+# Rows per INSERT/DELETE statement for bulk playlist changes
+PLAYLIST_BATCH_SIZE = 500
+
+# Process-local cache of serialized songs
+SONG_CACHE_MAX_SIZE = int(os.environ.get('SONG_CACHE_MAX_SIZE', '50000'))
+SONG_CACHE_TTL = float(os.environ.get('SONG_CACHE_TTL', '300'))
+
+# Columnar catalog snapshot for browsing (catalog_snapshot.py)
+CATALOG_SNAPSHOT_ENABLED = os.environ.get('CATALOG_SNAPSHOT_ENABLED', '0') == '1'
+CATALOG_SNAPSHOT_DIR = os.environ.get(
+    'CATALOG_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog_snapshot')
+)
+CATALOG_SNAPSHOT_REFRESH_INTERVAL = float(os.environ.get('CATALOG_SNAPSHOT_REFRESH_INTERVAL', '60'))
+# Rebuild from scratch at least this often, to pick up edited songs
+CATALOG_SNAPSHOT_FULL_REBUILD_INTERVAL = float(os.environ.get('CATALOG_SNAPSHOT_FULL_REBUILD_INTERVAL', '3600'))
+CATALOG_SNAPSHOT_KEEP = 2  # generations kept on disk
+
+# Write-behind play history buffering
+HISTORY_BUFFER_ENABLED = os.environ.get('HISTORY_BUFFER_ENABLED', '0') == '1'
+HISTORY_BUFFER_MAX_SIZE = int(os.environ.get('HISTORY_BUFFER_MAX_SIZE', '10000'))
+HISTORY_BUFFER_BATCH_SIZE = int(os.environ.get('HISTORY_BUFFER_BATCH_SIZE', '500'))
+HISTORY_BUFFER_FLUSH_INTERVAL = float(os.environ.get('HISTORY_BUFFER_FLUSH_INTERVAL', '1.0'))
+# Seconds a play request may wait for room before it is rejected
+HISTORY_BUFFER_PUT_TIMEOUT = float(os.environ.get('HISTORY_BUFFER_PUT_TIMEOUT', '0.5'))
+# Failed flushes of one batch before its events are dead-lettered
+HISTORY_BUFFER_MAX_RETRIES = int(os.environ.get('HISTORY_BUFFER_MAX_RETRIES', '30'))
+HISTORY_SPILL_DIR = os.environ.get(
+    'HISTORY_SPILL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history_spill')
+)
+
+# History retention (history_rollup.py)
+# Raw plays are kept this many days, then rolled up into daily counts;
+# keep it longer than the longest chart window
+HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', '90'))
+HISTORY_COMPACT_BATCH_SIZE = 5000  # history ids per transaction
+HISTORY_COMPACT_PAUSE = 0.05  # seconds between batches
+
+# Per-user recently played buffers (recent_plays.py)
+# 'memory' keeps them per process, 'redis' shares them between workers
+RECENT_PLAYS_BACKEND = os.environ.get('RECENT_PLAYS_BACKEND', 'memory')
+RECENT_PLAYS_REDIS_URL = os.environ.get('RECENT_PLAYS_REDIS_URL', 'redis://localhost:6379/0')
+RECENT_PLAYS_SIZE = 50  # plays kept per user
+RECENT_PLAYS_MAX_USERS = int(os.environ.get('RECENT_PLAYS_MAX_USERS', '100000'))
+# Seconds before a user's buffer is reloaded, picking up plays recorded elsewhere
+RECENT_PLAYS_TTL = float(os.environ.get('RECENT_PLAYS_TTL', '600'))
+
+# Trending charts
+CHARTS_ENABLED = os.environ.get('CHARTS_ENABLED', '0') == '1'
+# Chart name -> decay window in seconds
+CHARTS_WINDOWS = {
+    "1h": 3600,
+    "24h": 86400,
+    "7d": 7 * 86400
+}
+CHARTS_TOP_K = 100
+CHARTS_REFRESH_INTERVAL = float(os.environ.get('CHARTS_REFRESH_INTERVAL', '60'))
+# Seconds before cached song genres and artists are reloaded, for edits made by other processes
+CHARTS_SONG_META_TTL = 600
+
+# Audio streaming
+# '' to serve files from the app, or 'x-sendfile' / 'x-accel-redirect' to
+# let the front-end server send them
+AUDIO_OFFLOAD = os.environ.get('AUDIO_OFFLOAD', '')
+# nginx internal location that maps to the static folder
+AUDIO_ACCEL_PREFIX = os.environ.get('AUDIO_ACCEL_PREFIX', '/protected-static/')
+AUDIO_CACHE_MAX_AGE = 86400
+# Byte-0 requests for the same song within this many seconds count as one
+# play; players often open a stream twice in quick succession
+STREAM_PLAY_DEDUPE_SECONDS = 10
+# Byte-0 ranges of at most this many bytes are format probes (Safari first
+# asks for bytes=0-1), not plays
+STREAM_PROBE_MAX_BYTES = 1024
+
+# Album cover thumbnails
+THUMBNAIL_SIZES = (64, 128, 300)
+THUMBNAIL_FORMATS = ('webp', 'jpeg')
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_CACHE_DIR = os.environ.get(
+    'THUMBNAIL_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thumbnail_cache')
+)
+
+# Item-to-item recommendations
+RECOMMEND_NEIGHBORS = 50  # neighbours stored per song
+RECOMMEND_MIN_SCORE = 0.01
+RECOMMEND_BLOCK_SIZE = 2000  # songs per similarity block
+RECOMMEND_RATING_WEIGHT = 1.0
+RECOMMEND_SEED_LIMIT = 50  # recent plays and ratings used as seeds per user
+RECOMMEND_STATE_DIR = os.environ.get(
+    'RECOMMEND_STATE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recommend_state')
+)
+
+# Sessions
+# 'sql' (sessions table), 'cookie' (signed cookie, no server state),
+# 'memory' (per process, for tests) or 'filesystem'
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sql')
+# Unchanged sessions are re-stored only when less than this fraction of
+# their lifetime remains
+SESSION_REFRESH_THRESHOLD = 0.5
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', '300'))
+SESSION_SWEEP_BATCH_SIZE = 1000
+
+# Request and SQL instrumentation (sql_metrics.py)
+SQL_METRICS_ENABLED = os.environ.get('SQL_METRICS_ENABLED', '1') == '1'
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+SQL_SLOW_STATEMENTS_KEPT = 5  # slowest statements reported per slow request
+# A statement shape repeated this often in one request is reported as N+1
+SQL_N_PLUS_ONE_THRESHOLD = 10
+# /metrics access (routes/metrics.py); with neither set, every request is denied
+# Bearer token that grants access to /metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Clients allowed without the token (comma-separated CIDRs)
+METRICS_ALLOWED_NETWORKS = os.environ.get('METRICS_ALLOWED_NETWORKS', '')
+# Reverse proxies in front of the app whose X-Forwarded-For entries are trusted
+METRICS_PROXY_HOPS = int(os.environ.get('METRICS_PROXY_HOPS', '0'))
+
+# Password hashing (passwords.py)
+# werkzeug method and work factor; older hashes are upgraded on login
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_SALT_LENGTH = 16
+# Hashing processes per app process; 0 hashes on the request thread
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+# Queued plus running hashes before new ones are rejected
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '16'))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+
+# Async server (asgi.py)
+# Threads running the Flask app for paths without an async handler
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '10'))
+ASYNC_STREAM_BLOCK_SIZE = 64 * 1024
+
+# Startup
+# Log how long each create_app() phase takes
+STARTUP_TIMING = os.environ.get('STARTUP_TIMING', '0') == '1'
+
 # Sample Song Data - using royalty free music with local file paths
 # These are placeholder songs matching the requested titles, but with royalty-free audio
 SAMPLE_SONGS = [
@@ -25,8 +25,17 @@ def get_mysql_compatible_sql(table_name, operation):
   `duration` int DEFAULT NULL,
   `file_path` varchar(500) NOT NULL,
   `album_cover` varchar(500) DEFAULT NULL,
-  `created_at` datetime DEFAULT CURRENT_TIMESTAMP,
-  PRIMARY KEY (`id`)
+  `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `catalog_key` varchar(40) DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_songs_catalog_key` (`catalog_key`),
+  KEY `ix_songs_created_at_id` (`created_at`,`id`),
+  KEY `ix_songs_genre_id` (`genre`,`id`),
+  KEY `ix_songs_artist_id` (`artist`,`id`),
+  FULLTEXT KEY `ft_songs_search` (`title`,`artist`,`album`),
+  FULLTEXT KEY `ft_songs_title` (`title`),
+  FULLTEXT KEY `ft_songs_artist` (`artist`),
+  FULLTEXT KEY `ft_songs_album` (`album`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;""",
         
         "playlists": """CREATE TABLE `playlists` (
@@ -42,6 +51,7 @@ def get_mysql_compatible_sql(table_name, operation):
         "playlist_songs": """CREATE TABLE `playlist_songs` (
   `playlist_id` int NOT NULL,
   `song_id` int NOT NULL,
+  `position` int DEFAULT NULL,
   `added_at` datetime DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`playlist_id`,`song_id`),
   KEY `song_id` (`song_id`),
@@ -55,12 +65,23 @@ def get_mysql_compatible_sql(table_name, operation):
   `song_id` int NOT NULL,
   `played_at` datetime DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`),
-  KEY `user_id` (`user_id`),
-  KEY `song_id` (`song_id`),
+  KEY `ix_history_user_played_at` (`user_id`,`played_at`),
+  KEY `ix_history_song_id` (`song_id`),
   CONSTRAINT `history_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
   CONSTRAINT `history_ibfk_2` FOREIGN KEY (`song_id`) REFERENCES `songs` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;""",
         
+        "history_daily": """CREATE TABLE `history_daily` (
+  `user_id` int NOT NULL,
+  `song_id` int NOT NULL,
+  `day` date NOT NULL,
+  `plays` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`user_id`,`song_id`,`day`),
+  KEY `ix_history_daily_song_day` (`song_id`,`day`),
+  CONSTRAINT `history_daily_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `history_daily_ibfk_2` FOREIGN KEY (`song_id`) REFERENCES `songs` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;""",
+        
         "ratings": """CREATE TABLE `ratings` (
   `user_id` int NOT NULL,
   `song_id` int NOT NULL,
@@ -72,6 +93,30 @@ def get_mysql_compatible_sql(table_name, operation):
   CONSTRAINT `ratings_ibfk_2` FOREIGN KEY (`song_id`) REFERENCES `songs` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;""",
         
+        "song_rating_stats": """CREATE TABLE `song_rating_stats` (
+  `song_id` int NOT NULL,
+  `rating_sum` int NOT NULL DEFAULT '0',
+  `rating_count` int NOT NULL DEFAULT '0',
+  `stars_1` int NOT NULL DEFAULT '0',
+  `stars_2` int NOT NULL DEFAULT '0',
+  `stars_3` int NOT NULL DEFAULT '0',
+  `stars_4` int NOT NULL DEFAULT '0',
+  `stars_5` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`song_id`),
+  CONSTRAINT `song_rating_stats_ibfk_1` FOREIGN KEY (`song_id`) REFERENCES `songs` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;""",
+        
+        "song_neighbors": """CREATE TABLE `song_neighbors` (
+  `song_id` int NOT NULL,
+  `neighbor_id` int NOT NULL,
+  `score` double NOT NULL,
+  PRIMARY KEY (`song_id`,`neighbor_id`),
+  KEY `ix_song_neighbors_song_score` (`song_id`,`score`),
+  KEY `neighbor_id` (`neighbor_id`),
+  CONSTRAINT `song_neighbors_ibfk_1` FOREIGN KEY (`song_id`) REFERENCES `songs` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `song_neighbors_ibfk_2` FOREIGN KEY (`neighbor_id`) REFERENCES `songs` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;""",
+        
         "subscriptions": """CREATE TABLE `subscriptions` (
   `user_id` int NOT NULL,
   `level` varchar(50) NOT NULL,
@@ -79,6 +124,14 @@ def get_mysql_compatible_sql(table_name, operation):
   `end_date` datetime DEFAULT NULL,
   PRIMARY KEY (`user_id`),
   CONSTRAINT `subscriptions_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;""",
+        
+        "sessions": """CREATE TABLE `sessions` (
+  `session_id` varchar(255) NOT NULL,
+  `data` longblob NOT NULL,
+  `expires_at` datetime NOT NULL,
+  PRIMARY KEY (`session_id`),
+  KEY `ix_sessions_expires_at` (`expires_at`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;"""
     }
     
@@ -89,8 +142,12 @@ def get_mysql_compatible_sql(table_name, operation):
         "playlists": "DROP TABLE IF EXISTS `playlists`;",
         "playlist_songs": "DROP TABLE IF EXISTS `playlist_songs`;",
         "history": "DROP TABLE IF EXISTS `history`;",
+        "history_daily": "DROP TABLE IF EXISTS `history_daily`;",
         "ratings": "DROP TABLE IF EXISTS `ratings`;",
-        "subscriptions": "DROP TABLE IF EXISTS `subscriptions`;"
+        "song_rating_stats": "DROP TABLE IF EXISTS `song_rating_stats`;",
+        "song_neighbors": "DROP TABLE IF EXISTS `song_neighbors`;",
+        "subscriptions": "DROP TABLE IF EXISTS `subscriptions`;",
+        "sessions": "DROP TABLE IF EXISTS `sessions`;"
     }
     
     # Return the appropriate SQL statement
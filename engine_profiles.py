@@ -0,0 +1,186 @@
+"""Database engine profiles and connection pool metrics.
+
+DB_PROFILES in config.py names a set of engine settings (pool sizing,
+compiled statement cache, SQLite pragmas); create_app() applies the one
+selected by DB_PROFILE. SQLite pragmas are set on every new connection
+through a connect event, so WAL mode and the cache settings hold for all
+pooled connections.
+
+Pooled engines use TimedQueuePool, which records how long each checkout
+waited for a free connection. pool_stats() reports those waits together
+with the pool's saturation (connections in use / pool_size + max_overflow):
+sustained saturation near 1 or growing waits mean workers have more
+threads than the pool has connections.
+
+create_async_engine() builds the async server's engine (asgi.py) from the
+same URI and profile, swapping in the aiosqlite / aiomysql driver.
+"""
+import logging
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from config import DB_PROFILE, DB_PROFILES, DB_POOL_WAIT_WARN_MS
+
+logger = logging.getLogger(__name__)
+
+# Async driver used for each backend by create_async_engine()
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'mysql': 'aiomysql'}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+
+    def record_wait(self, seconds, checked_out, capacity):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            slow = seconds * 1000 >= DB_POOL_WAIT_WARN_MS
+            if slow:
+                self.slow_checkouts += 1
+        if slow:
+            logger.warning("Waited %.0f ms for a database connection (%d/%d in use)",
+                           seconds * 1000, checked_out, capacity)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'wait_seconds_total': self.wait_total,
+                'wait_seconds_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_seconds_max': self.wait_max,
+                'slow_checkouts': self.slow_checkouts,
+                'timeouts': self.timeouts,
+                'peak_checked_out': self.peak_checked_out,
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        self.capacity = pool_size + max(max_overflow, 0)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - started, self.checkedout(), self.capacity)
+        return connection
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool, TimedQueuePool):
+    """TimedQueuePool with the asyncio-compatible queue, for async engines"""
+
+
+def get_profile(name):
+    try:
+        return DB_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown DB_PROFILE: {name!r} (expected one of {', '.join(DB_PROFILES)})")
+
+
+def engine_options(database_uri, profile=DB_PROFILE):
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URI under the named profile"""
+    settings = get_profile(profile)
+    url = make_url(database_uri)
+    options = {
+        'pool_pre_ping': settings['pool_pre_ping'],
+        'pool_recycle': settings['pool_recycle'],
+        'query_cache_size': settings['query_cache_size'],
+    }
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'cached_statements': settings['sqlite_cached_statements']}
+        if url.database in (None, '', ':memory:'):
+            # In-memory databases keep SQLAlchemy's single-connection pool
+            return options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=settings['pool_size'],
+        max_overflow=settings['max_overflow'],
+        pool_timeout=settings['pool_timeout'],
+    )
+    return options
+
+
+def async_database_uri(database_uri):
+    """The same database URI with the backend's async driver"""
+    url = make_url(database_uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for {backend!r} databases (supported: {', '.join(ASYNC_DRIVERS)})")
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def create_async_engine(database_uri, profile=DB_PROFILE):
+    """AsyncEngine for a database URI, sized and configured by the named profile"""
+    from sqlalchemy.ext.asyncio import create_async_engine as create_engine
+    options = engine_options(database_uri, profile)
+    if 'poolclass' in options:
+        options['poolclass'] = TimedAsyncQueuePool
+    engine = create_engine(async_database_uri(database_uri), **options)
+    pragmas = get_profile(profile)['sqlite_pragmas']
+    if engine.dialect.name == 'sqlite' and pragmas:
+        # Connect events fire on the synchronous engine the AsyncEngine wraps
+        event.listen(engine.sync_engine, 'connect', _sqlite_pragma_listener(pragmas))
+    return engine
+
+
+def _sqlite_pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+def init_app(app, db):
+    """Register the profile's connect-time settings on the app's engine"""
+    settings = get_profile(app.config.setdefault('DB_PROFILE', DB_PROFILE))
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite' and settings['sqlite_pragmas']:
+        event.listen(engine, 'connect', _sqlite_pragma_listener(settings['sqlite_pragmas']))
+    return engine
+
+
+def pool_stats(engine):
+    """Pool sizing, current saturation and checkout wait metrics for an engine"""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        checked_out = pool.checkedout()
+        capacity = getattr(pool, 'capacity', None) or pool.size()
+        stats.update(
+            size=pool.size(),
+            checked_out=checked_out,
+            overflow=max(pool.overflow(), 0),
+            capacity=capacity,
+            saturation=checked_out / capacity if capacity else 0.0,
+        )
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        stats.update(metrics.snapshot())
+    return stats
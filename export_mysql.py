@@ -5,160 +5,223 @@ Hertz MySQL Export Utility
 This script will export data from the Hertz application to a MySQL database.
 It reads configuration from the .env file and generates SQL statements to populate a MySQL database.
 
+Rows are streamed from SQLite with fetchmany() and written as multi-row
+(extended) INSERT statements, so memory use does not grow with table size.
+Output ending in .gz is gzip-compressed. With --output-dir, each table is
+written to its own file, optionally by several worker processes.
+
 Usage:
     python export_mysql.py > hertz_data.sql
+    python export_mysql.py --output hertz_data.sql.gz --rows-per-insert 1000
+    python export_mysql.py --output-dir mysql_export --jobs 4
 """
 
+import argparse
+import datetime
+import decimal
+import gzip
+import io
+import math
 import os
+import sqlite3
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-import sqlite3
-from app import app, db
-import models
 
 # Load environment variables from .env file
 load_dotenv()
 
-def get_db_connection():
+# Tables in dependency order, so the dump loads with foreign key checks on
+EXPORT_TABLES = [
+    'users',
+    'songs',
+    'playlists',
+    'playlist_songs',
+    'ratings',
+    'song_rating_stats',
+    'song_neighbors',
+    'history',
+    'history_daily',
+    'subscriptions',
+]
+
+DEFAULT_ROWS_PER_INSERT = 500
+# Keep each statement well below MySQL's default max_allowed_packet
+DEFAULT_MAX_STATEMENT_BYTES = 1024 * 1024
+FETCH_SIZE = 5000
+
+# Characters that must be backslash-escaped inside a MySQL string literal
+_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    "'": "\\'",
+    '"': '\\"',
+    '\0': '\\0',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\x1a': '\\Z',
+})
+
+def get_db_connection(sqlite_path=None):
     """Get a connection to the SQLite database."""
-    sqlite_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hertz.db')
-    conn = sqlite3.connect(sqlite_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    sqlite_path = sqlite_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hertz.db')
+    if not os.path.exists(sqlite_path):
+        raise FileNotFoundError(f"SQLite database not found: {sqlite_path}")
+    return sqlite3.connect(sqlite_path)
+
+def sql_literal(value):
+    """Format a Python value as a MySQL literal."""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else 'NULL'
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        return f"X'{data.hex()}'" if data else "''"
+    if isinstance(value, datetime.datetime):
+        return "'" + value.isoformat(sep=' ') + "'"
+    if isinstance(value, datetime.date):
+        return "'" + value.isoformat() + "'"
+    return "'" + str(value).translate(_ESCAPES) + "'"
+
+def quote_identifier(name):
+    return '`' + name.replace('`', '``') + '`'
+
+def open_output(path):
+    """Open a text output file, gzip-compressed when the name ends in .gz."""
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'wb', compresslevel=6), encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+def existing_tables(conn):
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [table for table in EXPORT_TABLES if table in names]
 
-def export_data_to_mysql():
+def write_header(out, database):
+    out.write("-- Hertz MySQL Data Export\n")
+    out.write("-- Generated by export_mysql.py\n")
+    out.write("-- This script contains INSERT statements for the Hertz database\n\n")
+    out.write(f"USE {quote_identifier(database)};\n")
+    out.write("SET NAMES utf8mb4;\n")
+    out.write("SET @OLD_FOREIGN_KEY_CHECKS = @@FOREIGN_KEY_CHECKS, FOREIGN_KEY_CHECKS = 0;\n")
+    out.write("SET @OLD_UNIQUE_CHECKS = @@UNIQUE_CHECKS, UNIQUE_CHECKS = 0;\n\n")
+
+def write_footer(out):
+    out.write("SET FOREIGN_KEY_CHECKS = @OLD_FOREIGN_KEY_CHECKS;\n")
+    out.write("SET UNIQUE_CHECKS = @OLD_UNIQUE_CHECKS;\n")
+
+def export_table(conn, table, out, rows_per_insert=DEFAULT_ROWS_PER_INSERT,
+                 max_statement_bytes=DEFAULT_MAX_STATEMENT_BYTES):
+    """Stream one table as extended INSERT statements; returns the row count."""
+    cursor = conn.execute(f"SELECT * FROM {quote_identifier(table)}")
+    columns = [description[0] for description in cursor.description]
+    prefix = f"INSERT INTO {quote_identifier(table)} ({', '.join(quote_identifier(c) for c in columns)}) VALUES\n"
+
+    out.write(f"-- {table} data\n")
+    exported = 0
+    values = []
+    size = len(prefix)
+
+    def flush():
+        out.write(prefix)
+        out.write(',\n'.join(values))
+        out.write(';\n')
+
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            tuple_sql = '(' + ', '.join(sql_literal(value) for value in row) + ')'
+            if values and (len(values) >= rows_per_insert or size + len(tuple_sql) + 2 > max_statement_bytes):
+                flush()
+                values = []
+                size = len(prefix)
+            values.append(tuple_sql)
+            size += len(tuple_sql) + 2
+            exported += 1
+    if values:
+        flush()
+    out.write("\n")
+    return exported
+
+def export_data_to_mysql(out=None, sqlite_path=None, database=None, tables=None,
+                         rows_per_insert=DEFAULT_ROWS_PER_INSERT,
+                         max_statement_bytes=DEFAULT_MAX_STATEMENT_BYTES):
     """Export data from SQLite to MySQL-compatible SQL statements."""
-    conn = get_db_connection()
-    
-    # Print SQL statements header
-    print("-- Hertz MySQL Data Export")
-    print("-- Generated by export_mysql.py")
-    print("-- This script contains INSERT statements for the Hertz database")
-    print("\n")
-    print("USE hertz;\n")
-    
-    # Export users
-    print("-- Users data")
-    users = conn.execute('SELECT * FROM users').fetchall()
-    for user in users:
-        cols = ', '.join(user.keys())
-        placeholders = ', '.join(['%s'] * len(user))
-        sql = f"INSERT INTO users ({cols}) VALUES ("
-        values = []
-        for k in user.keys():
-            if user[k] is None:
-                values.append("NULL")
-            elif isinstance(user[k], (int, float)):
-                values.append(str(user[k]))
-            else:
-                values.append(f"'{user[k]}'")
-        sql += ', '.join(values) + ");"
-        print(sql)
-    print("\n")
-    
-    # Export songs
-    print("-- Songs data")
-    songs = conn.execute('SELECT * FROM songs').fetchall()
-    for song in songs:
-        cols = ', '.join(song.keys())
-        values = []
-        for k in song.keys():
-            if song[k] is None:
-                values.append("NULL")
-            elif isinstance(song[k], (int, float)):
-                values.append(str(song[k]))
-            else:
-                values.append(f"'{song[k].replace("'", "''")}'")
-        sql = f"INSERT INTO songs ({cols}) VALUES ({', '.join(values)});"
-        print(sql)
-    print("\n")
-    
-    # Export playlists
-    print("-- Playlists data")
-    playlists = conn.execute('SELECT * FROM playlists').fetchall()
-    for playlist in playlists:
-        cols = ', '.join(playlist.keys())
-        values = []
-        for k in playlist.keys():
-            if playlist[k] is None:
-                values.append("NULL")
-            elif isinstance(playlist[k], (int, float)):
-                values.append(str(playlist[k]))
-            else:
-                values.append(f"'{playlist[k]}'")
-        sql = f"INSERT INTO playlists ({cols}) VALUES ({', '.join(values)});"
-        print(sql)
-    print("\n")
-    
-    # Export playlist_songs
-    print("-- Playlist songs data")
-    playlist_songs = conn.execute('SELECT * FROM playlist_songs').fetchall()
-    for ps in playlist_songs:
-        cols = ', '.join(ps.keys())
-        values = []
-        for k in ps.keys():
-            if ps[k] is None:
-                values.append("NULL")
-            elif isinstance(ps[k], (int, float)):
-                values.append(str(ps[k]))
-            else:
-                values.append(f"'{ps[k]}'")
-        sql = f"INSERT INTO playlist_songs ({cols}) VALUES ({', '.join(values)});"
-        print(sql)
-    print("\n")
-    
-    # Export ratings
-    print("-- Ratings data")
-    ratings = conn.execute('SELECT * FROM ratings').fetchall()
-    for rating in ratings:
-        cols = ', '.join(rating.keys())
-        values = []
-        for k in rating.keys():
-            if rating[k] is None:
-                values.append("NULL")
-            elif isinstance(rating[k], (int, float)):
-                values.append(str(rating[k]))
-            else:
-                values.append(f"'{rating[k]}'")
-        sql = f"INSERT INTO ratings ({cols}) VALUES ({', '.join(values)});"
-        print(sql)
-    print("\n")
-    
-    # Export history
-    print("-- Play history data")
-    history = conn.execute('SELECT * FROM history').fetchall()
-    for h in history:
-        cols = ', '.join(h.keys())
-        values = []
-        for k in h.keys():
-            if h[k] is None:
-                values.append("NULL")
-            elif isinstance(h[k], (int, float)):
-                values.append(str(h[k]))
-            else:
-                values.append(f"'{h[k]}'")
-        sql = f"INSERT INTO history ({cols}) VALUES ({', '.join(values)});"
-        print(sql)
-    print("\n")
-    
-    # Export subscriptions
-    print("-- Subscriptions data")
-    subscriptions = conn.execute('SELECT * FROM subscriptions').fetchall()
-    for sub in subscriptions:
-        cols = ', '.join(sub.keys())
-        values = []
-        for k in sub.keys():
-            if sub[k] is None:
-                values.append("NULL")
-            elif isinstance(sub[k], (int, float)):
-                values.append(str(sub[k]))
-            else:
-                values.append(f"'{sub[k]}'")
-        sql = f"INSERT INTO subscriptions ({cols}) VALUES ({', '.join(values)});"
-        print(sql)
-    
-    conn.close()
+    from config import MYSQL_DB
+    out = out or sys.stdout
+    conn = get_db_connection(sqlite_path)
+    try:
+        write_header(out, database or MYSQL_DB)
+        counts = {}
+        for table in tables or existing_tables(conn):
+            counts[table] = export_table(conn, table, out, rows_per_insert, max_statement_bytes)
+        write_footer(out)
+        return counts
+    finally:
+        conn.close()
+
+def _export_table_file(args):
+    """Worker: export one table to its own file."""
+    sqlite_path, table, path, database, rows_per_insert, max_statement_bytes = args
+    started = time.perf_counter()
+    with open_output(path) as out:
+        counts = export_data_to_mysql(out, sqlite_path, database, [table], rows_per_insert, max_statement_bytes)
+    return table, counts[table], time.perf_counter() - started
+
+def export_tables_parallel(output_dir, sqlite_path=None, database=None, jobs=None, compress=True,
+                           rows_per_insert=DEFAULT_ROWS_PER_INSERT,
+                           max_statement_bytes=DEFAULT_MAX_STATEMENT_BYTES):
+    """Export each table to <output_dir>/<table>.sql[.gz] using a process pool."""
+    from config import MYSQL_DB
+    os.makedirs(output_dir, exist_ok=True)
+    conn = get_db_connection(sqlite_path)
+    try:
+        tables = existing_tables(conn)
+    finally:
+        conn.close()
+    extension = '.sql.gz' if compress else '.sql'
+    tasks = [
+        (sqlite_path, table, os.path.join(output_dir, table + extension),
+         database or MYSQL_DB, rows_per_insert, max_statement_bytes)
+        for table in tables
+    ]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_export_table_file, tasks))
 
 if __name__ == "__main__":
-    with app.app_context():
-        export_data_to_mysql()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Export the Hertz SQLite database as MySQL INSERT statements")
+    parser.add_argument('--sqlite-path', help="path to the SQLite database (default: hertz.db)")
+    parser.add_argument('--output', help="output file; .gz is compressed (default: stdout)")
+    parser.add_argument('--output-dir', help="write one file per table into this directory")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes for --output-dir")
+    parser.add_argument('--no-compress', action='store_true', help="write plain .sql files with --output-dir")
+    parser.add_argument('--rows-per-insert', type=int, default=DEFAULT_ROWS_PER_INSERT)
+    parser.add_argument('--max-statement-bytes', type=int, default=DEFAULT_MAX_STATEMENT_BYTES)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.output_dir:
+        results = export_tables_parallel(
+            args.output_dir, args.sqlite_path, jobs=args.jobs, compress=not args.no_compress,
+            rows_per_insert=args.rows_per_insert, max_statement_bytes=args.max_statement_bytes
+        )
+        for table, rows, seconds in results:
+            print(f"{table}: {rows} rows in {seconds:.2f}s", file=sys.stderr)
+    elif args.output:
+        with open_output(args.output) as out:
+            counts = export_data_to_mysql(out, args.sqlite_path, rows_per_insert=args.rows_per_insert,
+                                          max_statement_bytes=args.max_statement_bytes)
+        for table, rows in counts.items():
+            print(f"{table}: {rows} rows", file=sys.stderr)
+    else:
+        export_data_to_mysql(sqlite_path=args.sqlite_path, rows_per_insert=args.rows_per_insert,
+                             max_statement_bytes=args.max_statement_bytes)
+    print(f"Export finished in {time.perf_counter() - started:.2f}s", file=sys.stderr)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Hertz Synthetic Dataset Generator
+
+Fills a database with reproducible synthetic users, songs, playlists,
+ratings and listening history in the app's schema. The same --seed and
+sizes always produce the same rows. Song popularity follows a Zipf-like
+distribution, so ratings, plays and playlist entries concentrate on a few
+hits the way real traffic does.
+
+Rows are written with executemany batches through SQLAlchemy Core;
+rating aggregates are rebuilt at the end, since Core inserts bypass the
+ORM events that normally maintain them.
+
+Usage:
+    python generate_dataset.py --sqlite-path /tmp/hertz_bench.db --songs 100000 --users 10000
+    python generate_dataset.py --database-uri sqlite:///hertz.db --scale small
+"""
+
+import argparse
+import bisect
+import datetime
+import itertools
+import os
+import random
+import time
+
+SCALES = {
+    'small': {'users': 200, 'songs': 2000, 'playlists_per_user': 2, 'playlist_size': 20,
+              'ratings_per_user': 20, 'history_per_user': 100},
+    'medium': {'users': 2000, 'songs': 20000, 'playlists_per_user': 3, 'playlist_size': 30,
+               'ratings_per_user': 30, 'history_per_user': 200},
+    'large': {'users': 10000, 'songs': 100000, 'playlists_per_user': 3, 'playlist_size': 50,
+              'ratings_per_user': 50, 'history_per_user': 500},
+}
+BATCH_SIZE = 5000
+GENRES = ('Pop', 'Rock', 'Hip-Hop', 'Jazz', 'Classical', 'Electronic', 'Country', 'R&B', 'Indie', 'Bollywood')
+WORDS = (
+    'love', 'night', 'fire', 'dream', 'heart', 'light', 'river', 'summer', 'shadow', 'golden',
+    'blue', 'city', 'dance', 'wild', 'rain', 'ocean', 'star', 'echo', 'silver', 'midnight',
+    'home', 'road', 'storm', 'velvet', 'electric', 'paper', 'moon', 'sky', 'forever', 'broken',
+)
+# Synthetic users all share this password; hashing it once keeps generation fast
+PASSWORD = 'password'
+EPOCH = datetime.datetime(2024, 1, 1)
+
+
+def _title(rng, words):
+    return ' '.join(rng.choice(WORDS).capitalize() for _ in range(words))
+
+
+class Popularity:
+    """Sample song ids with probability proportional to 1 / rank ** exponent"""
+
+    def __init__(self, song_ids, rng, exponent=1.0):
+        self.song_ids = list(song_ids)
+        rng.shuffle(self.song_ids)
+        weights = [1.0 / (rank + 1) ** exponent for rank in range(len(self.song_ids))]
+        self.cumulative = list(itertools.accumulate(weights))
+        self.rng = rng
+
+    def sample(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.song_ids[bisect.bisect_left(self.cumulative, point)]
+
+    def sample_distinct(self, count):
+        count = min(count, len(self.song_ids))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.add(self.sample())
+        return list(chosen)
+
+
+def _insert(connection, table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        connection.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+def generate(db, users, songs, playlists_per_user, playlist_size, ratings_per_user,
+             history_per_user, seed=0):
+    """Insert a synthetic dataset into an empty database; returns row counts"""
+    from models import History, Playlist, PlaylistSong, Rating, Song, Subscription, User
+    import catalog
+    import passwords
+    import rating_stats
+
+    rng = random.Random(seed)
+    password_hash = passwords.hash_password(PASSWORD)
+    counts = {}
+    artists = [f'{_title(rng, 2)} {i}' for i in range(max(songs // 20, 1))]
+
+    with db.engine.begin() as connection:
+        user_rows = [{
+            'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+            'password_hash': password_hash, 'created_at': EPOCH + datetime.timedelta(minutes=i),
+        } for i in range(1, users + 1)]
+        _insert(connection, User.__table__, user_rows)
+        _insert(connection, Subscription.__table__, [
+            {'user_id': i, 'level': 'premium' if rng.random() < 0.2 else 'free', 'start_date': EPOCH}
+            for i in range(1, users + 1)
+        ])
+        counts['users'] = users
+
+        song_rows = []
+        for i in range(1, songs + 1):
+            artist = rng.choice(artists)
+            album = _title(rng, rng.randint(1, 2))
+            title = f'{_title(rng, rng.randint(1, 4))} {i}'
+            song_rows.append({
+                'id': i, 'title': title, 'artist': artist, 'album': album,
+                'genre': rng.choice(GENRES), 'duration': rng.randint(90, 420),
+                'file_path': f'/static/audio/synthetic/{i}.mp3', 'album_cover': None,
+                'created_at': EPOCH + datetime.timedelta(seconds=i * 37),
+                'catalog_key': catalog.catalog_key(artist, album, title),
+            })
+        _insert(connection, Song.__table__, song_rows)
+        counts['songs'] = songs
+        del song_rows
+
+        popularity = Popularity(range(1, songs + 1), rng)
+
+        playlist_rows = []
+        entry_rows = []
+        playlist_id = 0
+        for user_id in range(1, users + 1):
+            for n in range(playlists_per_user):
+                playlist_id += 1
+                playlist_rows.append({'id': playlist_id, 'name': f'{_title(rng, 2)} Mix', 'user_id': user_id,
+                                      'created_at': EPOCH})
+                for position, song_id in enumerate(popularity.sample_distinct(playlist_size), 1):
+                    entry_rows.append({'playlist_id': playlist_id, 'song_id': song_id,
+                                       'position': position, 'added_at': EPOCH})
+        _insert(connection, Playlist.__table__, playlist_rows)
+        _insert(connection, PlaylistSong.__table__, entry_rows)
+        counts['playlists'] = len(playlist_rows)
+        counts['playlist_songs'] = len(entry_rows)
+        del playlist_rows, entry_rows
+
+        rating_rows = []
+        for user_id in range(1, users + 1):
+            for song_id in popularity.sample_distinct(ratings_per_user):
+                rating_rows.append({'user_id': user_id, 'song_id': song_id,
+                                    'rating': rng.choices((1, 2, 3, 4, 5), (1, 1, 3, 5, 4))[0],
+                                    'created_at': EPOCH})
+        _insert(connection, Rating.__table__, rating_rows)
+        counts['ratings'] = len(rating_rows)
+        del rating_rows
+
+        history_count = 0
+        span = 90 * 86400
+        for first in range(1, users + 1, 100):
+            history_rows = []
+            for user_id in range(first, min(first + 100, users + 1)):
+                for _ in range(history_per_user):
+                    history_rows.append({
+                        'user_id': user_id, 'song_id': popularity.sample(),
+                        'played_at': EPOCH + datetime.timedelta(seconds=rng.randrange(span)),
+                    })
+            _insert(connection, History.__table__, history_rows)
+            history_count += len(history_rows)
+        counts['history'] = history_count
+
+    rating_stats.rebuild_rating_stats()
+    return counts
+
+
+if __name__ == "__main__":
+    from app import create_app, db, init_db
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic Hertz dataset")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--sqlite-path', help="SQLite file to create (must not exist)")
+    target.add_argument('--database-uri', help="SQLAlchemy URI of an empty database")
+    parser.add_argument('--scale', choices=SCALES, default='small', help="preset sizes, overridden by the options below")
+    for name in SCALES['small']:
+        parser.add_argument('--' + name.replace('_', '-'), type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.sqlite_path and os.path.exists(args.sqlite_path):
+        parser.error(f"{args.sqlite_path} already exists")
+    sizes = dict(SCALES[args.scale])
+    sizes.update({name: getattr(args, name) for name in sizes if getattr(args, name) is not None})
+    uri = args.database_uri or 'sqlite:///' + os.path.abspath(args.sqlite_path)
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'DB_PROFILE': 'bulk-load', 'SESSION_BACKEND': 'memory'})
+    started = time.perf_counter()
+    with app.app_context():
+        init_db()
+        counts = generate(db, seed=args.seed, **sizes)
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print(f"Generated in {time.perf_counter() - started:.1f}s")
@@ -7,6 +7,10 @@ CREATE DATABASE IF NOT EXISTS hertz;
 USE hertz;
 
 -- Drop tables if they exist (for clean installation)
+DROP TABLE IF EXISTS sessions;
+DROP TABLE IF EXISTS song_neighbors;
+DROP TABLE IF EXISTS song_rating_stats;
+DROP TABLE IF EXISTS history_daily;
 DROP TABLE IF EXISTS history;
 DROP TABLE IF EXISTS ratings;
 DROP TABLE IF EXISTS playlist_songs;
@@ -34,7 +38,18 @@ CREATE TABLE songs (
   duration INT, -- in seconds
   file_path VARCHAR(500) NOT NULL, -- Path to the MP3 file
   album_cover VARCHAR(500),
-  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  catalog_key VARCHAR(40), -- SHA-1 of artist + album + title, see catalog.py
+  UNIQUE KEY uq_songs_catalog_key (catalog_key),
+  -- Keyset pagination indexes for the catalog listing
+  KEY ix_songs_created_at_id (created_at, id),
+  KEY ix_songs_genre_id (genre, id),
+  KEY ix_songs_artist_id (artist, id),
+  -- Full-text indexes used by catalog search
+  FULLTEXT KEY ft_songs_search (title, artist, album),
+  FULLTEXT KEY ft_songs_title (title),
+  FULLTEXT KEY ft_songs_artist (artist),
+  FULLTEXT KEY ft_songs_album (album)
 );
 
 -- Playlists table
@@ -50,6 +65,7 @@ CREATE TABLE playlists (
 CREATE TABLE playlist_songs (
   playlist_id INT NOT NULL,
   song_id INT NOT NULL,
+  position INT, -- order within the playlist
   added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (playlist_id, song_id),
   FOREIGN KEY (playlist_id) REFERENCES playlists(id) ON DELETE CASCADE,
@@ -67,12 +83,50 @@ CREATE TABLE ratings (
   FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
 );
 
+-- Per-song rating aggregates, maintained by the application
+CREATE TABLE song_rating_stats (
+  song_id INT PRIMARY KEY,
+  rating_sum INT NOT NULL DEFAULT 0,
+  rating_count INT NOT NULL DEFAULT 0,
+  stars_1 INT NOT NULL DEFAULT 0,
+  stars_2 INT NOT NULL DEFAULT 0,
+  stars_3 INT NOT NULL DEFAULT 0,
+  stars_4 INT NOT NULL DEFAULT 0,
+  stars_5 INT NOT NULL DEFAULT 0,
+  FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
+);
+
+-- Precomputed song similarity, written by recommend.py
+CREATE TABLE song_neighbors (
+  song_id INT NOT NULL,
+  neighbor_id INT NOT NULL,
+  score DOUBLE NOT NULL, -- cosine similarity
+  PRIMARY KEY (song_id, neighbor_id),
+  KEY ix_song_neighbors_song_score (song_id, score),
+  FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE,
+  FOREIGN KEY (neighbor_id) REFERENCES songs(id) ON DELETE CASCADE
+);
+
 -- History table (play history)
 CREATE TABLE history (
   id INT AUTO_INCREMENT PRIMARY KEY,
   user_id INT NOT NULL,
   song_id INT NOT NULL,
   played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  KEY ix_history_user_played_at (user_id, played_at),
+  KEY ix_history_song_id (song_id),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+  FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
+);
+
+-- Daily play counts compacted from old history rows by history_rollup.py
+CREATE TABLE history_daily (
+  user_id INT NOT NULL,
+  song_id INT NOT NULL,
+  day DATE NOT NULL,
+  plays INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, song_id, day),
+  KEY ix_history_daily_song_day (song_id, day),
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
   FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
 );
@@ -86,14 +140,22 @@ CREATE TABLE subscriptions (
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
--- Insert sample songs data
-INSERT INTO songs (title, artist, album, genre, duration, file_path, album_cover) VALUES
-('Shape of You', 'Ed Sheeran', 'Divide', 'Pop', 234, '/static/audio/shape_of_you.mp3', '/static/images/covers/divide.jpg'),
-('Blinding Lights', 'The Weeknd', 'After Hours', 'Synthwave', 200, '/static/audio/blinding_lights.mp3', '/static/images/covers/after_hours.jpg'),
-('Believer', 'Imagine Dragons', 'Evolve', 'Rock', 204, '/static/audio/believer.mp3', '/static/images/covers/evolve.jpg'),
-('Tera Ban Jaunga', 'Akhil Sachdeva', 'Kabir Singh', 'Romantic', 254, '/static/audio/tera_ban_jaunga.mp3', '/static/images/covers/kabir_singh.jpg'),
-('Tum Hi Ho', 'Arijit Singh', 'Aashiqui 2', 'Romantic', 262, '/static/audio/tum_hi_ho.mp3', '/static/images/covers/aashiqui_2.jpg'),
-('Senorita', 'Shawn Mendes', 'Shawn Mendes', 'Latin Pop', 191, '/static/audio/senorita.mp3', '/static/images/covers/shawn_mendes.jpg');
+-- Server-side HTTP sessions (SESSION_BACKEND=sql)
+CREATE TABLE sessions (
+  session_id VARCHAR(255) PRIMARY KEY,
+  data LONGBLOB NOT NULL,
+  expires_at DATETIME NOT NULL,
+  KEY ix_sessions_expires_at (expires_at)
+);
+
+-- Insert sample songs data (catalog_key is catalog.catalog_key(artist, album, title))
+INSERT INTO songs (title, artist, album, genre, duration, file_path, album_cover, catalog_key) VALUES
+('Shape of You', 'Ed Sheeran', 'Divide', 'Pop', 234, '/static/audio/shape_of_you.mp3', '/static/images/covers/divide.jpg', '7d8ab46cdd58ee718c90ce2bd9d847b297cafc2d'),
+('Blinding Lights', 'The Weeknd', 'After Hours', 'Synthwave', 200, '/static/audio/blinding_lights.mp3', '/static/images/covers/after_hours.jpg', '0b33114e9d3f9e57ce28eb06656f0ff0a50eaead'),
+('Believer', 'Imagine Dragons', 'Evolve', 'Rock', 204, '/static/audio/believer.mp3', '/static/images/covers/evolve.jpg', '426fd22c7b1642dc1c828677aa35176e0a57a3a4'),
+('Tera Ban Jaunga', 'Akhil Sachdeva', 'Kabir Singh', 'Romantic', 254, '/static/audio/tera_ban_jaunga.mp3', '/static/images/covers/kabir_singh.jpg', '9db7d53318c1b3ee2f082002a30e7297835aa8f9'),
+('Tum Hi Ho', 'Arijit Singh', 'Aashiqui 2', 'Romantic', 262, '/static/audio/tum_hi_ho.mp3', '/static/images/covers/aashiqui_2.jpg', 'd6fa297a4cb654ba28e99681d80ee592818ae943'),
+('Senorita', 'Shawn Mendes', 'Shawn Mendes', 'Latin Pop', 191, '/static/audio/senorita.mp3', '/static/images/covers/shawn_mendes.jpg', '751f0e1a4563911b7b0f37546f6d3bd3bf86fdf1');
 
 -- Create a demo user (username: demo, password: password)
 INSERT INTO users (username, email, password_hash) VALUES
@@ -106,7 +168,7 @@ INSERT INTO subscriptions (user_id, level) VALUES (1, 'free');
 INSERT INTO playlists (name, user_id) VALUES ('My Favorites', 1);
 
 -- Add songs to the demo playlist
-INSERT INTO playlist_songs (playlist_id, song_id) VALUES 
-(1, 1), -- Shape of You
-(1, 3), -- Believer
-(1, 5); -- Tum Hi Ho
\ No newline at end of file
+INSERT INTO playlist_songs (playlist_id, song_id, position) VALUES 
+(1, 1, 1), -- Shape of You
+(1, 3, 2), -- Believer
+(1, 5, 3); -- Tum Hi Ho
\ No newline at end of file
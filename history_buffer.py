@@ -0,0 +1,373 @@
+"""Write-behind buffering for play history.
+
+Play events are appended to a local spill file and queued in memory, then a
+background thread writes them to the history table in multi-row INSERTs,
+committing once per flush. A flush happens when HISTORY_BUFFER_BATCH_SIZE
+events are waiting or HISTORY_BUFFER_FLUSH_INTERVAL seconds have passed.
+
+Each event is fsynced to the spill file before record() returns. The fsync
+runs outside the buffer lock and is shared: producers that wrote while a
+sync was in progress are all covered by the next one (group commit), so a
+slow disk neither blocks the flush thread nor costs one fsync per play. The
+spill file is rotated on every flush and deleted once that flush commits, so events
+that never reached the database are replayed on the next startup. Delivery
+is at-least-once: a crash between commit and deletion replays a batch that
+was already written.
+
+A batch that violates a constraint (say, a play of a song deleted since) is
+bisected until the offending rows are isolated; the rest is written and those
+rows go to the dead-letter file dead-letter-<pid>.log in the spill directory,
+in the spill line format. A batch failing for any other reason is retried
+every flush interval, up to max_retries attempts, then dead-lettered too.
+"""
+import atexit
+import datetime
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# The buffer started by init_app, if any
+_buffer = None
+
+
+class HistoryBufferFull(Exception):
+    """Raised when the buffer stays full for longer than the put timeout"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class HistoryBuffer:
+    def __init__(self, app, spill_dir, max_size=10000, batch_size=500,
+                 flush_interval=1.0, put_timeout=0.5, max_retries=30):
+        self.app = app
+        self.spill_dir = spill_dir
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+
+        self._cond = threading.Condition()
+        self._pending = []
+        # (rows, segments, attempts) of a failed flush, retried before new events
+        self._retry = None
+        # Batch being written by the flush thread
+        self._flushing = []
+        # Rotated spill segments whose events are not committed yet
+        self._unflushed_segments = []
+        self._segment_seq = 0
+        self._spill = None
+        self._spill_path = None
+        # Taken before _cond by whoever fsyncs or closes spill files
+        self._sync_lock = threading.Lock()
+        # Spill lines written, and how many of them are known to be on disk
+        self._written = 0
+        self._synced = 0
+        # Rotated segments kept open until their last writes are fsynced
+        self._rotated_files = []
+        self._thread = None
+        self._stopping = False
+
+        self.metrics = {
+            'enqueued': 0,
+            'rejected': 0,
+            'replayed': 0,
+            'flushed_rows': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'dead_lettered': 0,
+            'last_flush_rows': 0,
+            'last_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0,
+        }
+
+    def start(self):
+        """Replay leftover spill segments and start the flush thread"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._replay()
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name='history-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything still buffered and stop the flush thread"""
+        with self._cond:
+            if self._thread is None or self._stopping:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        self._sync()
+        with self._sync_lock, self._cond:
+            for spill in self._rotated_files:
+                spill.close()
+            self._rotated_files = []
+            if self._spill:
+                self._spill.close()
+                self._spill = None
+            # Nothing was written to the open segment since the final rotation
+            if self._spill_path and not self._depth() and os.path.getsize(self._spill_path) == 0:
+                os.remove(self._spill_path)
+
+    def record(self, user_id, song_id, played_at=None):
+        """Queue a play event, blocking briefly if the buffer is full"""
+        played_at = played_at or datetime.datetime.utcnow()
+        event = {'user_id': user_id, 'song_id': song_id, 'played_at': played_at}
+        deadline = time.monotonic() + self.put_timeout
+        with self._cond:
+            while self._depth() >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    self.metrics['rejected'] += 1
+                    raise HistoryBufferFull("Play history buffer is full")
+            self._spill.write(json.dumps({
+                'user_id': user_id,
+                'song_id': song_id,
+                'played_at': played_at.isoformat()
+            }) + '\n')
+            self._spill.flush()
+            self._written += 1
+            written = self._written
+            self._pending.append(event)
+            self.metrics['enqueued'] += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        self._sync(written)
+        return event
+
+    def _sync(self, upto=None):
+        """fsync the spill segments unless line number upto is already on disk"""
+        with self._sync_lock:
+            if upto is not None and self._synced >= upto:
+                return
+            with self._cond:
+                target = self._written
+                rotated = self._rotated_files
+                self._rotated_files = []
+                current = self._spill
+            try:
+                for spill in rotated + ([current] if current else []):
+                    os.fsync(spill.fileno())
+            finally:
+                for spill in rotated:
+                    spill.close()
+            self._synced = target
+
+    def stats(self):
+        """Return a snapshot of the flush metrics and current queue depth"""
+        with self._cond:
+            stats = dict(self.metrics)
+            stats['queue_depth'] = self._depth()
+        return stats
+
+    def pending_plays(self, user_id):
+        """(song_id, played_at) of a user's plays that may not be committed yet"""
+        with self._cond:
+            queued = self._pending + self._flushing + (self._retry[0] if self._retry else [])
+            return [(event['song_id'], event['played_at']) for event in queued if event['user_id'] == user_id]
+
+    def _depth(self):
+        return len(self._pending) + (len(self._retry[0]) if self._retry else 0)
+
+    def _segment_path(self, seq):
+        return os.path.join(self.spill_dir, f'history-{os.getpid()}-{seq}.log')
+
+    def _open_segment(self):
+        self._segment_seq += 1
+        self._spill_path = self._segment_path(self._segment_seq)
+        self._spill = open(self._spill_path, 'a', encoding='utf-8')
+
+    def _rotate_segment(self):
+        """Start a new spill segment; the old one is closed by the next _sync()"""
+        self._rotated_files.append(self._spill)
+        self._unflushed_segments.append(self._spill_path)
+        self._open_segment()
+
+    def _replay(self):
+        """Load events from segments left behind by processes that died"""
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, 'history-*'))):
+            # history-<pid>-<seq>.log, or .replay-<pid> once a worker claimed it
+            name = os.path.basename(path)
+            stem, _, owner = name.partition('.replay-')
+            try:
+                pid = int(owner) if owner else int(stem.split('-')[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            # Claim the segment so another worker does not replay it too
+            claimed = os.path.join(self.spill_dir, stem.replace('.log', '') + f'.replay-{os.getpid()}')
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        data = json.loads(line)
+                        self._pending.append({
+                            'user_id': data['user_id'],
+                            'song_id': data['song_id'],
+                            'played_at': datetime.datetime.fromisoformat(data['played_at'])
+                        })
+                    except (ValueError, KeyError):
+                        # Torn final line from a crash mid-write
+                        continue
+                    self.metrics['replayed'] += 1
+            self._unflushed_segments.append(claimed)
+        if self.metrics['replayed']:
+            logger.info("Replaying %d buffered play events", self.metrics['replayed'])
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self.batch_size,
+                    timeout=self.flush_interval
+                )
+                stopping = self._stopping
+                if self._retry is not None:
+                    batch, segments, attempts = self._retry
+                    self._retry = None
+                else:
+                    batch = self._pending
+                    self._pending = []
+                    if batch:
+                        self._rotate_segment()
+                    segments = self._unflushed_segments
+                    self._unflushed_segments = []
+                    attempts = 0
+                    # Producers blocked on a full buffer can continue
+                    self._cond.notify_all()
+                self._flushing = batch
+                rotated = bool(self._rotated_files)
+            if rotated:
+                self._sync()
+            flushed = self._flush(batch, segments, attempts) if batch else True
+            with self._cond:
+                self._flushing = []
+            if stopping:
+                with self._cond:
+                    if flushed and self._pending:
+                        # Events queued behind a retried batch
+                        continue
+                # Anything a failed final flush left behind stays in the
+                # spill segments and is replayed on the next startup
+                return
+
+    def _flush(self, batch, segments, attempts):
+        """Write a batch; returns False when it was kept for another attempt"""
+        from models import History
+        started = time.perf_counter()
+        # Stack of row lists still to write; a chunk leaves it once committed or split
+        chunks = [batch]
+        rejected = []
+        try:
+            with self.app.app_context():
+                while chunks:
+                    rows = chunks[-1]
+                    try:
+                        for start in range(0, len(rows), self.batch_size):
+                            db.session.execute(db.insert(History).values(rows[start:start + self.batch_size]))
+                        db.session.commit()
+                        chunks.pop()
+                    except IntegrityError:
+                        db.session.rollback()
+                        chunks.pop()
+                        if len(rows) == 1:
+                            rejected.extend(rows)
+                        else:
+                            half = len(rows) // 2
+                            chunks += [rows[half:], rows[:half]]
+        except Exception:
+            unwritten = [row for rows in reversed(chunks) for row in rows]
+            attempts += 1
+            with self._cond:
+                self.metrics['failed_flushes'] += 1
+            if attempts < self.max_retries:
+                logger.exception("Failed to flush %d play events (attempt %d), will retry",
+                                 len(unwritten), attempts)
+                self._dead_letter(rejected)
+                with self._cond:
+                    self._retry = (unwritten, segments, attempts)
+                if not self._stopping:
+                    time.sleep(self.flush_interval)
+                return False
+            logger.exception("Giving up on %d play events after %d attempts", len(unwritten), attempts)
+            rejected += unwritten
+        self._dead_letter(rejected)
+        written = len(batch) - len(rejected)
+        elapsed = time.perf_counter() - started
+        for path in segments:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._cond:
+            self.metrics['flushes'] += 1
+            self.metrics['flushed_rows'] += written
+            self.metrics['last_flush_rows'] = written
+            self.metrics['last_flush_seconds'] = elapsed
+            self.metrics['total_flush_seconds'] += elapsed
+        return True
+
+    def _dead_letter(self, rows):
+        """Append events that cannot be written to this process's dead-letter file"""
+        if not rows:
+            return
+        path = os.path.join(self.spill_dir, f'dead-letter-{os.getpid()}.log')
+        logger.error("Writing %d play events that could not be stored to %s", len(rows), path)
+        with open(path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps({
+                    'user_id': row['user_id'],
+                    'song_id': row['song_id'],
+                    'played_at': row['played_at'].isoformat()
+                }) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with self._cond:
+            self.metrics['dead_lettered'] += len(rows)
+
+
+def get_buffer():
+    """Return the running buffer, or None when play history is written inline"""
+    return _buffer
+
+
+def init_app(app):
+    """Start write-behind buffering if HISTORY_BUFFER_ENABLED is set"""
+    global _buffer
+    from config import (HISTORY_BUFFER_ENABLED, HISTORY_BUFFER_MAX_SIZE, HISTORY_BUFFER_BATCH_SIZE,
+                        HISTORY_BUFFER_FLUSH_INTERVAL, HISTORY_BUFFER_PUT_TIMEOUT, HISTORY_BUFFER_MAX_RETRIES,
+                        HISTORY_SPILL_DIR)
+    if not HISTORY_BUFFER_ENABLED or _buffer is not None:
+        return _buffer
+    _buffer = HistoryBuffer(
+        app,
+        HISTORY_SPILL_DIR,
+        max_size=HISTORY_BUFFER_MAX_SIZE,
+        batch_size=HISTORY_BUFFER_BATCH_SIZE,
+        flush_interval=HISTORY_BUFFER_FLUSH_INTERVAL,
+        put_timeout=HISTORY_BUFFER_PUT_TIMEOUT,
+        max_retries=HISTORY_BUFFER_MAX_RETRIES
+    )
+    _buffer.start()
+    atexit.register(_buffer.stop)
+    return _buffer
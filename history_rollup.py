@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Hertz History Rollup and Compaction
+
+Moves play history older than HISTORY_RETENTION_DAYS out of the history
+table into per-user, per-song daily counts in history_daily. Plays of
+recent days stay in history, where recently-played lists and trending
+charts read them. Play-count statistics (HistoryDaily.song_play_counts,
+HistoryDaily.user_top_songs, recommend.py --full) add the rollups to the
+remaining raw rows.
+
+Rows are compacted in primary-key ranges of HISTORY_COMPACT_BATCH_SIZE ids,
+oldest first. Each range is counted, added to history_daily and deleted in
+one short transaction, so a crash never double-counts a play and no lock
+is held for long. Every range up to the highest id is checked, since old
+plays can arrive late, behind recent ones (say, replayed from the history
+buffer's spill files); ranges holding only recent plays are read, not
+written.
+
+Usage:
+    python history_rollup.py                  # compact plays older than HISTORY_RETENTION_DAYS
+    python history_rollup.py --retention-days 30 --batch-size 2000
+    flask --app app compact-history
+"""
+
+import argparse
+import collections
+import datetime
+import logging
+import time
+from sqlalchemy import func, select
+from config import HISTORY_RETENTION_DAYS, HISTORY_COMPACT_BATCH_SIZE, HISTORY_COMPACT_PAUSE
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_schema(db):
+    """Create history_daily and the history indexes on databases that predate them"""
+    from models import History, HistoryDaily
+    HistoryDaily.__table__.create(db.engine, checkfirst=True)
+    for index in History.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+
+def compaction_cutoff(retention_days, now=None):
+    """Plays before this midnight are compacted; only whole days are rolled up"""
+    today = (now or datetime.datetime.utcnow()).date()
+    return datetime.datetime.combine(today - datetime.timedelta(days=retention_days), datetime.time.min)
+
+
+def _daily_counts(rows):
+    counts = collections.Counter((row.user_id, row.song_id, row.played_at.date()) for row in rows)
+    return [{'user_id': user_id, 'song_id': song_id, 'day': day, 'plays': plays}
+            for (user_id, song_id, day), plays in counts.items()]
+
+
+def compact_history(db, retention_days=HISTORY_RETENTION_DAYS, batch_size=HISTORY_COMPACT_BATCH_SIZE,
+                    pause=HISTORY_COMPACT_PAUSE, now=None):
+    """Roll up and delete old history rows; returns a stats dict"""
+    from models import History, HistoryDaily
+    table = History.__table__
+    cutoff = compaction_cutoff(retention_days, now)
+    stats = {'cutoff': cutoff.isoformat(), 'batches': 0, 'rows': 0, 'rollup_rows': 0}
+    with db.engine.connect() as connection:
+        lo, max_id = connection.execute(select(func.min(table.c.id), func.max(table.c.id))).one()
+    if lo is None:
+        return stats
+
+    while lo <= max_id:
+        hi = lo + batch_size
+        in_range = (table.c.id >= lo, table.c.id < hi)
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(table.c.user_id, table.c.song_id, table.c.played_at)
+                .where(*in_range, table.c.played_at < cutoff)
+            ).all()
+            if not rows:
+                lo = hi
+                continue
+            daily = _daily_counts(rows)
+            HistoryDaily.add_counts(connection, daily)
+            deleted = connection.execute(table.delete().where(*in_range, table.c.played_at < cutoff)).rowcount
+            if deleted != len(rows):
+                # Rolls the batch back; rows vanished underneath us (a user or song was deleted)
+                raise RuntimeError(f"History ids {lo}-{hi - 1} changed during compaction; run it again")
+        stats['batches'] += 1
+        stats['rows'] += len(rows)
+        stats['rollup_rows'] += len(daily)
+        lo = hi
+        if pause:
+            # Lets other writers in between batches
+            time.sleep(pause)
+    logger.info("Compacted %d history rows into %d daily counts in %d batches",
+                stats['rows'], stats['rollup_rows'], stats['batches'])
+    return stats
+
+
+if __name__ == "__main__":
+    from app import app, db
+
+    parser = argparse.ArgumentParser(description="Roll up and prune old play history")
+    parser.add_argument('--retention-days', type=int, default=HISTORY_RETENTION_DAYS,
+                        help="days of raw plays to keep")
+    parser.add_argument('--batch-size', type=int, default=HISTORY_COMPACT_BATCH_SIZE, help="history ids per transaction")
+    parser.add_argument('--pause', type=float, default=HISTORY_COMPACT_PAUSE, help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    with app.app_context():
+        ensure_schema(db)
+        started = time.perf_counter()
+        stats = compact_history(db, args.retention_days, args.batch_size, args.pause)
+    print(f"Compacted {stats['rows']} plays before {stats['cutoff']} into {stats['rollup_rows']} daily counts "
+          f"({stats['batches']} batches) in {time.perf_counter() - started:.2f}s")
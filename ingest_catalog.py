@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Hertz Catalog Ingestion
+
+Streams CSV or JSONL catalog feeds (optionally .gz) into the songs table.
+Each record is validated and normalized by catalog.normalize_record and
+upserted on its natural key (artist + album + title, stored as
+songs.catalog_key): new songs are inserted, known songs are updated in place.
+Rows are written in executemany batches, one transaction per batch.
+
+CSV feeds need a header row naming the song columns (title, artist, album,
+genre, duration, file_path, album_cover); JSONL feeds have one object per
+line with the same keys. With --workers, validation (and JSON decoding) runs
+in a process pool while the main process keeps writing batches.
+
+Usage:
+    python ingest_catalog.py feed.csv
+    python ingest_catalog.py feed.jsonl.gz --workers 4 --batch-size 10000
+    python ingest_catalog.py feed.csv --reject-file rejects.jsonl
+
+Before ingesting, ensure_schema() adds songs.catalog_key to databases that
+predate it and keys songs inserted without one (by hertz_schema.sql or
+before ingestion existed), so feeds update them instead of duplicating them.
+"""
+
+import argparse
+import collections
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from catalog import InvalidRecord, catalog_key, normalize_record
+
+DEFAULT_BATCH_SIZE = 5000
+PARSE_CHUNK_SIZE = 2000
+PROGRESS_INTERVAL = 5.0
+ERRORS_SHOWN = 20
+BACKFILL_BATCH_SIZE = 1000
+
+def feed_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    raise ValueError(f"Unsupported feed format: {path} (expected .csv or .jsonl)")
+
+def open_feed(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+def iter_chunks(path, chunk_size=PARSE_CHUNK_SIZE):
+    """Yield (format, [(line number, raw item)]) chunks of a feed.
+
+    CSV rows are split by the csv module here, since quoted fields may span
+    lines; JSONL lines are passed on undecoded.
+    """
+    fmt = feed_format(path)
+    with open_feed(path) as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            items = ((reader.line_num, row) for row in reader)
+        else:
+            items = ((number, line) for number, line in enumerate(f, 1) if line.strip())
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield fmt, chunk
+                chunk = []
+        if chunk:
+            yield fmt, chunk
+
+def parse_chunk(task):
+    """Validate one chunk; returns (rows, [(line number, error)])"""
+    fmt, items = task
+    rows = []
+    errors = []
+    for line_number, item in items:
+        try:
+            record = json.loads(item) if fmt == 'jsonl' else item
+            rows.append(normalize_record(record))
+        except (InvalidRecord, ValueError) as e:
+            errors.append((line_number, str(e)))
+    return rows, errors
+
+def parsed_chunks(tasks, workers):
+    """Parse chunks in order, keeping at most a few chunks per worker in flight"""
+    if workers <= 1:
+        for task in tasks:
+            yield parse_chunk(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.submit(parse_chunk, task))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _has_unique_index(engine, table, column):
+    from sqlalchemy import inspect
+    inspector = inspect(engine)
+    indexes = inspector.get_indexes(table) + inspector.get_unique_constraints(table)
+    return any(index['column_names'] == [column] and index.get('unique', True) for index in indexes)
+
+def ensure_schema(db, batch_size=BACKFILL_BATCH_SIZE):
+    """Add and backfill songs.catalog_key on older databases; returns the number of songs keyed.
+
+    When several existing songs share a natural key only the oldest gets it,
+    so the unique index can be built; the others keep a NULL key.
+    """
+    from sqlalchemy import bindparam, inspect, select
+    from models import Song
+    table = Song.__table__
+    if 'catalog_key' not in {column['name'] for column in inspect(db.engine).get_columns('songs')}:
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ALTER TABLE songs ADD COLUMN catalog_key VARCHAR(40)')
+
+    keyed = 0
+    last_id = 0
+    update = table.update().where(table.c.id == bindparam('song_id')).values(catalog_key=bindparam('key'))
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.artist, table.c.album, table.c.title)
+                .where(table.c.catalog_key.is_(None), table.c.id > last_id)
+                .order_by(table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            keys = {}
+            for row in rows:
+                keys.setdefault(catalog_key(row.artist, row.album, row.title), row.id)
+            taken = set(connection.execute(
+                select(table.c.catalog_key).where(table.c.catalog_key.in_(list(keys)))
+            ).scalars())
+            updates = [{'song_id': song_id, 'key': key} for key, song_id in keys.items() if key not in taken]
+            if updates:
+                connection.execute(update, updates)
+            keyed += len(updates)
+
+    if not _has_unique_index(db.engine, 'songs', 'catalog_key'):
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE UNIQUE INDEX uq_songs_catalog_key ON songs (catalog_key)')
+    return keyed
+
+def ingest(paths, batch_size=DEFAULT_BATCH_SIZE, workers=1, reject_file=None):
+    """Upsert every valid record of the given feeds; returns a stats dict"""
+    from app import db
+    from models import Song
+
+    stats = {'read': 0, 'upserted': 0, 'rejected': 0}
+    started = time.perf_counter()
+    last_report = started
+    batch = {}  # catalog_key -> row; a later record for the same song wins
+
+    def flush():
+        stats['upserted'] += Song.upsert_many(list(batch.values()))
+        db.session.commit()
+        batch.clear()
+
+    for path in paths:
+        tasks = iter_chunks(path)
+        for rows, errors in parsed_chunks(tasks, workers):
+            stats['read'] += len(rows) + len(errors)
+            stats['rejected'] += len(errors)
+            for line_number, error in errors:
+                if reject_file is not None:
+                    reject_file.write(json.dumps({'file': path, 'line': line_number, 'error': error}) + '\n')
+                elif stats['rejected'] <= ERRORS_SHOWN:
+                    print(f"{path}:{line_number}: {error}", file=sys.stderr)
+            for row in rows:
+                batch[row['catalog_key']] = row
+                if len(batch) >= batch_size:
+                    flush()
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"  {stats['read']} records read, {stats['upserted']} upserted, "
+                      f"{stats['rejected']} rejected ({stats['read'] / (now - started):.0f} rows/s)", flush=True)
+    if batch:
+        flush()
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_second'] = stats['read'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+if __name__ == "__main__":
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Ingest CSV/JSONL catalog feeds into the songs table")
+    parser.add_argument('paths', nargs='+', help="feed files (.csv, .jsonl, optionally .gz)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="rows per upsert transaction")
+    parser.add_argument('--workers', type=int, default=1, help="processes used to parse and validate records")
+    parser.add_argument('--reject-file', help="write rejected records here as JSON lines")
+    parser.add_argument('--db-profile', default='bulk-load', help="engine profile from config.DB_PROFILES")
+    args = parser.parse_args()
+    app = create_app({'DB_PROFILE': args.db_profile})
+
+    reject_file = open(args.reject_file, 'w', encoding='utf-8') if args.reject_file else None
+    try:
+        with app.app_context():
+            from app import db
+            keyed = ensure_schema(db)
+            if keyed:
+                print(f"Set catalog_key on {keyed} existing songs")
+            stats = ingest(args.paths, args.batch_size, args.workers, reject_file)
+    finally:
+        if reject_file is not None:
+            reject_file.close()
+
+    print(f"Read {stats['read']} records: {stats['upserted']} upserted, {stats['rejected']} rejected "
+          f"in {stats['seconds']:.1f}s ({stats['rows_per_second']:.0f} rows/s)")
+    sys.exit(1 if stats['rejected'] else 0)
@@ -1,9 +1,158 @@
-"""Initialize MySQL database for MTunes."""
+"""Initialize MySQL database for MTunes.
+
+The exported SQL script is streamed rather than read into memory: a small
+tokenizer splits it into statements while tracking quoted strings, comments
+and DELIMITER changes, so semicolons inside literals are left alone. Plain
+and gzip-compressed (.sql.gz) scripts are supported. Statements are committed
+in batches and progress is reported as the file is read.
+
+Usage:
+    python initialize_db.py
+    python initialize_db.py --file dump.sql.gz --commit-every 5000
+"""
+import argparse
+import gzip
+import io
 import os
+import re
+import time
 import mysql.connector
 from mysql.connector import Error
 
-def setup_mysql():
+DEFAULT_COMMIT_EVERY = 1000
+PROGRESS_INTERVAL = 5.0
+
+# Closing pattern for each literal or comment the tokenizer can be inside
+_CLOSERS = {
+    "'": re.compile(r"\\.|''|'", re.S),
+    '"': re.compile(r'\\.|""|"', re.S),
+    '`': re.compile(r'``|`'),
+    '/*': re.compile(r'\*/'),
+}
+
+def iter_sql_statements(lines, delimiter=';'):
+    """Yield the statements of an SQL script given as an iterable of lines.
+
+    Delimiters inside quotes, backticks and comments are ignored. Line
+    comments and plain block comments are dropped; MySQL conditional
+    comments (/*! ... */) are kept as part of the statement.
+    """
+    parts = []
+    started = False  # the current statement has non-whitespace text
+    quote = None
+    keep_comment = True
+    opener = re.compile(r"'|\"|`|--|#|/\*|" + re.escape(delimiter))
+
+    for line in lines:
+        if quote is None and not started and line.lstrip()[:10].upper() == 'DELIMITER ':
+            delimiter = line.split()[1]
+            opener = re.compile(r"'|\"|`|--|#|/\*|" + re.escape(delimiter))
+            continue
+
+        pos = 0
+        while pos < len(line):
+            if quote is not None:
+                # Look for the end of the current literal or comment
+                while True:
+                    match = _CLOSERS[quote].search(line, pos)
+                    if match is None:
+                        if keep_comment:
+                            parts.append(line[pos:])
+                        pos = len(line)
+                        break
+                    if keep_comment:
+                        parts.append(line[pos:match.end()])
+                    pos = match.end()
+                    if match.group() in ("'", '"', '`', '*/'):
+                        quote = None
+                        keep_comment = True
+                        break
+                continue
+
+            match = opener.search(line, pos)
+            if match is None:
+                parts.append(line[pos:])
+                started = started or bool(line[pos:].strip())
+                break
+            token = match.group()
+            text = line[pos:match.start()]
+            started = started or bool(text.strip())
+
+            if token == delimiter:
+                parts.append(text)
+                statement = ''.join(parts).strip()
+                if statement:
+                    yield statement
+                parts = []
+                started = False
+                pos = match.end()
+            elif token == '#' or (token == '--' and line[match.end():match.end() + 1] in ('', ' ', '\t', '\r', '\n')):
+                # Line comment: drop the rest of the line
+                parts.append(text + '\n')
+                break
+            elif token == '--':
+                parts.append(text + token)
+                started = True
+                pos = match.end()
+            elif token == '/*':
+                keep_comment = line[match.end():match.end() + 1] == '!'
+                parts.append(text + (token if keep_comment else ' '))
+                started = started or keep_comment
+                quote = token
+                pos = match.end()
+            else:
+                parts.append(text + token)
+                started = True
+                quote = token
+                pos = match.end()
+
+    statement = ''.join(parts).strip()
+    if statement:
+        yield statement
+
+def open_sql_script(path):
+    """Open an SQL script for streaming; returns (text stream, raw binary file).
+
+    The raw file's position is the number of (possibly compressed) bytes
+    read so far, which is what progress is measured against.
+    """
+    raw = open(path, 'rb')
+    stream = gzip.GzipFile(fileobj=raw) if path.endswith('.gz') else raw
+    return io.TextIOWrapper(stream, encoding='utf-8'), raw
+
+def load_sql_script(cursor, connection, path, commit_every=DEFAULT_COMMIT_EVERY):
+    """Execute every statement in path, committing every commit_every statements"""
+    total_bytes = os.path.getsize(path)
+    started = time.perf_counter()
+    last_report = started
+    executed = 0
+
+    text, raw = open_sql_script(path)
+    with text:
+        for statement in iter_sql_statements(text):
+            cursor.execute(statement)
+            if cursor.with_rows:
+                cursor.fetchall()
+            executed += 1
+            if executed % commit_every == 0:
+                connection.commit()
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                done = raw.tell()
+                elapsed = now - started
+                print(f"  {executed} statements, {done / 1048576:.1f}/{total_bytes / 1048576:.1f} MB "
+                      f"({100.0 * done / total_bytes if total_bytes else 100.0:.0f}%), "
+                      f"{done / 1048576 / elapsed:.1f} MB/s, {executed / elapsed:.0f} statements/s", flush=True)
+    connection.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"Executed {executed} statements in {elapsed:.1f}s "
+          f"({total_bytes / 1048576 / elapsed if elapsed else 0:.1f} MB/s)")
+    return executed
+
+def setup_mysql(sql_file=None, commit_every=DEFAULT_COMMIT_EVERY):
     """Set up MySQL database."""
     # Get MySQL connection parameters from environment variables
     mysql_user = os.environ.get('MYSQL_USER', 'root')
@@ -32,26 +181,18 @@ def setup_mysql():
             cursor.execute(f"USE {mysql_database}")
             
             # Import schema and data from previously exported SQL file
-            export_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mysql_export')
-            combined_sql_file = os.path.join(export_dir, 'mtunes_mysql_complete.sql')
+            if sql_file is None:
+                export_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mysql_export')
+                sql_file = os.path.join(export_dir, 'mtunes_mysql_complete.sql')
+                if not os.path.exists(sql_file) and os.path.exists(sql_file + '.gz'):
+                    sql_file += '.gz'
             
-            if os.path.exists(combined_sql_file):
-                print(f"Importing schema and data from {combined_sql_file}...")
-                
-                # Read the SQL file
-                with open(combined_sql_file, 'r') as f:
-                    sql_script = f.read()
-                
-                # Split script into individual statements and execute them
-                statements = sql_script.split(';')
-                for statement in statements:
-                    if statement.strip():
-                        cursor.execute(statement)
-                
-                connection.commit()
+            if os.path.exists(sql_file):
+                print(f"Importing schema and data from {sql_file}...")
+                load_sql_script(cursor, connection, sql_file, commit_every)
                 print("Schema and data imported successfully.")
             else:
-                print(f"SQL file not found: {combined_sql_file}")
+                print(f"SQL file not found: {sql_file}")
                 print("Please run mysql_export.py first to generate the SQL file.")
             
             # Close the connection
@@ -70,4 +211,8 @@ def setup_mysql():
             print("MySQL connection closed.")
 
 if __name__ == "__main__":
-    setup_mysql()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create the MySQL database and load the exported SQL script")
+    parser.add_argument('--file', help="SQL script to load, .sql or .sql.gz (default: mysql_export/mtunes_mysql_complete.sql)")
+    parser.add_argument('--commit-every', type=int, default=DEFAULT_COMMIT_EVERY, help="statements per transaction")
+    args = parser.parse_args()
+    setup_mysql(args.file, args.commit_every)
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Hertz SQLite to MySQL Migration
+
+Copies every table from the SQLite development database (hertz.db) straight
+into MySQL, without going through an intermediate SQL dump.
+
+- Rows are read from SQLite in rowid order and written in large batches with
+  executemany(), or with LOAD DATA LOCAL INFILE when --load-data is given.
+- Foreign key and unique checks are disabled for the session, and secondary
+  indexes are dropped before a table is loaded and rebuilt once at the end.
+- Progress is checkpointed to a JSON file after every committed batch, so an
+  interrupted run picks up where it stopped when started again. Batches are
+  written with IGNORE, which makes replaying the last uncheckpointed batch
+  harmless.
+- The run finishes by comparing row counts and an order-independent checksum
+  of every table on both sides.
+
+Create the MySQL tables first (mysql_init.py or hertz_schema.sql).
+
+Usage:
+    python migrate_mysql.py
+    python migrate_mysql.py --batch-size 50000 --load-data
+    python migrate_mysql.py --verify-only
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import pymysql
+from config import MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB, MYSQL_PORT
+from export_mysql import EXPORT_TABLES, get_db_connection, quote_identifier
+
+DEFAULT_BATCH_SIZE = 20000
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrate_checkpoint.json')
+CHECKSUM_MODULUS = 2 ** 64
+
+def connect_mysql(local_infile=False):
+    connection = pymysql.connect(
+        host=MYSQL_HOST,
+        port=int(MYSQL_PORT),
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD,
+        database=MYSQL_DB,
+        charset='utf8mb4',
+        autocommit=False,
+        local_infile=local_infile
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        cursor.execute("SET UNIQUE_CHECKS = 0")
+    return connection
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'tables': {}}
+
+def save_checkpoint(path, checkpoint):
+    # Write and rename, so a crash never leaves a half-written checkpoint
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+def sqlite_columns(conn, table):
+    """Return [(name, declared type)] for a SQLite table"""
+    return [(row[1], (row[2] or '').upper()) for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+
+def normalizer(declared_type):
+    """Return a function that maps a value to the form MySQL will store"""
+    if 'DATETIME' in declared_type or 'TIMESTAMP' in declared_type:
+        def datetime_value(value):
+            # MySQL DATETIME keeps whole seconds; truncate so both sides agree
+            if value is None:
+                return None
+            if isinstance(value, datetime.datetime):
+                return value.replace(microsecond=0)
+            return datetime.datetime.fromisoformat(str(value)).replace(microsecond=0)
+        return datetime_value
+    return lambda value: value
+
+def secondary_indexes(cursor, table):
+    """Return {name: ADD INDEX clause} for indexes that can be rebuilt after loading.
+
+    Indexes whose leading column carries a foreign key are kept, because
+    InnoDB refuses to drop an index a constraint depends on.
+    """
+    cursor.execute(
+        "SELECT column_name FROM information_schema.key_column_usage "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND referenced_table_name IS NOT NULL",
+        (table,)
+    )
+    fk_columns = {row[0] for row in cursor.fetchall()}
+    cursor.execute(
+        "SELECT index_name, non_unique, index_type, column_name, sub_part FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name <> 'PRIMARY' "
+        "ORDER BY index_name, seq_in_index",
+        (table,)
+    )
+    indexes = {}
+    for name, non_unique, index_type, column, sub_part in cursor.fetchall():
+        index = indexes.setdefault(name, {'unique': not non_unique, 'type': index_type, 'columns': []})
+        index['columns'].append(quote_identifier(column) + (f'({sub_part})' if sub_part else ''))
+    clauses = {}
+    for name, index in indexes.items():
+        if index['columns'][0].split('(')[0].strip('`') in fk_columns:
+            continue
+        kind = 'FULLTEXT INDEX' if index['type'] == 'FULLTEXT' else 'UNIQUE INDEX' if index['unique'] else 'INDEX'
+        clauses[name] = f"ADD {kind} {quote_identifier(name)} ({', '.join(index['columns'])})"
+    return clauses
+
+def _load_data_field(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (bytes, bytearray)):
+        value = bytes(value).decode('latin-1')
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0'))
+
+def write_batch_load_data(cursor, table, columns, rows):
+    """Load rows through a temporary tab-separated file"""
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', delete=False) as f:
+        for row in rows:
+            f.write('\t'.join(_load_data_field(value) for value in row) + '\n')
+        path = f.name
+    try:
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {quote_identifier(table)} "
+            "CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+            f"({', '.join(quote_identifier(c) for c in columns)})",
+            (path,)
+        )
+    finally:
+        os.unlink(path)
+
+def write_batch_executemany(cursor, table, columns, rows):
+    placeholders = ', '.join(['%s'] * len(columns))
+    cursor.executemany(
+        f"INSERT IGNORE INTO {quote_identifier(table)} ({', '.join(quote_identifier(c) for c in columns)}) "
+        f"VALUES ({placeholders})",
+        rows
+    )
+
+def migrate_table(sqlite_conn, mysql_conn, table, checkpoint, checkpoint_path,
+                  batch_size=DEFAULT_BATCH_SIZE, load_data=False, truncate=False):
+    state = checkpoint['tables'].setdefault(table, {'last_rowid': 0, 'rows': 0, 'done': False})
+    if state['done']:
+        print(f"{table}: already migrated ({state['rows']} rows)")
+        return state['rows']
+
+    columns = sqlite_columns(sqlite_conn, table)
+    names = [name for name, _ in columns]
+    normalizers = [normalizer(declared_type) for _, declared_type in columns]
+    write_batch = write_batch_load_data if load_data else write_batch_executemany
+
+    with mysql_conn.cursor() as cursor:
+        if 'dropped_indexes' not in state:
+            if truncate and state['last_rowid'] == 0:
+                cursor.execute(f"TRUNCATE TABLE {quote_identifier(table)}")
+            indexes = secondary_indexes(cursor, table)
+            # Recorded before dropping, so a resumed run can still rebuild them
+            state['dropped_indexes'] = indexes
+            save_checkpoint(checkpoint_path, checkpoint)
+            if indexes:
+                cursor.execute(
+                    f"ALTER TABLE {quote_identifier(table)} "
+                    + ', '.join(f"DROP INDEX {quote_identifier(name)}" for name in indexes)
+                )
+
+        started = time.perf_counter()
+        copied = 0
+        select = (
+            f"SELECT rowid, {', '.join(quote_identifier(name) for name in names)} "
+            f"FROM {quote_identifier(table)} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+        )
+        while True:
+            rows = sqlite_conn.execute(select, (state['last_rowid'], batch_size)).fetchall()
+            if not rows:
+                break
+            batch = [tuple(normalize(value) for normalize, value in zip(normalizers, row[1:])) for row in rows]
+            write_batch(cursor, table, names, batch)
+            mysql_conn.commit()
+            state['last_rowid'] = rows[-1][0]
+            state['rows'] += len(rows)
+            save_checkpoint(checkpoint_path, checkpoint)
+            copied += len(rows)
+            elapsed = time.perf_counter() - started
+            print(f"{table}: {state['rows']} rows ({copied / elapsed if elapsed else 0:.0f} rows/s)", flush=True)
+
+        if state['dropped_indexes']:
+            print(f"{table}: rebuilding {len(state['dropped_indexes'])} index(es)", flush=True)
+            cursor.execute(
+                f"ALTER TABLE {quote_identifier(table)} " + ', '.join(state['dropped_indexes'].values())
+            )
+        state['done'] = True
+        save_checkpoint(checkpoint_path, checkpoint)
+    return state['rows']
+
+def _row_digest(values):
+    text = '\x1f'.join('\\N' if value is None else str(value) for value in values)
+    return int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'big')
+
+def table_checksum_sqlite(conn, table):
+    columns = sqlite_columns(conn, table)
+    normalizers = [normalizer(declared_type) for _, declared_type in columns]
+    cursor = conn.execute(f"SELECT {', '.join(quote_identifier(name) for name, _ in columns)} FROM {quote_identifier(table)}")
+    count, checksum = 0, 0
+    while True:
+        rows = cursor.fetchmany(DEFAULT_BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            checksum = (checksum + _row_digest(n(v) for n, v in zip(normalizers, row))) % CHECKSUM_MODULUS
+            count += 1
+    return count, checksum
+
+def table_checksum_mysql(conn, table, names):
+    count, checksum = 0, 0
+    # Unbuffered cursor, so large tables are streamed rather than loaded
+    with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(f"SELECT {', '.join(quote_identifier(name) for name in names)} FROM {quote_identifier(table)}")
+        while True:
+            rows = cursor.fetchmany(DEFAULT_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                checksum = (checksum + _row_digest(row)) % CHECKSUM_MODULUS
+                count += 1
+    return count, checksum
+
+def verify(sqlite_conn, mysql_conn, tables):
+    """Compare row counts and checksums; returns True when every table matches"""
+    ok = True
+    for table in tables:
+        names = [name for name, _ in sqlite_columns(sqlite_conn, table)]
+        source = table_checksum_sqlite(sqlite_conn, table)
+        target = table_checksum_mysql(mysql_conn, table, names)
+        status = 'OK' if source == target else 'MISMATCH'
+        ok = ok and source == target
+        print(f"{table}: sqlite {source[0]} rows / {source[1]:016x}, "
+              f"mysql {target[0]} rows / {target[1]:016x} -> {status}")
+    return ok
+
+def migrate(sqlite_path=None, checkpoint_path=DEFAULT_CHECKPOINT, batch_size=DEFAULT_BATCH_SIZE,
+            load_data=False, truncate=False, verify_only=False):
+    sqlite_conn = get_db_connection(sqlite_path)
+    mysql_conn = connect_mysql(local_infile=load_data)
+    try:
+        names = {row[0] for row in sqlite_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        tables = [table for table in EXPORT_TABLES if table in names]
+        if not verify_only:
+            checkpoint = load_checkpoint(checkpoint_path)
+            started = time.perf_counter()
+            total = 0
+            for table in tables:
+                total += migrate_table(sqlite_conn, mysql_conn, table, checkpoint, checkpoint_path,
+                                       batch_size, load_data, truncate)
+            print(f"Migrated {total} rows in {time.perf_counter() - started:.1f}s")
+        return verify(sqlite_conn, mysql_conn, tables)
+    finally:
+        sqlite_conn.close()
+        mysql_conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate the Hertz SQLite database into MySQL")
+    parser.add_argument('--sqlite-path', help="path to the SQLite database (default: hertz.db)")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="progress file used to resume")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--load-data', action='store_true', help="load batches with LOAD DATA LOCAL INFILE")
+    parser.add_argument('--truncate', action='store_true', help="empty each MySQL table before a fresh load")
+    parser.add_argument('--verify-only', action='store_true', help="only compare row counts and checksums")
+    args = parser.parse_args()
+
+    try:
+        ok = migrate(args.sqlite_path, args.checkpoint, args.batch_size,
+                     args.load_data, args.truncate, args.verify_only)
+    except pymysql.MySQLError as e:
+        print(f"Error while migrating to MySQL: {e}")
+        sys.exit(2)
+    if ok and not args.verify_only and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    sys.exit(0 if ok else 1)
@@ -1,8 +1,21 @@
+import base64
 import datetime
+import json
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, joinedload, object_session, selectinload, undefer
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app import db
+import catalog
+import charts
+import history_buffer
+import passwords
+import recent_plays
+import search
+import song_cache
 from flask_sqlalchemy import SQLAlchemy
 
 class User(db.Model):
@@ -17,6 +30,7 @@ class User(db.Model):
     # Relationships
     playlists = db.relationship("Playlist", back_populates="user", cascade="all, delete-orphan")
     history_entries = db.relationship("History", back_populates="user", cascade="all, delete-orphan")
+    daily_plays = db.relationship("HistoryDaily", cascade="all, delete-orphan", passive_deletes=True)
     ratings = db.relationship("Rating", back_populates="user", cascade="all, delete-orphan")
     subscription = db.relationship("Subscription", back_populates="user", uselist=False, cascade="all, delete-orphan")
     
@@ -29,13 +43,68 @@ class User(db.Model):
         return cls.query.get(user_id)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        """Hash in the password pool; may raise passwords.HashPoolSaturated"""
+        self.password_hash = passwords.hash_password(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password, upgrading the stored hash if the work factor changed.
+        
+        May raise passwords.HashPoolSaturated. An upgraded hash is written
+        with its own UPDATE, leaving the caller's session untouched.
+        """
+        matches, new_hash = passwords.verify_and_update(self.password_hash, password)
+        if new_hash is not None and self.id is not None:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    db.update(User.__table__).where(User.__table__.c.id == self.id).values(password_hash=new_hash)
+                )
+            # Already stored, so the session has nothing to flush
+            set_committed_value(self, 'password_hash', new_hash)
+        return matches
+
+def _insert_ignore(model, dialect=None):
+    """INSERT that silently skips rows which would violate a unique key"""
+    dialect = dialect or db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        return mysql_insert(model).prefix_with('IGNORE')
+    if dialect == 'postgresql':
+        return postgresql_insert(model).on_conflict_do_nothing()
+    return sqlite_insert(model).on_conflict_do_nothing()
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _song_catalog_key(context):
+    params = context.get_current_parameters()
+    return catalog.catalog_key(params.get('artist'), params.get('album'), params.get('title'))
+
+def _encode_cursor(values):
+    """Encode keyset pagination values as an opaque URL-safe token"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor, types):
+    """Decode a cursor made by _encode_cursor, checking it holds one value of each type"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(values, list) or len(values) != len(types) or not all(
+        isinstance(value, kind) and not isinstance(value, bool) for value, kind in zip(values, types)
+    ):
+        raise ValueError("Invalid pagination cursor")
+    return values
 
 class Song(db.Model):
     __tablename__ = 'songs'
+    __table_args__ = (
+        # Keyset pagination indexes for the catalog listing
+        db.Index('ix_songs_created_at_id', 'created_at', 'id'),
+        db.Index('ix_songs_genre_id', 'genre', 'id'),
+        db.Index('ix_songs_artist_id', 'artist', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(255), nullable=False)
@@ -45,33 +114,226 @@ class Song(db.Model):
     duration = db.Column(db.Integer)  # in seconds
     file_path = db.Column(db.String(500), nullable=False)  # Path to the MP3 file
     album_cover = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    # Natural key (artist + album + title) used by catalog ingestion upserts
+    catalog_key = db.Column(db.String(40), unique=True, default=_song_catalog_key)
     
     # Relationships
     playlist_songs = db.relationship("PlaylistSong", back_populates="song", cascade="all, delete-orphan")
     history_entries = db.relationship("History", back_populates="song", cascade="all, delete-orphan")
+    daily_plays = db.relationship("HistoryDaily", cascade="all, delete-orphan", passive_deletes=True)
     ratings = db.relationship("Rating", back_populates="song", cascade="all, delete-orphan")
+    rating_stats = db.relationship("SongRatingStats", uselist=False, cascade="all, delete-orphan")
+    neighbors = db.relationship(
+        "SongNeighbor",
+        foreign_keys="SongNeighbor.song_id",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+    
+    # Columns serialized by to_dict, in order
+    DICT_FIELDS = ('id', 'title', 'artist', 'album', 'duration', 'file_path', 'album_cover')
+    
+    # Columns overwritten when an ingested record matches an existing song
+    UPSERT_FIELDS = ('title', 'artist', 'album', 'genre', 'duration', 'file_path', 'album_cover')
     
     @classmethod
     def get_all(cls):
         return cls.query.all()
     
+    @classmethod
+    def upsert_many(cls, rows):
+        """Insert or update songs keyed on catalog_key as one executemany batch.
+        
+        Rows are dicts as returned by catalog.normalize_record. The caller
+        commits. Bypasses the ORM, so the song cache and chart metadata are
+        cleared afterwards.
+        """
+        if not rows:
+            return 0
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'mysql':
+            stmt = mysql_insert(cls.__table__)
+            stmt = stmt.on_duplicate_key_update({field: stmt.inserted[field] for field in cls.UPSERT_FIELDS})
+        else:
+            stmt = (postgresql_insert if dialect == 'postgresql' else sqlite_insert)(cls.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['catalog_key'],
+                set_={field: stmt.excluded[field] for field in cls.UPSERT_FIELDS}
+            )
+        db.session.execute(stmt, rows)
+        song_cache.songs.clear()
+        charts.invalidate_song_meta()
+        return len(rows)
+    
+    @classmethod
+    def _catalog_query(cls, query, genre=None, artist=None):
+        if genre:
+            query = query.filter(cls.genre == genre)
+        if artist:
+            query = query.filter(cls.artist == artist)
+        return query
+    
+    @classmethod
+    def get_page(cls, cursor=None, limit=None, genre=None, artist=None, order_by='id'):
+        """Return (songs, next_cursor) for one keyset-paginated page of the catalog.
+        
+        order_by is 'id' or 'created_at' (newest additions last). next_cursor
+        is None on the final page. Raises ValueError for a malformed cursor.
+        """
+        from config import CATALOG_PAGE_SIZE, CATALOG_MAX_PAGE_SIZE
+        limit = max(1, min(int(limit or CATALOG_PAGE_SIZE), CATALOG_MAX_PAGE_SIZE))
+        query = cls._catalog_query(cls.query, genre, artist)
+        
+        if order_by == 'created_at':
+            if cursor:
+                values = _decode_cursor(cursor, (str, int))
+                created_at = datetime.datetime.fromisoformat(values[0])
+                query = query.filter(db.or_(
+                    cls.created_at > created_at,
+                    db.and_(cls.created_at == created_at, cls.id > values[1])
+                ))
+            query = query.order_by(cls.created_at, cls.id)
+        elif order_by == 'id':
+            if cursor:
+                values = _decode_cursor(cursor, (int,))
+                query = query.filter(cls.id > values[0])
+            query = query.order_by(cls.id)
+        else:
+            raise ValueError(f"Unsupported catalog ordering: {order_by}")
+        
+        # Fetch one extra row to learn whether another page exists
+        songs = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(songs) > limit:
+            songs = songs[:limit]
+            last = songs[-1]
+            if order_by == 'created_at':
+                next_cursor = _encode_cursor([last.created_at.isoformat(), last.id])
+            else:
+                next_cursor = _encode_cursor([last.id])
+        return songs, next_cursor
+    
+    @classmethod
+    def ensure_created_at(cls):
+        """Backfill created_at on rows that lack it; returns the rows updated.
+        
+        get_page() needs a created_at on every row. Undated rows get the
+        epoch, so they list first, where NULLs used to sort. On MySQL the
+        column is then made NOT NULL; SQLite cannot alter a column in place.
+        """
+        table = cls.__table__
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                table.update().where(table.c.created_at.is_(None)).values(created_at=datetime.datetime(1970, 1, 1))
+            ).rowcount
+        if db.engine.dialect.name == 'mysql':
+            column = next(c for c in db.inspect(db.engine).get_columns('songs') if c['name'] == 'created_at')
+            if column['nullable']:
+                column_type = column['type'].compile(dialect=db.engine.dialect)
+                with db.engine.begin() as connection:
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE songs MODIFY created_at {column_type} NOT NULL DEFAULT CURRENT_TIMESTAMP'
+                    )
+        return updated
+    
+    @classmethod
+    def browse(cls, offset=0, limit=None, order_by='id', descending=False, **filters):
+        """Return (payloads, total matches) for one page filtered and sorted on the catalog snapshot.
+        
+        filters are catalog_snapshot.CatalogSnapshot.mask() arguments (genres,
+        min_duration, max_duration, artist_prefix, album_prefix). Only the
+        page's payloads are looked up, through the song cache. Returns None
+        when no snapshot is loaded, so callers can fall back to get_page().
+        """
+        from config import CATALOG_PAGE_SIZE, CATALOG_MAX_PAGE_SIZE, CATALOG_SNAPSHOT_ENABLED
+        if not CATALOG_SNAPSHOT_ENABLED:
+            return None
+        import catalog_snapshot
+        snapshot = catalog_snapshot.get_snapshot()
+        if snapshot is None:
+            return None
+        limit = max(1, min(int(limit or CATALOG_PAGE_SIZE), CATALOG_MAX_PAGE_SIZE))
+        filters = {name: value for name, value in filters.items() if value is not None}
+        song_ids = snapshot.query(order_by=order_by, descending=descending, offset=max(int(offset), 0),
+                                  limit=limit, **filters)
+        songs = cls.get_many(song_ids)
+        return [songs[song_id] for song_id in song_ids if song_id in songs], snapshot.count(**filters)
+    
+    @classmethod
+    def iter_dicts(cls, genre=None, artist=None, chunk_size=None):
+        """Yield song dicts for the whole catalog without loading it into memory.
+        
+        Rows are read as plain column tuples through a streaming cursor, so
+        no ORM objects are built and memory stays flat with catalog size.
+        """
+        from config import CATALOG_STREAM_CHUNK_SIZE
+        columns = [getattr(cls, field) for field in cls.DICT_FIELDS]
+        query = cls._catalog_query(db.session.query(*columns), genre, artist)
+        query = query.order_by(cls.id).yield_per(chunk_size or CATALOG_STREAM_CHUNK_SIZE)
+        for row in query:
+            yield dict(zip(cls.DICT_FIELDS, row))
+    
+    @classmethod
+    def stream_json(cls, genre=None, artist=None, chunk_size=None):
+        """Yield the catalog as chunks of a JSON array.
+        
+        Wrap in flask.stream_with_context when returning it from a view.
+        """
+        from config import CATALOG_STREAM_CHUNK_SIZE
+        chunk_size = chunk_size or CATALOG_STREAM_CHUNK_SIZE
+        yield '['
+        buffer = []
+        first = True
+        for song in cls.iter_dicts(genre, artist, chunk_size):
+            buffer.append(json.dumps(song))
+            if len(buffer) >= chunk_size:
+                yield ('' if first else ',') + ','.join(buffer)
+                first = False
+                buffer = []
+        if buffer:
+            yield ('' if first else ',') + ','.join(buffer)
+        yield ']'
+    
     @classmethod
     def get_by_id(cls, song_id):
         return cls.query.get(song_id)
     
     @classmethod
-    def search(cls, query):
+    def get_many(cls, song_ids):
+        """Return {song_id: to_dict() payload} for the given ids.
+        
+        Payloads come from song_cache; all misses are fetched together with a
+        single column query, without building ORM objects.
+        """
+        song_ids = list(dict.fromkeys(song_ids))
+        found, missing = song_cache.songs.get_many(song_ids)
+        if missing:
+            columns = [getattr(cls, field) for field in cls.DICT_FIELDS]
+            fetched = {}
+            for batch in _chunks(missing, 1000):
+                for row in db.session.query(*columns).filter(cls.id.in_(batch)):
+                    fetched[row[0]] = dict(zip(cls.DICT_FIELDS, row))
+            song_cache.songs.set_many(fetched)
+            found.update(fetched)
+        # Copies, so callers cannot modify the cached payloads
+        return {song_id: dict(found[song_id]) for song_id in song_ids if song_id in found}
+    
+    @classmethod
+    def get_dict(cls, song_id):
+        """Cached to_dict() payload for one song, or None if it does not exist"""
+        return cls.get_many([song_id]).get(song_id)
+    
+    @classmethod
+    def search(cls, query, page=1, per_page=None):
+        """Return one page of songs matching query, best match first"""
         if not query:
             return []
-        search_term = f"%{query.lower()}%"
-        return cls.query.filter(
-            db.or_(
-                func.lower(cls.title).like(search_term),
-                func.lower(cls.artist).like(search_term),
-                func.lower(cls.album).like(search_term)
-            )
-        ).all()
+        song_ids = search.search_song_ids(query, page=page, per_page=per_page)
+        if not song_ids:
+            return []
+        songs = {song.id: song for song in cls.query.filter(cls.id.in_(song_ids))}
+        return [songs[song_id] for song_id in song_ids if song_id in songs]
     
     def to_dict(self):
         """Convert song object to dictionary for JSON response"""
@@ -95,67 +357,230 @@ class Playlist(db.Model):
     
     # Relationships
     user = db.relationship("User", back_populates="playlists")
-    playlist_songs = db.relationship("PlaylistSong", back_populates="playlist", cascade="all, delete-orphan")
+    playlist_songs = db.relationship(
+        "PlaylistSong",
+        back_populates="playlist",
+        cascade="all, delete-orphan",
+        order_by="(PlaylistSong.position, PlaylistSong.added_at, PlaylistSong.song_id)"
+    )
     
     @classmethod
-    def get_by_user(cls, user_id):
-        return cls.query.filter_by(user_id=user_id).all()
+    def eager_options(cls, include_songs=True):
+        """Loader options that let to_dict run without per-playlist queries.
+        
+        With include_songs, entries and their songs arrive in one extra query
+        for any number of playlists. Otherwise only the song count is loaded,
+        inline with the playlist rows.
+        """
+        if include_songs:
+            return [selectinload(cls.playlist_songs).joinedload(PlaylistSong.song)]
+        return [undefer(cls.song_count)]
+    
+    @classmethod
+    def get_by_user(cls, user_id, include_songs=True):
+        return cls.query.filter_by(user_id=user_id).options(*cls.eager_options(include_songs)).all()
     
     @classmethod
     def get_by_id(cls, playlist_id):
         return cls.query.get(playlist_id)
     
     def add_song(self, song_id):
-        # Check if song is already in playlist
-        existing = PlaylistSong.query.filter_by(playlist_id=self.id, song_id=song_id).first()
-        if not existing:
-            playlist_song = PlaylistSong(playlist_id=self.id, song_id=song_id)
-            db.session.add(playlist_song)
-            db.session.commit()
-            return True
-        return False
+        return self.add_songs([song_id]) > 0
     
     def remove_song(self, song_id):
-        playlist_song = PlaylistSong.query.filter_by(playlist_id=self.id, song_id=song_id).first()
-        if playlist_song:
-            db.session.delete(playlist_song)
+        return self.remove_songs([song_id]) > 0
+    
+    def add_songs(self, song_ids):
+        """Append songs to the end of this playlist in one transaction.
+        
+        The playlist row is locked (SELECT ... FOR UPDATE, which SQLite
+        ignores) while positions are assigned, so concurrent adds never share
+        a position. Songs already in the playlist are skipped without using
+        up a position. Returns the number of rows actually added.
+        """
+        from config import PLAYLIST_BATCH_SIZE
+        song_ids = list(dict.fromkeys(song_ids))
+        if not song_ids:
+            return 0
+        db.session.execute(db.select(Playlist.id).where(Playlist.id == self.id).with_for_update())
+        existing = set()
+        for batch in _chunks(song_ids, PLAYLIST_BATCH_SIZE):
+            existing.update(db.session.execute(
+                db.select(PlaylistSong.song_id)
+                .where(PlaylistSong.playlist_id == self.id, PlaylistSong.song_id.in_(batch))
+            ).scalars())
+        song_ids = [song_id for song_id in song_ids if song_id not in existing]
+        if not song_ids:
+            # Releases the lock
             db.session.commit()
-            return True
-        return False
+            return 0
+        last_position = db.session.query(func.max(PlaylistSong.position)).filter(
+            PlaylistSong.playlist_id == self.id
+        ).scalar() or 0
+        now = datetime.datetime.utcnow()
+        added = 0
+        for batch in _chunks(song_ids, PLAYLIST_BATCH_SIZE):
+            rows = [
+                {
+                    'playlist_id': self.id,
+                    'song_id': song_id,
+                    'position': last_position + i + 1,
+                    'added_at': now
+                }
+                for i, song_id in enumerate(batch)
+            ]
+            last_position += len(batch)
+            result = db.session.execute(_insert_ignore(PlaylistSong).values(rows))
+            added += result.rowcount
+        db.session.commit()
+        return added
+    
+    def remove_songs(self, song_ids):
+        """Remove songs from this playlist in one transaction.
+        
+        Returns the number of rows actually removed.
+        """
+        from config import PLAYLIST_BATCH_SIZE
+        song_ids = list(dict.fromkeys(song_ids))
+        if not song_ids:
+            return 0
+        removed = 0
+        for batch in _chunks(song_ids, PLAYLIST_BATCH_SIZE):
+            result = db.session.execute(
+                db.delete(PlaylistSong)
+                .where(PlaylistSong.playlist_id == self.id, PlaylistSong.song_id.in_(batch))
+                .execution_options(synchronize_session=False)
+            )
+            removed += result.rowcount
+        db.session.commit()
+        return removed
+    
+    def reorder(self, song_ids):
+        """Move the given songs to the front of the playlist, in the given order.
+        
+        Songs not listed keep their relative order after the listed ones, and
+        ids that are not in the playlist are ignored. Returns the number of
+        rows whose position changed.
+        """
+        current = db.session.query(PlaylistSong.song_id, PlaylistSong.position).filter(
+            PlaylistSong.playlist_id == self.id
+        ).order_by(PlaylistSong.position, PlaylistSong.added_at, PlaylistSong.song_id).all()
+        current_ids = {song_id for song_id, _ in current}
+        listed = [song_id for song_id in dict.fromkeys(song_ids) if song_id in current_ids]
+        listed_set = set(listed)
+        ordered = listed + [song_id for song_id, _ in current if song_id not in listed_set]
+        
+        old_positions = dict(current)
+        new_positions = {song_id: i + 1 for i, song_id in enumerate(ordered)}
+        changed = [song_id for song_id in ordered if old_positions[song_id] != new_positions[song_id]]
+        if not changed:
+            return 0
+        db.session.execute(
+            db.update(PlaylistSong)
+            .where(PlaylistSong.playlist_id == self.id, PlaylistSong.song_id.in_(changed))
+            .values(position=db.case(
+                {song_id: new_positions[song_id] for song_id in changed},
+                value=PlaylistSong.song_id
+            ))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return len(changed)
     
     def get_songs(self):
-        """Get all songs in this playlist"""
-        playlist_songs = PlaylistSong.query.filter_by(playlist_id=self.id).all()
-        song_ids = [ps.song_id for ps in playlist_songs]
-        return Song.query.filter(Song.id.in_(song_ids)).all()
+        """Get all songs in this playlist, in the order they were added"""
+        if 'playlist_songs' not in db.inspect(self).unloaded:
+            # Already eager-loaded, no query needed
+            return [ps.song for ps in self.playlist_songs if ps.song is not None]
+        return (
+            Song.query
+            .join(PlaylistSong, PlaylistSong.song_id == Song.id)
+            .filter(PlaylistSong.playlist_id == self.id)
+            .order_by(PlaylistSong.position, PlaylistSong.added_at, PlaylistSong.song_id)
+            .all()
+        )
     
-    def to_dict(self):
+    def to_dict(self, include_songs=True):
         """Convert playlist to dictionary for JSON response"""
-        return {
+        data = {
             'id': self.id,
             'name': self.name,
             'user_id': self.user_id,
-            'created_at': self.created_at.isoformat(),
-            'songs': [song.to_dict() for song in self.get_songs()]
+            'created_at': self.created_at.isoformat()
         }
+        if include_songs:
+            data['songs'] = [song.to_dict() for song in self.get_songs()]
+            data['song_count'] = len(data['songs'])
+        else:
+            data['song_count'] = self.song_count
+        return data
 
 class PlaylistSong(db.Model):
     __tablename__ = 'playlist_songs'
     
     playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id'), primary_key=True)
     song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), primary_key=True)
+    position = db.Column(db.Integer)  # Order within the playlist
     added_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     
     # Relationships
     playlist = db.relationship("Playlist", back_populates="playlist_songs")
     song = db.relationship("Song", back_populates="playlist_songs")
+    
+    @classmethod
+    def ensure_positions(cls):
+        """Add and backfill position on databases that predate it; returns the playlists renumbered.
+        
+        Playlists with unnumbered rows are renumbered in the order they are
+        shown today: rows without a position first, by added_at, then the rest.
+        """
+        table = cls.__table__
+        if 'position' not in {column['name'] for column in db.inspect(db.engine).get_columns('playlist_songs')}:
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('ALTER TABLE playlist_songs ADD COLUMN position INT')
+        
+        with db.engine.connect() as connection:
+            playlist_ids = connection.execute(
+                db.select(table.c.playlist_id).where(table.c.position.is_(None)).distinct()
+            ).scalars().all()
+        update = table.update().where(
+            table.c.playlist_id == db.bindparam('pid'), table.c.song_id == db.bindparam('sid')
+        ).values(position=db.bindparam('new_position'))
+        for playlist_id in playlist_ids:
+            with db.engine.begin() as connection:
+                rows = connection.execute(
+                    db.select(table.c.song_id, table.c.position)
+                    .where(table.c.playlist_id == playlist_id)
+                    .order_by(db.case((table.c.position.is_(None), 0), else_=1),
+                              table.c.position, table.c.added_at, table.c.song_id)
+                ).all()
+                changed = [
+                    {'pid': playlist_id, 'sid': song_id, 'new_position': i + 1}
+                    for i, (song_id, position) in enumerate(rows) if position != i + 1
+                ]
+                if changed:
+                    connection.execute(update, changed)
+        return len(playlist_ids)
+
+# Number of songs in a playlist, loaded only when undeferred
+Playlist.song_count = db.column_property(
+    db.select(func.count(PlaylistSong.song_id))
+    .where(PlaylistSong.playlist_id == Playlist.id)
+    .correlate_except(PlaylistSong)
+    .scalar_subquery(),
+    deferred=True
+)
 
 class Rating(db.Model):
     __tablename__ = 'ratings'
     
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
-    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), primary_key=True)
-    rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
+    # active_history loads the old value when an expired rating is changed,
+    # which the aggregate events need to take it back out
+    song_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('songs.id'), primary_key=True), active_history=True
+    )
+    rating = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)  # 1-5 stars
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     
     # Relationships
@@ -168,15 +593,153 @@ class Rating(db.Model):
     
     @classmethod
     def get_average_for_song(cls, song_id):
-        result = db.session.query(func.avg(cls.rating)).filter_by(song_id=song_id).scalar()
-        return float(result) if result else 0
+        return cls.get_averages_for_songs([song_id])[song_id]
+    
+    @classmethod
+    def get_averages_for_songs(cls, song_ids):
+        """Return {song_id: average rating} for many songs in one query.
+        
+        Reads the song_rating_stats aggregates, so no ratings are scanned.
+        Songs without ratings average 0.
+        """
+        song_ids = list(dict.fromkeys(song_ids))
+        averages = {song_id: 0 for song_id in song_ids}
+        if not song_ids:
+            return averages
+        rows = db.session.query(
+            SongRatingStats.song_id, SongRatingStats.rating_sum, SongRatingStats.rating_count
+        ).filter(SongRatingStats.song_id.in_(song_ids))
+        for song_id, rating_sum, rating_count in rows:
+            if rating_count:
+                averages[song_id] = rating_sum / rating_count
+        return averages
+
+class SongRatingStats(db.Model):
+    """Running rating totals per song, kept current by the Rating mapper events"""
+    __tablename__ = 'song_rating_stats'
+    
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), primary_key=True)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    # Histogram of star ratings
+    stars_1 = db.Column(db.Integer, nullable=False, default=0)
+    stars_2 = db.Column(db.Integer, nullable=False, default=0)
+    stars_3 = db.Column(db.Integer, nullable=False, default=0)
+    stars_4 = db.Column(db.Integer, nullable=False, default=0)
+    stars_5 = db.Column(db.Integer, nullable=False, default=0)
+    
+    HISTOGRAM_COLUMNS = ('stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5')
+    
+    @classmethod
+    def histogram_column(cls, rating):
+        if rating is not None and 1 <= rating <= len(cls.HISTOGRAM_COLUMNS):
+            return cls.HISTOGRAM_COLUMNS[rating - 1]
+        return None
+    
+    @property
+    def average(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+    
+    def to_dict(self):
+        return {
+            'song_id': self.song_id,
+            'average': self.average,
+            'count': self.rating_count,
+            'histogram': {i + 1: getattr(self, column) for i, column in enumerate(self.HISTOGRAM_COLUMNS)}
+        }
+
+def _apply_rating_delta(connection, song_id, rating, sign):
+    """Add (sign=1) or remove (sign=-1) one rating from a song's aggregates"""
+    table = SongRatingStats.__table__
+    if sign > 0:
+        zeros = {column: 0 for column in SongRatingStats.HISTOGRAM_COLUMNS}
+        connection.execute(
+            _insert_ignore(SongRatingStats, connection.dialect.name)
+            .values(song_id=song_id, rating_sum=0, rating_count=0, **zeros)
+        )
+    values = {
+        'rating_sum': table.c.rating_sum + sign * rating,
+        'rating_count': table.c.rating_count + sign
+    }
+    column = SongRatingStats.histogram_column(rating)
+    if column:
+        values[column] = table.c[column] + sign
+    # A missing row on removal means the song itself is being deleted
+    connection.execute(table.update().where(table.c.song_id == song_id).values(**values))
+
+# Keep the natural key in step with edits made through the ORM
+@event.listens_for(Song, 'before_update')
+def _refresh_catalog_key(mapper, connection, target):
+    target.catalog_key = catalog.catalog_key(target.artist, target.album, target.title)
+
+# Drop cached song payloads and chart metadata when a song changes. They are
+# cleared again after commit, in case another thread re-read the old row in
+# between.
+def _song_changed(mapper, connection, target):
+    song_cache.songs.invalidate(target.id)
+    charts.invalidate_song_meta([target.id])
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_song_ids', set()).add(target.id)
+
+event.listen(Song, 'after_update', _song_changed)
+event.listen(Song, 'after_delete', _song_changed)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_songs(session):
+    changed = session.info.pop('changed_song_ids', ())
+    for song_id in changed:
+        song_cache.songs.invalidate(song_id)
+    if changed:
+        charts.invalidate_song_meta(changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_songs(session):
+    session.info.pop('changed_song_ids', None)
+
+# Bulk query.update()/delete() calls on ratings bypass these events; run
+# rating_stats.py to rebuild the aggregates after such changes.
+@event.listens_for(Rating, 'after_insert')
+def _rating_inserted(mapper, connection, target):
+    _apply_rating_delta(connection, target.song_id, target.rating, 1)
+
+@event.listens_for(Rating, 'after_update')
+def _rating_updated(mapper, connection, target):
+    state = db.inspect(target)
+    rating_history = state.attrs.rating.history
+    song_history = state.attrs.song_id.history
+    if not rating_history.has_changes() and not song_history.has_changes():
+        return
+    old_rating = rating_history.deleted[0] if rating_history.deleted else target.rating
+    old_song_id = song_history.deleted[0] if song_history.deleted else target.song_id
+    _apply_rating_delta(connection, old_song_id, old_rating, -1)
+    _apply_rating_delta(connection, target.song_id, target.rating, 1)
+
+@event.listens_for(Rating, 'after_delete')
+def _rating_deleted(mapper, connection, target):
+    _apply_rating_delta(connection, target.song_id, target.rating, -1)
+
+class SongNeighbor(db.Model):
+    """Precomputed item-to-item similarity, written by recommend.py"""
+    __tablename__ = 'song_neighbors'
+    __table_args__ = (
+        db.Index('ix_song_neighbors_song_score', 'song_id', 'score'),
+    )
+    
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id', ondelete='CASCADE'), primary_key=True)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('songs.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)  # cosine similarity
 
 class History(db.Model):
     __tablename__ = 'history'
+    __table_args__ = (
+        # A user's recent plays come straight off the index, newest first
+        db.Index('ix_history_user_played_at', 'user_id', 'played_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), nullable=False)
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), nullable=False, index=True)
     played_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     
     # Relationships
@@ -189,20 +752,143 @@ class History(db.Model):
     
     @classmethod
     def add_entry(cls, user_id, song_id):
-        entry = cls(user_id=user_id, song_id=song_id)
-        db.session.add(entry)
-        db.session.commit()
+        """Record a play.
+        
+        When write-behind buffering is running the play is queued and a
+        transient entry without an id is returned; it reaches the database
+        with the next flush. May raise history_buffer.HistoryBufferFull.
+        """
+        buffer = history_buffer.get_buffer()
+        if buffer is not None:
+            played_at = buffer.record(user_id, song_id)['played_at']
+            entry = cls(user_id=user_id, song_id=song_id, played_at=played_at)
+        else:
+            # Set here rather than by the column default, so nothing is reloaded after the commit
+            played_at = datetime.datetime.utcnow()
+            entry = cls(user_id=user_id, song_id=song_id, played_at=played_at)
+            db.session.add(entry)
+            db.session.commit()
+        recent_plays.get_store().push(user_id, song_id, played_at)
         return entry
     
-    def to_dict(self):
+    @classmethod
+    def recently_played(cls, user_id, limit=20):
+        """A user's latest plays as dicts, newest first.
+        
+        Served from the recent_plays buffer and song_cache, so a repeat view
+        runs no SQL. A user without a buffer is loaded with one query on
+        ix_history_user_played_at; limits beyond RECENT_PLAYS_SIZE always
+        query. Entries carry no history id.
+        """
+        store = recent_plays.get_store()
+        if limit > store.size:
+            plays = cls._latest_plays(user_id, limit)
+        else:
+            plays = store.get(user_id)
+            if plays is None:
+                store.begin_warm(user_id)
+                try:
+                    plays = cls._latest_plays(user_id, store.size)
+                except Exception:
+                    store.cancel_warm(user_id)
+                    raise
+                plays = store.warm(user_id, plays)
+        plays = plays[:limit]
+        songs = Song.get_many([song_id for song_id, _ in plays])
+        return [{
+            'user_id': user_id,
+            'song': songs[song_id],
+            'played_at': played_at.isoformat()
+        } for song_id, played_at in plays if song_id in songs]
+    
+    @classmethod
+    def _latest_plays(cls, user_id, limit):
+        """(song_id, played_at) newest first, including plays not yet flushed by the history buffer"""
+        buffer = history_buffer.get_buffer()
+        # Read before the query, so a batch committed in between is seen at least once
+        queued = buffer.pending_plays(user_id) if buffer is not None else []
+        rows = db.session.query(cls.song_id, cls.played_at).filter_by(user_id=user_id)\
+            .order_by(cls.played_at.desc()).limit(limit).all()
+        return recent_plays.merge([(song_id, played_at) for song_id, played_at in rows], queued, limit=limit)
+    
+    @classmethod
+    def to_dicts(cls, entries):
+        """Serialize many entries, looking up all their songs at once"""
+        songs = Song.get_many([entry.song_id for entry in entries])
+        return [entry.to_dict(songs) for entry in entries]
+    
+    def to_dict(self, songs=None):
         """Convert history entry to dictionary for JSON response"""
+        song = songs.get(self.song_id) if songs is not None else Song.get_dict(self.song_id)
         return {
             'id': self.id,
             'user_id': self.user_id,
-            'song': self.song.to_dict() if self.song else None,
+            'song': song,
             'played_at': self.played_at.isoformat()
         }
 
+class HistoryDaily(db.Model):
+    """Plays per user, song and day, compacted from history rows older than
+    HISTORY_RETENTION_DAYS by history_rollup.py"""
+    __tablename__ = 'history_daily'
+    __table_args__ = (
+        db.Index('ix_history_daily_song_day', 'song_id', 'day'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def add_counts(cls, connection, rows):
+        """Add {'user_id', 'song_id', 'day', 'plays'} rows to the existing counts"""
+        if not rows:
+            return
+        if connection.dialect.name == 'mysql':
+            stmt = mysql_insert(cls.__table__)
+            stmt = stmt.on_duplicate_key_update(plays=cls.__table__.c.plays + stmt.inserted.plays)
+        else:
+            stmt = (postgresql_insert if connection.dialect.name == 'postgresql' else sqlite_insert)(cls.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'song_id', 'day'],
+                set_={'plays': cls.__table__.c.plays + stmt.excluded.plays}
+            )
+        connection.execute(stmt, rows)
+    
+    @classmethod
+    def song_play_counts(cls, song_ids, since=None):
+        """{song_id: plays} over compacted days and raw plays.
+        
+        With since, compacted days count from since's date.
+        """
+        song_ids = list(song_ids)
+        counts = dict.fromkeys(song_ids, 0)
+        for batch in _chunks(song_ids, 1000):
+            rollups = db.session.query(cls.song_id, func.sum(cls.plays)).filter(cls.song_id.in_(batch))
+            raw = db.session.query(History.song_id, func.count()).filter(History.song_id.in_(batch))
+            if since is not None:
+                rollups = rollups.filter(cls.day >= since.date())
+                raw = raw.filter(History.played_at >= since)
+            for query in (rollups.group_by(cls.song_id), raw.group_by(History.song_id)):
+                for song_id, plays in query:
+                    counts[song_id] += int(plays or 0)
+        return counts
+    
+    @classmethod
+    def user_top_songs(cls, user_id, limit=20, since=None):
+        """[(song_id, plays)] a user played most, over compacted days and raw plays"""
+        rollups = db.session.query(cls.song_id, func.sum(cls.plays)).filter(cls.user_id == user_id)
+        raw = db.session.query(History.song_id, func.count()).filter(History.user_id == user_id)
+        if since is not None:
+            rollups = rollups.filter(cls.day >= since.date())
+            raw = raw.filter(History.played_at >= since)
+        counts = {}
+        for query in (rollups.group_by(cls.song_id), raw.group_by(History.song_id)):
+            for song_id, plays in query:
+                counts[song_id] = counts.get(song_id, 0) + int(plays or 0)
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
     
@@ -223,6 +909,15 @@ class Subscription(db.Model):
             return True
         return self.end_date > datetime.datetime.utcnow()
 
+class SessionRecord(db.Model):
+    """Server-side HTTP session, used by the 'sql' session backend (sessions.py)"""
+    __tablename__ = 'sessions'
+    
+    session_id = db.Column(db.String(255), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    # Indexed so the sweeper can find expired sessions without a table scan
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 # Function to initialize sample data in the database
 def init_sample_data():
     # Check if songs already exist
@@ -269,5 +964,4 @@ def init_sample_data():
             
             # Add some songs to the playlist
             if songs and sample_playlist.id:
-                for i in range(min(3, len(songs))):
-                    sample_playlist.add_song(songs[i].id)
+                sample_playlist.add_songs([song.id for song in songs[:3]])
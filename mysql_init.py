@@ -9,6 +9,7 @@ Usage:
 """
 import os
 import pymysql
+from catalog import SONG_FIELDS, normalize_record
 from config import MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB, MYSQL_PORT, SAMPLE_SONGS
 
 def create_mysql_tables():
@@ -52,7 +53,16 @@ def create_mysql_tables():
                 duration INT,
                 file_path VARCHAR(500) NOT NULL,
                 album_cover VARCHAR(500),
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                catalog_key VARCHAR(40),
+                UNIQUE KEY uq_songs_catalog_key (catalog_key),
+                KEY ix_songs_created_at_id (created_at, id),
+                KEY ix_songs_genre_id (genre, id),
+                KEY ix_songs_artist_id (artist, id),
+                FULLTEXT KEY ft_songs_search (title, artist, album),
+                FULLTEXT KEY ft_songs_title (title),
+                FULLTEXT KEY ft_songs_artist (artist),
+                FULLTEXT KEY ft_songs_album (album)
             )
             """)
             
@@ -72,6 +82,7 @@ def create_mysql_tables():
             CREATE TABLE IF NOT EXISTS playlist_songs (
                 playlist_id INT NOT NULL,
                 song_id INT NOT NULL,
+                position INT,
                 added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 PRIMARY KEY (playlist_id, song_id),
                 FOREIGN KEY (playlist_id) REFERENCES playlists(id) ON DELETE CASCADE,
@@ -79,6 +90,34 @@ def create_mysql_tables():
             )
             """)
             
+            # Create song rating aggregates table
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS song_rating_stats (
+                song_id INT NOT NULL PRIMARY KEY,
+                rating_sum INT NOT NULL DEFAULT 0,
+                rating_count INT NOT NULL DEFAULT 0,
+                stars_1 INT NOT NULL DEFAULT 0,
+                stars_2 INT NOT NULL DEFAULT 0,
+                stars_3 INT NOT NULL DEFAULT 0,
+                stars_4 INT NOT NULL DEFAULT 0,
+                stars_5 INT NOT NULL DEFAULT 0,
+                FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
+            )
+            """)
+            
+            # Create song similarity table
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS song_neighbors (
+                song_id INT NOT NULL,
+                neighbor_id INT NOT NULL,
+                score DOUBLE NOT NULL,
+                PRIMARY KEY (song_id, neighbor_id),
+                KEY ix_song_neighbors_song_score (song_id, score),
+                FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE,
+                FOREIGN KEY (neighbor_id) REFERENCES songs(id) ON DELETE CASCADE
+            )
+            """)
+            
             # Create history table
             cursor.execute("""
             CREATE TABLE IF NOT EXISTS history (
@@ -86,6 +125,22 @@ def create_mysql_tables():
                 user_id INT NOT NULL,
                 song_id INT NOT NULL,
                 played_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                KEY ix_history_user_played_at (user_id, played_at),
+                KEY ix_history_song_id (song_id),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
+            )
+            """)
+            
+            # Create daily play count rollups table
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS history_daily (
+                user_id INT NOT NULL,
+                song_id INT NOT NULL,
+                day DATE NOT NULL,
+                plays INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, song_id, day),
+                KEY ix_history_daily_song_day (song_id, day),
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
                 FOREIGN KEY (song_id) REFERENCES songs(id) ON DELETE CASCADE
             )
@@ -115,26 +170,27 @@ def create_mysql_tables():
             )
             """)
             
+            # Create server-side sessions table
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id VARCHAR(255) NOT NULL PRIMARY KEY,
+                data LONGBLOB NOT NULL,
+                expires_at DATETIME NOT NULL,
+                KEY ix_sessions_expires_at (expires_at)
+            )
+            """)
+            
             # Insert sample songs if songs table is empty
             cursor.execute("SELECT COUNT(*) FROM songs")
             song_count = cursor.fetchone()[0]
             
             if song_count == 0:
                 print("Inserting sample songs...")
-                for song in SAMPLE_SONGS:
-                    # Using the local file paths for audio and images
-                    cursor.execute("""
-                    INSERT INTO songs (title, artist, album, genre, duration, file_path, album_cover)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        song["title"],
-                        song["artist"],
-                        song["album"],
-                        song["genre"],
-                        song["duration"],
-                        song["file_path"],  # Local file path to the MP3
-                        song["album_cover"] # Local file path to the album cover
-                    ))
+                rows = [normalize_record(song) for song in SAMPLE_SONGS]
+                cursor.executemany("""
+                INSERT INTO songs (title, artist, album, genre, duration, file_path, album_cover, catalog_key)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, [tuple(row[field] for field in SONG_FIELDS + ('catalog_key',)) for row in rows])
             
             # Insert sample user if users table is empty
             cursor.execute("SELECT COUNT(*) FROM users")
@@ -172,14 +228,13 @@ def create_mysql_tables():
                 cursor.execute("SELECT id FROM songs LIMIT 3")
                 sample_song_ids = cursor.fetchall()
                 
-                for song_id in sample_song_ids:
-                    cursor.execute("""
-                    INSERT INTO playlist_songs (playlist_id, song_id)
-                    VALUES (%s, %s)
-                    """, (
-                        playlist_id,
-                        song_id[0]
-                    ))
+                cursor.executemany("""
+                INSERT INTO playlist_songs (playlist_id, song_id, position)
+                VALUES (%s, %s, %s)
+                """, [
+                    (playlist_id, song_id[0], position)
+                    for position, song_id in enumerate(sample_song_ids, start=1)
+                ])
             
             connection.commit()
             print("MySQL tables created successfully.")
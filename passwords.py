@@ -0,0 +1,197 @@
+"""Password hashing off the request thread.
+
+User.set_password() and User.check_password() hash with werkzeug in a
+small dedicated process pool, so a burst of logins (or a credential
+stuffing attempt) uses at most PASSWORD_HASH_WORKERS cores and cannot stall
+catalog and playback requests. At most PASSWORD_HASH_QUEUE_LIMIT hashes may
+be queued or running per process; beyond that HashPoolSaturated is raised
+at once, and the app answers 503 with Retry-After instead of queueing. A
+pool whose worker died is replaced on the next call; the request that hit
+it gets the same 503.
+
+PASSWORD_HASH_METHOD sets the algorithm and work factor. Hashes made with
+other settings still verify and are replaced on the next successful login
+(see needs_rehash()). With PASSWORD_HASH_WORKERS = 0 hashing runs inline,
+for scripts and tests.
+"""
+import atexit
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+from config import (PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH, PASSWORD_HASH_WORKERS,
+                    PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('hash', 'verify')
+
+
+class HashPoolSaturated(Exception):
+    """Raised when the hashing pool already has PASSWORD_HASH_QUEUE_LIMIT jobs"""
+
+
+class PasswordHasher:
+    def __init__(self, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH,
+                 workers=PASSWORD_HASH_WORKERS, queue_limit=PASSWORD_HASH_QUEUE_LIMIT,
+                 timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pool = None
+        self._in_flight = 0
+        self._method_prefix = None
+        self.metrics = {
+            'rejected': 0,
+            'timeouts': 0,
+            'rehashes': 0,
+            'pool_restarts': 0,
+            'peak_queue_depth': 0,
+        }
+        self.latency = {op: {'count': 0, 'seconds_total': 0.0, 'seconds_max': 0.0} for op in OPERATIONS}
+
+    def _get_pool(self):
+        if self._pool is None:
+            # Spawned workers never inherit the app's threads or connections
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _discard_pool(self, pool):
+        """Drop a broken pool; call with the lock held"""
+        if self._pool is pool:
+            logger.error("Password hashing worker died, replacing the pool")
+            self._pool = None
+            self.metrics['pool_restarts'] += 1
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _job_done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _run(self, op, fn, *args):
+        started = time.perf_counter()
+        if not self.workers:
+            result = fn(*args)
+        else:
+            with self._lock:
+                if self._in_flight >= self.queue_limit:
+                    self.metrics['rejected'] += 1
+                    raise HashPoolSaturated(f"{self._in_flight} password hashes already queued")
+                self._in_flight += 1
+                self.metrics['peak_queue_depth'] = max(self.metrics['peak_queue_depth'], self._in_flight)
+                pool = self._get_pool()
+                try:
+                    future = pool.submit(fn, *args)
+                except BrokenProcessPool:
+                    self._in_flight -= 1
+                    self._discard_pool(pool)
+                    raise HashPoolSaturated("Password hashing pool restarted")
+                except Exception:
+                    self._in_flight -= 1
+                    raise
+            future.add_done_callback(self._job_done)
+            try:
+                # A timed-out job keeps its queue slot until it finishes
+                result = future.result(self.timeout)
+            except FutureTimeoutError:
+                with self._lock:
+                    self.metrics['timeouts'] += 1
+                raise HashPoolSaturated(f"Password hash took longer than {self.timeout}s")
+            except BrokenProcessPool:
+                # A worker died (OOM kill, crash); the next call starts a new pool
+                with self._lock:
+                    self._discard_pool(pool)
+                raise HashPoolSaturated("Password hashing pool restarted")
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            latency = self.latency[op]
+            latency['count'] += 1
+            latency['seconds_total'] += elapsed
+            latency['seconds_max'] = max(latency['seconds_max'], elapsed)
+        return result
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run('verify', check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a hash was made with a different method or work factor"""
+        if self._method_prefix is None:
+            # werkzeug fills in default parameters, so compare against a real hash
+            self._method_prefix = generate_password_hash('', self.method, 1).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def verify_and_update(self, password_hash, password):
+        """Return (matches, new hash or None); the new hash uses the current work factor"""
+        if not self.verify(password_hash, password):
+            return False, None
+        if not self.needs_rehash(password_hash):
+            return True, None
+        try:
+            new_hash = self.hash(password)
+        except HashPoolSaturated:
+            # The upgrade waits for a later login
+            return True, None
+        with self._lock:
+            self.metrics['rehashes'] += 1
+        return True, new_hash
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, workers=self.workers, queue_limit=self.queue_limit,
+                        queue_depth=self._in_flight,
+                        latency={op: dict(values) for op, values in self.latency.items()})
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """The process-wide PasswordHasher, created on first use"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+                atexit.register(_hasher.shutdown)
+    return _hasher
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def verify_password(password_hash, password):
+    return get_hasher().verify(password_hash, password)
+
+
+def verify_and_update(password_hash, password):
+    return get_hasher().verify_and_update(password_hash, password)
+
+
+def init_app(app):
+    """Answer requests that hit a saturated hashing pool with 503"""
+    from flask import jsonify, request
+
+    @app.errorhandler(HashPoolSaturated)
+    def hash_pool_saturated(error):
+        logger.warning("Rejected %s %s: %s", request.method, request.path, error)
+        response = jsonify({'error': 'Too many sign-in attempts in progress, please retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Hertz Rating Aggregates Rebuild
+
+Recomputes the per-song rating aggregates in song_rating_stats from the
+ratings table. The aggregates are normally maintained incrementally, so a
+rebuild is only needed after bulk changes that bypass the ORM, or to check
+for drift.
+
+Usage:
+    python rating_stats.py            # report drift and rebuild
+    python rating_stats.py --check    # report drift only
+"""
+
+import argparse
+import sys
+from sqlalchemy import func
+from app import db
+from models import Rating, SongRatingStats
+
+def compute_rating_stats():
+    """Return {song_id: aggregate dict} computed from scratch from ratings"""
+    histogram = [
+        func.sum(db.case((Rating.rating == i + 1, 1), else_=0))
+        for i in range(len(SongRatingStats.HISTOGRAM_COLUMNS))
+    ]
+    rows = db.session.query(
+        Rating.song_id, func.sum(Rating.rating), func.count(), *histogram
+    ).group_by(Rating.song_id)
+
+    stats = {}
+    for song_id, rating_sum, rating_count, *counts in rows:
+        stats[song_id] = {
+            'song_id': song_id,
+            'rating_sum': int(rating_sum or 0),
+            'rating_count': int(rating_count),
+            **{column: int(count or 0) for column, count in zip(SongRatingStats.HISTOGRAM_COLUMNS, counts)}
+        }
+    return stats
+
+def find_drift(expected):
+    """Return (song_id, stored, expected) for every aggregate that disagrees"""
+    columns = ('rating_sum', 'rating_count') + SongRatingStats.HISTOGRAM_COLUMNS
+    empty = {column: 0 for column in columns}
+    stored = {
+        row.song_id: {column: getattr(row, column) for column in columns}
+        for row in SongRatingStats.query.all()
+    }
+    drift = []
+    for song_id in sorted(set(stored) | set(expected)):
+        actual = stored.get(song_id, empty)
+        wanted = {column: expected.get(song_id, empty)[column] for column in columns}
+        if actual != wanted:
+            drift.append((song_id, actual, wanted))
+    return drift
+
+def rebuild_rating_stats(check_only=False):
+    """Compare stored aggregates with the ratings table and optionally rebuild them"""
+    expected = compute_rating_stats()
+    drift = find_drift(expected)
+    if not check_only:
+        db.session.query(SongRatingStats).delete()
+        if expected:
+            db.session.execute(db.insert(SongRatingStats), list(expected.values()))
+        db.session.commit()
+    return drift
+
+if __name__ == "__main__":
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Rebuild per-song rating aggregates")
+    parser.add_argument('--check', action='store_true', help="only report drift, do not rebuild")
+    args = parser.parse_args()
+
+    with app.app_context():
+        drift = rebuild_rating_stats(check_only=args.check)
+
+    for song_id, stored, expected in drift:
+        print(f"Song {song_id}: stored {stored} != expected {expected}")
+    print(f"{len(drift)} song(s) with drifted rating aggregates.")
+    if not args.check:
+        print("Rating aggregates rebuilt.")
+    sys.exit(1 if drift and args.check else 0)
@@ -0,0 +1,291 @@
+"""Per-user recently played ring buffers.
+
+History.recently_played() serves a user's last RECENT_PLAYS_SIZE plays as
+(song_id, played_at) pairs from here, and their song payloads from
+song_cache, so a profile or home-screen view normally runs no SQL. Every
+play recorded through History.add_entry() or the async server is pushed
+onto the user's buffer. A user without a buffer is loaded from the
+database on first view: begin_warm() starts collecting the user's pushes,
+and warm() merges them into what was loaded, so a play recorded during the
+load is not lost.
+
+RECENT_PLAYS_BACKEND selects the store:
+
+- 'memory': a per-process LRU of users. Plays recorded by other worker
+  processes show up once the user's entry expires after RECENT_PLAYS_TTL.
+- 'redis': one JSON list per user in Redis (RECENT_PLAYS_REDIS_URL),
+  shared by all workers and updated by Lua scripts; needs the redis
+  package. Redis errors are logged and treated as misses, so views fall
+  back to the database.
+"""
+import collections
+import datetime
+import json
+import logging
+import threading
+import time
+from config import (RECENT_PLAYS_BACKEND, RECENT_PLAYS_SIZE, RECENT_PLAYS_MAX_USERS, RECENT_PLAYS_TTL,
+                    RECENT_PLAYS_REDIS_URL)
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('memory', 'redis')
+
+
+def merge(plays, *others, limit=RECENT_PLAYS_SIZE):
+    """Combine (song_id, played_at) lists newest first, dropping duplicates"""
+    combined = set(plays)
+    for other in others:
+        combined.update(other)
+    return sorted(combined, key=lambda play: play[1], reverse=True)[:limit]
+
+
+class LocalRecentPlays:
+    def __init__(self, size=RECENT_PLAYS_SIZE, max_users=RECENT_PLAYS_MAX_USERS, ttl=RECENT_PLAYS_TTL):
+        self.size = size
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = collections.OrderedDict()  # user_id -> (expires_at, deque of (song_id, played_at))
+        self._loading = {}  # user_id -> [loads in progress, plays pushed meanwhile]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, user_id, now):
+        entry = self._users.get(user_id)
+        return entry if entry is not None and entry[0] > now else None
+
+    def get(self, user_id):
+        """The user's plays newest first, or None when the user is not cached"""
+        with self._lock:
+            entry = self._cached(user_id, time.monotonic())
+            if entry is None:
+                self._users.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return list(reversed(entry[1]))
+
+    def begin_warm(self, user_id):
+        """Collect the user's pushes until the matching warm() or cancel_warm()"""
+        with self._lock:
+            self._loading.setdefault(user_id, [0, []])[0] += 1
+
+    def _end_warm(self, user_id):
+        loading = self._loading.get(user_id)
+        if loading is None:
+            return []
+        loading[0] -= 1
+        if loading[0] <= 0:
+            del self._loading[user_id]
+        return loading[1]
+
+    def cancel_warm(self, user_id):
+        with self._lock:
+            self._end_warm(user_id)
+
+    def warm(self, user_id, plays):
+        """Cache plays loaded from the database, merged with pushes since begin_warm(); returns the result"""
+        with self._lock:
+            pushed = self._end_warm(user_id)
+            now = time.monotonic()
+            entry = self._cached(user_id, now)
+            if entry is not None:
+                # A concurrent load got there first
+                return list(reversed(entry[1]))
+            plays = merge(plays, pushed, limit=self.size)
+            self._users[user_id] = (now + self.ttl, collections.deque(reversed(plays), maxlen=self.size))
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            return plays
+
+    def push(self, user_id, song_id, played_at):
+        """Record a new play; users that are neither cached nor loading are loaded on their next view"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry[1].append((song_id, played_at))
+            elif user_id in self._loading:
+                self._loading[user_id][1].append((song_id, played_at))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'users': len(self._users),
+                'max_users': self.max_users,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# KEYS: buffer, loading list; ARGV: play as JSON, size
+_PUSH_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if raw then
+  local plays = cjson.decode(raw)
+  table.insert(plays, 1, cjson.decode(ARGV[1]))
+  while #plays > tonumber(ARGV[2]) do table.remove(plays) end
+  redis.call('SET', KEYS[1], cjson.encode(plays), 'KEEPTTL')
+elseif redis.call('EXISTS', KEYS[2]) == 1 then
+  redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+"""
+
+# KEYS: buffer, loading list; ARGV: loaded plays as JSON, size, ttl
+_WARM_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+  local plays = cjson.decode(ARGV[1])
+  for _, pushed in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+    if pushed ~= '' then table.insert(plays, cjson.decode(pushed)) end
+  end
+  table.sort(plays, function(a, b) return a[2] > b[2] end)
+  local merged, seen = {}, {}
+  for _, play in ipairs(plays) do
+    local id = play[1] .. '|' .. play[2]
+    if not seen[id] and #merged < tonumber(ARGV[2]) then
+      seen[id] = true
+      table.insert(merged, play)
+    end
+  end
+  raw = #merged > 0 and cjson.encode(merged) or '[]'
+  redis.call('SET', KEYS[1], raw, 'EX', ARGV[3])
+end
+redis.call('DEL', KEYS[2])
+return raw
+"""
+
+
+class RedisRecentPlays:
+    """Buffers shared by every worker, one JSON list per user key"""
+
+    # Seconds a load may take before its pushes are dropped
+    LOADING_TTL = 60
+
+    def __init__(self, url=RECENT_PLAYS_REDIS_URL, size=RECENT_PLAYS_SIZE, ttl=RECENT_PLAYS_TTL,
+                 prefix='hertz:recent:'):
+        import redis
+        self._redis_error = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+        self._push_script = self.client.register_script(_PUSH_SCRIPT)
+        self._warm_script = self.client.register_script(_WARM_SCRIPT)
+        self.size = size
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _keys(self, user_id):
+        return [f'{self.prefix}{user_id}', f'{self.prefix}loading:{user_id}']
+
+    @staticmethod
+    def _encode(plays):
+        return json.dumps([[song_id, played_at.isoformat()] for song_id, played_at in plays])
+
+    @staticmethod
+    def _decode(raw):
+        # An empty Lua table encodes as {}
+        return [(song_id, datetime.datetime.fromisoformat(played_at)) for song_id, played_at in json.loads(raw) or []]
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _failed(self, action):
+        logger.warning("Recent plays %s failed", action, exc_info=True)
+        self._count('errors')
+
+    def get(self, user_id):
+        try:
+            raw = self.client.get(self._keys(user_id)[0])
+        except self._redis_error:
+            self._failed('lookup')
+            raw = None
+        self._count('misses' if raw is None else 'hits')
+        return None if raw is None else self._decode(raw)
+
+    def begin_warm(self, user_id):
+        loading = self._keys(user_id)[1]
+        try:
+            # The empty marker makes the list exist, so pushes are collected
+            with self.client.pipeline() as pipe:
+                pipe.rpush(loading, '')
+                pipe.expire(loading, self.LOADING_TTL)
+                pipe.execute()
+        except self._redis_error:
+            self._failed('warm-up')
+
+    def cancel_warm(self, user_id):
+        # Another load of the user may still need the collected pushes; the list expires
+        pass
+
+    def warm(self, user_id, plays):
+        plays = plays[:self.size]
+        try:
+            raw = self._warm_script(keys=self._keys(user_id), args=[self._encode(plays), self.size, int(self.ttl)])
+        except self._redis_error:
+            self._failed('warm-up')
+            return plays
+        return self._decode(raw)
+
+    def push(self, user_id, song_id, played_at):
+        try:
+            self._push_script(keys=self._keys(user_id), args=[self._encode([(song_id, played_at)])[1:-1], self.size])
+        except self._redis_error:
+            self._failed('update')
+
+    def invalidate(self, user_id):
+        try:
+            self.client.delete(self._keys(user_id)[0])
+        except self._redis_error:
+            self._count('errors')
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_store(backend=RECENT_PLAYS_BACKEND):
+    if backend == 'memory':
+        return LocalRecentPlays()
+    if backend == 'redis':
+        return RedisRecentPlays()
+    raise ValueError(f"Unknown RECENT_PLAYS_BACKEND: {backend!r} (expected one of {', '.join(BACKENDS)})")
+
+
+def get_store():
+    """The process-wide store named by RECENT_PLAYS_BACKEND, created on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store()
+    return _store
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Hertz Recommendations
+
+Offline, this script builds a sparse user x song interaction matrix from
+play history and ratings, computes item-item cosine similarity in blocks and
+stores the top RECOMMEND_NEIGHBORS neighbours of each song in the
+song_neighbors table. Online, similar_songs() and recommend_for_user() only
+read that table, so they cost one or two indexed queries.
+
+Play counts are accumulated in a matrix saved under RECOMMEND_STATE_DIR, so
+an incremental run only reads history rows added since the previous run and
+recomputes neighbours for songs whose interactions changed (plus the songs
+that already list them as neighbours). New pairs involving unchanged songs
+are picked up by the next --full run.
+
+Usage:
+    python recommend.py           # incremental refresh
+    python recommend.py --full    # rebuild from scratch
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import os
+import time
+from app import db
+from config import (RECOMMEND_NEIGHBORS, RECOMMEND_MIN_SCORE, RECOMMEND_BLOCK_SIZE,
+                    RECOMMEND_RATING_WEIGHT, RECOMMEND_SEED_LIMIT, RECOMMEND_STATE_DIR)
+
+logger = logging.getLogger(__name__)
+
+PLAYS_FILE = 'plays.npz'
+RATINGS_FILE = 'ratings.npz'
+META_FILE = 'meta.json'
+
+
+# Online API
+
+def _with_songs(scored):
+    """Turn [(song_id, score)] into [(Song, score)], dropping deleted songs"""
+    from models import Song
+    if not scored:
+        return []
+    songs = {song.id: song for song in Song.query.filter(Song.id.in_([song_id for song_id, _ in scored]))}
+    return [(songs[song_id], score) for song_id, score in scored if song_id in songs]
+
+def similar_songs(song_id, limit=10):
+    """Return [(Song, score)] most similar to song_id, best first"""
+    from models import SongNeighbor
+    rows = db.session.query(SongNeighbor.neighbor_id, SongNeighbor.score).filter(
+        SongNeighbor.song_id == song_id
+    ).order_by(SongNeighbor.score.desc()).limit(limit).all()
+    return _with_songs(rows)
+
+def recommend_for_user(user_id, limit=20):
+    """Return [(Song, score)] recommended from the user's recent plays and ratings"""
+    from models import History, Rating, SongNeighbor
+    seeds = {}
+    recent = db.session.query(History.song_id).filter(
+        History.user_id == user_id
+    ).order_by(History.played_at.desc()).limit(RECOMMEND_SEED_LIMIT)
+    for (song_id,) in recent:
+        seeds[song_id] = seeds.get(song_id, 0) + 1.0
+
+    # Every rated song is excluded; well-rated ones are also seeds
+    rated = set()
+    ratings = db.session.query(Rating.song_id, Rating.rating).filter(
+        Rating.user_id == user_id
+    ).order_by(Rating.created_at.desc()).limit(RECOMMEND_SEED_LIMIT)
+    for song_id, rating in ratings:
+        rated.add(song_id)
+        if rating >= 3:
+            seeds[song_id] = seeds.get(song_id, 0) + RECOMMEND_RATING_WEIGHT * (rating - 2)
+    if not seeds:
+        return []
+
+    scores = {}
+    rows = db.session.query(SongNeighbor.song_id, SongNeighbor.neighbor_id, SongNeighbor.score).filter(
+        SongNeighbor.song_id.in_(list(seeds))
+    )
+    for seed_id, neighbor_id, score in rows:
+        if neighbor_id in seeds or neighbor_id in rated:
+            continue
+        scores[neighbor_id] = scores.get(neighbor_id, 0) + seeds[seed_id] * score
+    top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    return _with_songs(top)
+
+
+# Offline job
+
+def _load_state(state_dir):
+    from scipy import sparse
+    meta_path = os.path.join(state_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None, None, {'last_history_id': 0}
+    with open(meta_path) as f:
+        meta = json.load(f)
+    plays = sparse.load_npz(os.path.join(state_dir, PLAYS_FILE)).tocsr()
+    ratings = sparse.load_npz(os.path.join(state_dir, RATINGS_FILE)).tocsr()
+    return plays, ratings, meta
+
+def _save_state(state_dir, plays, ratings, meta):
+    from scipy import sparse
+    os.makedirs(state_dir, exist_ok=True)
+    sparse.save_npz(os.path.join(state_dir, PLAYS_FILE), plays)
+    sparse.save_npz(os.path.join(state_dir, RATINGS_FILE), ratings)
+    # Written last, so a crash mid-save leaves the previous state in effect
+    tmp_path = os.path.join(state_dir, META_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(state_dir, META_FILE))
+
+def _resize(matrix, shape):
+    from scipy import sparse
+    if matrix is None:
+        return sparse.csr_matrix(shape, dtype='float64')
+    matrix = matrix.tocoo()
+    return sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=shape)
+
+def _read_new_plays(since_id):
+    """Return (user ids, song ids, counts, max history id) for plays after since_id.
+    
+    A full read (since_id 0) also counts the plays compacted into
+    history_daily by history_rollup.py.
+    """
+    from models import History, HistoryDaily
+    max_id = db.session.query(db.func.max(History.id)).scalar() or 0
+    rows = db.session.query(History.user_id, History.song_id, db.func.count()).filter(
+        History.id > since_id, History.id <= max_id
+    ).group_by(History.user_id, History.song_id).all()
+    if since_id == 0:
+        rows += db.session.query(HistoryDaily.user_id, HistoryDaily.song_id, db.func.sum(HistoryDaily.plays)).group_by(
+            HistoryDaily.user_id, HistoryDaily.song_id
+        ).all()
+    return rows, max(max_id, since_id)
+
+def _read_ratings():
+    from models import Rating
+    # Only positive ratings count as interest
+    return db.session.query(Rating.user_id, Rating.song_id, Rating.rating - 2).filter(
+        Rating.rating >= 3
+    ).all()
+
+def _to_matrix(rows, shape):
+    import numpy as np
+    from scipy import sparse
+    if not rows:
+        return sparse.csr_matrix(shape, dtype='float64')
+    users, songs, values = (np.asarray(column) for column in zip(*rows))
+    return sparse.csr_matrix((values.astype('float64'), (users, songs)), shape=shape)
+
+def _top_neighbors(interactions, song_ids, valid):
+    """Yield (song_id, neighbor ids, scores) for each requested song"""
+    import numpy as np
+    from scipy import sparse
+    norms = np.sqrt(np.asarray(interactions.multiply(interactions).sum(axis=0)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = (interactions @ sparse.diags(inverse)).tocsc()
+    transposed = normalized.T.tocsr()
+
+    for start in range(0, len(song_ids), RECOMMEND_BLOCK_SIZE):
+        block = song_ids[start:start + RECOMMEND_BLOCK_SIZE]
+        similarity = (transposed @ normalized[:, block]).tocsc()
+        for j, song_id in enumerate(block):
+            lo, hi = similarity.indptr[j], similarity.indptr[j + 1]
+            neighbors = similarity.indices[lo:hi]
+            scores = similarity.data[lo:hi]
+            keep = (neighbors != song_id) & (scores >= RECOMMEND_MIN_SCORE) & valid[neighbors]
+            neighbors, scores = neighbors[keep], scores[keep]
+            if len(scores) > RECOMMEND_NEIGHBORS:
+                top = np.argpartition(-scores, RECOMMEND_NEIGHBORS)[:RECOMMEND_NEIGHBORS]
+                neighbors, scores = neighbors[top], scores[top]
+            yield song_id, neighbors, scores
+
+def _write_neighbors(results):
+    """Replace stored neighbours block by block, committing after each block"""
+    from models import SongNeighbor
+    written = 0
+    batch_ids, batch_rows = [], []
+
+    def flush():
+        db.session.execute(db.delete(SongNeighbor).where(SongNeighbor.song_id.in_(batch_ids)))
+        if batch_rows:
+            db.session.execute(db.insert(SongNeighbor), batch_rows)
+        db.session.commit()
+
+    for song_id, neighbors, scores in results:
+        batch_ids.append(int(song_id))
+        batch_rows.extend(
+            {'song_id': int(song_id), 'neighbor_id': int(neighbor), 'score': float(score)}
+            for neighbor, score in zip(neighbors, scores)
+        )
+        if len(batch_ids) >= RECOMMEND_BLOCK_SIZE:
+            flush()
+            written += len(batch_rows)
+            batch_ids, batch_rows = [], []
+    if batch_ids:
+        flush()
+        written += len(batch_rows)
+    return written
+
+def refresh_neighbors(full=False, state_dir=None):
+    """Update the song_neighbors table; returns (songs recomputed, rows written)"""
+    import numpy as np
+    from models import Song, SongNeighbor, User
+    state_dir = state_dir or RECOMMEND_STATE_DIR
+    plays, old_ratings, meta = (None, None, {'last_history_id': 0}) if full else _load_state(state_dir)
+
+    new_plays, last_history_id = _read_new_plays(meta['last_history_id'])
+    rating_rows = _read_ratings()
+    song_id_list = [song_id for (song_id,) in db.session.query(Song.id)]
+    max_user = db.session.query(db.func.max(User.id)).scalar() or 0
+    max_song = max(song_id_list, default=0)
+    for user_id, song_id, _ in new_plays + rating_rows:
+        max_user, max_song = max(max_user, user_id), max(max_song, song_id)
+    if plays is not None:
+        max_user = max(max_user, plays.shape[0] - 1)
+        max_song = max(max_song, plays.shape[1] - 1)
+    shape = (max_user + 1, max_song + 1)
+
+    added_plays = _to_matrix(new_plays, shape)
+    plays = _resize(plays, shape) + added_plays
+    ratings = _to_matrix(rating_rows, shape)
+
+    if full:
+        dirty = set(song_id_list)
+    else:
+        changed_ratings = ratings - _resize(old_ratings, shape)
+        dirty = set(added_plays.nonzero()[1].tolist()) | set(changed_ratings.nonzero()[1].tolist())
+        if dirty:
+            # Songs that already list a changed song get their scores refreshed too
+            listing = db.session.query(SongNeighbor.song_id).filter(
+                SongNeighbor.neighbor_id.in_(list(dirty))
+            ).distinct()
+            dirty.update(song_id for (song_id,) in listing)
+
+    valid = np.zeros(shape[1], dtype=bool)
+    valid[song_id_list] = True
+    song_ids = sorted(song_id for song_id in dirty if song_id < shape[1] and valid[song_id])
+
+    interactions = plays.log1p() + RECOMMEND_RATING_WEIGHT * ratings
+    written = _write_neighbors(_top_neighbors(interactions.tocsr(), song_ids, valid))
+    _save_state(state_dir, plays, ratings, {'last_history_id': last_history_id})
+    return len(song_ids), written
+
+
+if __name__ == "__main__":
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Refresh item-to-item song recommendations")
+    parser.add_argument('--full', action='store_true', help="rebuild every song's neighbours from scratch")
+    args = parser.parse_args()
+
+    with app.app_context():
+        started = time.perf_counter()
+        songs, rows = refresh_neighbors(full=args.full)
+    print(f"Recomputed neighbours for {songs} songs ({rows} rows) in {time.perf_counter() - started:.2f}s")
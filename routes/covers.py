@@ -0,0 +1,74 @@
+"""Album cover thumbnail routes.
+
+/covers/<song_id>/<size>.<ext> renders the variant if needed and redirects
+to its content-addressed URL under /covers/c/, which is served with a
+one-year immutable cache lifetime. Remote (http/https) covers and covers
+that cannot be decoded redirect to the original image instead.
+"""
+import logging
+import os
+from flask import Blueprint, abort, current_app, redirect, send_from_directory, url_for
+from config import THUMBNAIL_CACHE_DIR
+from models import Song
+import thumbnails
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('covers', __name__, url_prefix='/covers')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+FORMATS_BY_EXTENSION = {extension: fmt for fmt, extension in thumbnails.EXTENSIONS.items()}
+
+# Covers already reported as unreadable by this process
+_broken_covers = set()
+
+
+def thumbnail_url(song, size, fmt='webp'):
+    """Immutable URL of a cover variant, rendering it if needed; None without a cover"""
+    source = thumbnails.static_file_path(current_app, song.album_cover)
+    if source is None or not os.path.isfile(source):
+        return None
+    digest, _ = thumbnails.ensure_variant(source, size, fmt)
+    return url_for('covers.cached_cover', name=thumbnails.variant_name(digest, size, fmt))
+
+
+@bp.route('/<int:song_id>/<int:size>.<ext>')
+def song_cover(song_id, size, ext):
+    fmt = FORMATS_BY_EXTENSION.get(ext)
+    song = Song.get_by_id(song_id)
+    if song is None or fmt is None:
+        abort(404)
+    if song.album_cover and song.album_cover.startswith(('http://', 'https://')):
+        return _redirect(song.album_cover)
+    try:
+        url = thumbnail_url(song, size, fmt)
+    except ValueError:
+        abort(404)
+    except thumbnails.unreadable_image_errors() as error:
+        if song.album_cover not in _broken_covers:
+            _broken_covers.add(song.album_cover)
+            logger.warning("Cannot render cover %s of song %d: %s", song.album_cover, song_id, error)
+        url = song.album_cover
+    if url is None:
+        abort(404)
+    return _redirect(url)
+
+
+def _redirect(url):
+    response = redirect(url)
+    # The redirect target changes whenever the cover does
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response
+
+
+@bp.route('/c/<name>')
+def cached_cover(name):
+    response = send_from_directory(
+        os.path.join(THUMBNAIL_CACHE_DIR, name[:2]),
+        name,
+        max_age=IMMUTABLE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,138 @@
+"""Prometheus metrics route.
+
+/metrics renders this process's request and SQL aggregates (sql_metrics.py)
+plus connection pool, song cache, history buffer, catalog snapshot,
+recently played and password hashing metrics. Running totals are exported
+as counters named *_total, current values as gauges. Each worker process
+reports its own numbers.
+
+The endpoint exposes endpoint names, SQL shapes and load figures, so it
+denies everything by default. A request is allowed when it carries
+"Authorization: Bearer <METRICS_TOKEN>", or when its client address is in
+METRICS_ALLOWED_NETWORKS. Behind reverse proxies (nginx), the client address
+is the METRICS_PROXY_HOPS-th X-Forwarded-For entry from the right; a
+forwarded request with no hop count configured has no trusted address and
+needs the token, since every client would otherwise appear as the proxy.
+"""
+import hmac
+import ipaddress
+from flask import Blueprint, Response, abort, current_app, request
+from app import db
+from config import CATALOG_SNAPSHOT_ENABLED, METRICS_ALLOWED_NETWORKS, METRICS_PROXY_HOPS, METRICS_TOKEN
+import engine_profiles
+import history_buffer
+import passwords
+import recent_plays
+import song_cache
+import sql_metrics
+
+bp = Blueprint('metrics', __name__)
+
+# Headers a reverse proxy adds; their presence means remote_addr is the proxy
+FORWARDING_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+
+# Running totals among the stats() keys of each source; everything else is a gauge
+POOL_COUNTERS = ('checkouts', 'wait_seconds_total', 'slow_checkouts', 'timeouts')
+CACHE_COUNTERS = ('hits', 'misses', 'evictions', 'errors')
+HISTORY_BUFFER_COUNTERS = ('enqueued', 'rejected', 'replayed', 'flushed_rows', 'flushes', 'failed_flushes',
+                           'dead_lettered', 'total_flush_seconds')
+PASSWORD_HASH_COUNTERS = ('rejected', 'timeouts', 'rehashes', 'pool_restarts')
+
+
+def _counter_name(prefix, key):
+    key = key.removeprefix('total_').removesuffix('_total')
+    return f'{prefix}_{key}_total'
+
+
+def _add(gauges, counters, prefix, title, stats, counter_keys, keys=None):
+    """Sort numeric stats into counters and gauges under hertz_<prefix>_*"""
+    for key in keys or stats:
+        value = stats.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        help_text = f'{title} {key.replace("_", " ")}.'
+        if key in counter_keys:
+            counters[_counter_name(f'hertz_{prefix}', key)] = (help_text, {'': value})
+        else:
+            gauges[f'hertz_{prefix}_{key}'] = (help_text, {'': value})
+
+
+def _metrics():
+    """Return (gauges, counters), each {name: (help, {labels: value})}"""
+    gauges = {}
+    counters = {}
+    _add(gauges, counters, 'db_pool', 'Connection pool', engine_profiles.pool_stats(db.engine), POOL_COUNTERS,
+         ('checked_out', 'capacity', 'saturation', 'peak_checked_out', 'checkouts',
+          'wait_seconds_total', 'wait_seconds_max', 'slow_checkouts', 'timeouts'))
+    _add(gauges, counters, 'song_cache', 'Song cache', song_cache.songs.stats(), CACHE_COUNTERS,
+         ('size', 'hits', 'misses', 'evictions', 'hit_ratio'))
+
+    buffer = history_buffer.get_buffer()
+    if buffer is not None:
+        _add(gauges, counters, 'history_buffer', 'History buffer', buffer.stats(), HISTORY_BUFFER_COUNTERS)
+
+    if CATALOG_SNAPSHOT_ENABLED:
+        # Imported only when enabled, since it needs NumPy
+        import catalog_snapshot
+        snapshot = catalog_snapshot.get_snapshot()
+    else:
+        snapshot = None
+    if snapshot is not None:
+        _add(gauges, counters, 'catalog_snapshot', 'Catalog snapshot', snapshot.stats(), ())
+
+    _add(gauges, counters, 'recent_plays', 'Recently played buffers', recent_plays.get_store().stats(),
+         CACHE_COUNTERS)
+
+    hashing = passwords.get_hasher().stats()
+    _add(gauges, counters, 'password_hash', 'Password hashing', hashing, PASSWORD_HASH_COUNTERS,
+         ('queue_depth', 'queue_limit', 'peak_queue_depth') + PASSWORD_HASH_COUNTERS)
+    latency = hashing['latency']
+    counters['hertz_password_hash_operations_total'] = (
+        'Password hashes and verifications.', {f'op="{op}"': values['count'] for op, values in latency.items()}
+    )
+    counters['hertz_password_hash_seconds_total'] = (
+        'Time spent hashing and verifying passwords, including queueing.',
+        {f'op="{op}"': values['seconds_total'] for op, values in latency.items()}
+    )
+    gauges['hertz_password_hash_seconds_max'] = (
+        'Slowest password hash or verification, including queueing.',
+        {f'op="{op}"': values['seconds_max'] for op, values in latency.items()}
+    )
+    return gauges, counters
+
+
+def _client_address():
+    """The requesting client's address, or None when it cannot be trusted"""
+    hops = current_app.config.get('METRICS_PROXY_HOPS', METRICS_PROXY_HOPS)
+    if hops:
+        forwarded = [address.strip() for address in request.headers.get('X-Forwarded-For', '').split(',')
+                     if address.strip()]
+        return forwarded[-hops] if len(forwarded) >= hops else None
+    if any(header in request.headers for header in FORWARDING_HEADERS):
+        return None
+    return request.remote_addr
+
+
+def _authorized():
+    token = current_app.config.get('METRICS_TOKEN', METRICS_TOKEN)
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if hmac.compare_digest(supplied.encode(), token.encode()):
+            return True
+    networks = current_app.config.get('METRICS_ALLOWED_NETWORKS', METRICS_ALLOWED_NETWORKS)
+    if not networks:
+        return False
+    try:
+        address = ipaddress.ip_address(_client_address() or '')
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network.strip(), strict=False)
+               for network in networks.split(',') if network.strip())
+
+
+@bp.route('/metrics')
+def metrics():
+    if not _authorized():
+        abort(403)
+    gauges, counters = _metrics()
+    return Response(sql_metrics.render_prometheus(gauges, counters), mimetype='text/plain; version=0.0.4')
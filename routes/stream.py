@@ -0,0 +1,212 @@
+"""Audio streaming routes.
+
+Serves the MP3 behind Song.file_path with Range/206 support and ETag /
+Last-Modified validation. Bytes never pass through Python: either the
+front-end server is told to send the file (X-Sendfile or
+X-Accel-Redirect), or the open file is handed to the WSGI server's
+file_wrapper, which gunicorn turns into os.sendfile() starting at the
+file's current offset for Content-Length bytes. Only servers without a
+file_wrapper, such as the development server, read the file in Python.
+"""
+import collections
+import logging
+import mimetypes
+import os
+import threading
+import time
+from flask import Blueprint, abort, current_app, redirect, request, session
+from werkzeug.http import (http_date, parse_date, parse_etags, parse_if_range_header,
+                           parse_range_header, quote_etag)
+from werkzeug.security import safe_join
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+from config import (AUDIO_OFFLOAD, AUDIO_ACCEL_PREFIX, AUDIO_CACHE_MAX_AGE, STREAM_PLAY_DEDUPE_SECONDS,
+                    STREAM_PROBE_MAX_BYTES)
+from models import History, Song
+import history_buffer
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('stream', __name__, url_prefix='/stream')
+
+# (user_id, song_id) -> monotonic time of the last recorded play
+_recent_plays = collections.OrderedDict()
+_recent_plays_lock = threading.Lock()
+_RECENT_PLAYS_MAX = 100000
+
+
+def resolve_audio_path(app, file_path):
+    """Map a /static/... song path to (absolute path, path relative to the static folder)"""
+    static_url = app.static_url_path.rstrip('/') + '/'
+    if not file_path.startswith(static_url):
+        return None, None
+    relative = file_path[len(static_url):]
+    return safe_join(app.static_folder, relative), relative
+
+
+def file_validators(stat):
+    """Return (etag, last_modified timestamp) for a file's os.stat() result"""
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}', int(stat.st_mtime)
+
+
+def evaluate_request(headers, etag, last_modified, size):
+    """Return (status, start, stop) for a GET/HEAD with the given request headers.
+
+    Shared with the async server, so it works on any case-insensitive
+    header mapping rather than on Flask's parsed request attributes.
+    """
+    if headers.get('If-None-Match'):
+        not_modified = parse_etags(headers.get('If-None-Match')).contains_weak(etag)
+    else:
+        since = parse_date(headers.get('If-Modified-Since'))
+        not_modified = since is not None and since.timestamp() >= last_modified
+    if not_modified:
+        return 304, 0, 0
+
+    byte_range = parse_range_header(headers.get('Range'))
+    if_range = parse_if_range_header(headers.get('If-Range'))
+    # A stale If-Range means the client's partial copy is outdated: send everything
+    if byte_range is not None and (if_range.etag or if_range.date) and not (
+        if_range.etag == etag if if_range.etag
+        else if_range.date.timestamp() >= last_modified
+    ):
+        byte_range = None
+    if byte_range is not None and len(byte_range.ranges) == 1:
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            return 416, 0, 0
+        return 206, bounds[0], bounds[1]
+    return 200, 0, size
+
+
+def response_headers(status, etag, last_modified, start, stop, size):
+    """Validator, range and caching headers for evaluate_request()'s result"""
+    headers = {
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': f'private, max-age={AUDIO_CACHE_MAX_AGE}',
+    }
+    if status == 206:
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    elif status == 416:
+        headers['Content-Range'] = f'bytes */{size}'
+    return headers
+
+
+def starts_play(method, headers, start, stop=None):
+    """True when a request for bytes [start, stop) is the start of a listen.
+
+    Only a GET from the first byte is: seeks and resumed downloads (If-Range)
+    continue a play that was already counted, and tiny byte-0 ranges are
+    format probes. stop is None for an open-ended range.
+    """
+    if method != 'GET' or start != 0 or headers.get('If-Range'):
+        return False
+    return stop is None or stop - start > STREAM_PROBE_MAX_BYTES
+
+
+def should_record_play(user_id, song_id):
+    """False when the user started the song within the last STREAM_PLAY_DEDUPE_SECONDS.
+
+    Merges a player's back-to-back byte-0 requests; real repeat listens are
+    further apart. The window is per process.
+    """
+    key = (user_id, song_id)
+    now = time.monotonic()
+    with _recent_plays_lock:
+        last = _recent_plays.get(key)
+        if last is not None and now - last < STREAM_PLAY_DEDUPE_SECONDS:
+            return False
+        _recent_plays[key] = now
+        _recent_plays.move_to_end(key)
+        while len(_recent_plays) > _RECENT_PLAYS_MAX:
+            _recent_plays.popitem(last=False)
+    return True
+
+
+def _record_play(song_id, start, stop=None):
+    user_id = session.get('user_id')
+    if user_id is None or not starts_play(request.method, request.headers, start, stop):
+        return
+    if not should_record_play(user_id, song_id):
+        return
+    try:
+        History.add_entry(user_id, song_id)
+    except history_buffer.HistoryBufferFull:
+        # Losing one play beats failing the stream
+        logger.warning("Dropped play of song %s by user %s: history buffer full", song_id, user_id)
+
+
+def offload_headers(path, relative):
+    """Headers telling the front-end server to send the file itself"""
+    if AUDIO_OFFLOAD == 'x-accel-redirect':
+        header = {'X-Accel-Redirect': AUDIO_ACCEL_PREFIX.rstrip('/') + '/' + relative}
+    else:
+        header = {'X-Sendfile': path}
+    return dict(header, **{'Cache-Control': f'private, max-age={AUDIO_CACHE_MAX_AGE}'})
+
+
+def _offload_response(path, relative, mimetype):
+    response = Response(status=200, mimetype=mimetype)
+    response.headers.update(offload_headers(path, relative))
+    return response
+
+
+@bp.route('/<int:song_id>', methods=['GET', 'HEAD'])
+def stream_song(song_id):
+    song = Song.get_by_id(song_id)
+    if song is None:
+        abort(404)
+    if song.file_path.startswith(('http://', 'https://')):
+        return redirect(song.file_path)
+
+    path, relative = resolve_audio_path(current_app, song.file_path)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(path)[0] or 'audio/mpeg'
+
+    if AUDIO_OFFLOAD:
+        # The front-end server handles ranges and validators itself
+        _record_play(song_id, *(request.range.ranges[0] if request.range else (0, None)))
+        return _offload_response(path, relative, mimetype)
+
+    stat = os.stat(path)
+    size = stat.st_size
+    etag, last_modified = file_validators(stat)
+    status, start, stop = evaluate_request(request.headers, etag, last_modified, size)
+
+    response = Response(status=status, mimetype=mimetype, direct_passthrough=True)
+    response.headers.update(response_headers(status, etag, last_modified, start, stop, size))
+    if status in (304, 416):
+        return response
+
+    response.content_length = stop - start
+    _record_play(song_id, start, stop)
+    if request.method == 'HEAD':
+        return response
+
+    f = open(path, 'rb')
+    f.seek(start)
+    if 'wsgi.file_wrapper' in request.environ:
+        # The server sends Content-Length bytes from the current offset
+        response.response = wrap_file(request.environ, f)
+    else:
+        response.response = _limited_file(f, stop - start)
+    return response
+
+
+def _limited_file(f, length, block_size=64 * 1024):
+    """Yield at most length bytes of f, for servers without a file_wrapper"""
+    try:
+        fileno = f.fileno()
+        offset = f.tell()
+        while length > 0:
+            chunk = os.pread(fileno, min(block_size, length), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
@@ -0,0 +1,194 @@
+"""Full-text catalog search for Hertz.
+
+SQLite databases get an FTS5 external-content table (songs_fts) kept in sync
+with the songs table by triggers. MySQL databases get InnoDB FULLTEXT indexes,
+which the storage engine maintains itself. Any other backend falls back to a
+bounded LIKE scan.
+"""
+import re
+from sqlalchemy import text
+from app import db
+from config import SEARCH_FIELD_WEIGHTS, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE
+
+SEARCH_FIELDS = ('title', 'artist', 'album')
+
+SQLITE_FTS_STATEMENTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+        title, artist, album,
+        content='songs', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS songs_fts_ai AFTER INSERT ON songs BEGIN
+        INSERT INTO songs_fts(rowid, title, artist, album)
+        VALUES (new.id, new.title, new.artist, new.album);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS songs_fts_ad AFTER DELETE ON songs BEGIN
+        INSERT INTO songs_fts(songs_fts, rowid, title, artist, album)
+        VALUES ('delete', old.id, old.title, old.artist, old.album);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS songs_fts_au AFTER UPDATE OF title, artist, album ON songs BEGIN
+        INSERT INTO songs_fts(songs_fts, rowid, title, artist, album)
+        VALUES ('delete', old.id, old.title, old.artist, old.album);
+        INSERT INTO songs_fts(rowid, title, artist, album)
+        VALUES (new.id, new.title, new.artist, new.album);
+    END""",
+]
+
+# MATCH() in MySQL needs an index over exactly the matched columns, so the
+# combined index drives filtering and the per-column ones drive weighting.
+MYSQL_FULLTEXT_INDEXES = {
+    'ft_songs_search': '(title, artist, album)',
+    'ft_songs_title': '(title)',
+    'ft_songs_artist': '(artist)',
+    'ft_songs_album': '(album)',
+}
+
+# Backend per database (engine URL), detected by ensure_search_index() or on first search
+_backends = {}
+
+
+def _terms(query):
+    """Split a user query into lowercase word tokens"""
+    return re.findall(r'\w+', query.lower())
+
+
+def _page_bounds(page, per_page):
+    per_page = per_page or SEARCH_PAGE_SIZE
+    per_page = max(1, min(int(per_page), SEARCH_MAX_PAGE_SIZE))
+    page = max(1, int(page or 1))
+    return per_page, (page - 1) * per_page
+
+
+def _detect_backend():
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        exists = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'songs_fts'"
+        )).first()
+        return 'fts5' if exists else 'like'
+    if dialect == 'mysql':
+        count = db.session.execute(text(
+            "SELECT COUNT(DISTINCT index_name) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'songs' AND index_type = 'FULLTEXT'"
+        )).scalar()
+        return 'fulltext' if count >= len(MYSQL_FULLTEXT_INDEXES) else 'like'
+    return 'like'
+
+
+def _get_backend():
+    backend = _backends.get(db.engine.url)
+    if backend is None:
+        backend = _backends[db.engine.url] = _detect_backend()
+    return backend
+
+
+def ensure_search_index():
+    """Create the full-text index for the current backend if it is missing"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        created = _detect_backend() != 'fts5'
+        try:
+            for statement in SQLITE_FTS_STATEMENTS:
+                db.session.execute(text(statement))
+        except Exception:
+            # SQLite was built without FTS5
+            db.session.rollback()
+            _backends[db.engine.url] = 'like'
+            return
+        if created:
+            # Index songs that existed before the table and triggers
+            db.session.execute(text("INSERT INTO songs_fts(songs_fts) VALUES ('rebuild')"))
+        db.session.commit()
+    elif dialect == 'mysql':
+        existing = {row[0] for row in db.session.execute(text(
+            "SELECT DISTINCT index_name FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'songs'"
+        ))}
+        for name, columns in MYSQL_FULLTEXT_INDEXES.items():
+            if name not in existing:
+                db.session.execute(text(f"ALTER TABLE songs ADD FULLTEXT INDEX {name} {columns}"))
+        db.session.commit()
+    _backends[db.engine.url] = _detect_backend()
+
+
+def rebuild_search_index():
+    """Rebuild the SQLite FTS index from the songs table"""
+    if _get_backend() == 'fts5':
+        db.session.execute(text("INSERT INTO songs_fts(songs_fts) VALUES ('rebuild')"))
+        db.session.commit()
+
+
+def _fts5_statement(terms, limit, offset):
+    # Every term must match; the trailing * turns each one into a prefix query
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return text(
+        "SELECT rowid FROM songs_fts WHERE songs_fts MATCH :match "
+        "ORDER BY bm25(songs_fts, :w_title, :w_artist, :w_album), rowid "
+        "LIMIT :limit OFFSET :offset"
+    ), {
+        'match': match,
+        'w_title': SEARCH_FIELD_WEIGHTS['title'],
+        'w_artist': SEARCH_FIELD_WEIGHTS['artist'],
+        'w_album': SEARCH_FIELD_WEIGHTS['album'],
+        'limit': limit,
+        'offset': offset,
+    }
+
+
+def _fulltext_statement(terms, limit, offset):
+    match = ' '.join(f'+{term}*' for term in terms)
+    score = ' + '.join(
+        f"MATCH({field}) AGAINST(:match IN BOOLEAN MODE) * :w_{field}"
+        for field in SEARCH_FIELDS
+    )
+    return text(
+        f"SELECT id, ({score}) AS score FROM songs "
+        "WHERE MATCH(title, artist, album) AGAINST(:match IN BOOLEAN MODE) "
+        "ORDER BY score DESC, id LIMIT :limit OFFSET :offset"
+    ), {
+        'match': match,
+        'w_title': SEARCH_FIELD_WEIGHTS['title'],
+        'w_artist': SEARCH_FIELD_WEIGHTS['artist'],
+        'w_album': SEARCH_FIELD_WEIGHTS['album'],
+        'limit': limit,
+        'offset': offset,
+    }
+
+
+def _like_statement(terms, limit, offset):
+    clauses = []
+    params = {'limit': limit, 'offset': offset}
+    for i, term in enumerate(terms):
+        params[f'term{i}'] = f'%{term}%'
+        clauses.append('(' + ' OR '.join(
+            f"LOWER({field}) LIKE :term{i}" for field in SEARCH_FIELDS
+        ) + ')')
+    return text(
+        f"SELECT id FROM songs WHERE {' AND '.join(clauses)} "
+        "ORDER BY id LIMIT :limit OFFSET :offset"
+    ), params
+
+
+_STATEMENTS = {'fts5': _fts5_statement, 'fulltext': _fulltext_statement, 'like': _like_statement}
+
+
+def search_statement(query, page=1, per_page=None, backend=None):
+    """Return (statement, params) selecting one page of matching song ids, or None.
+
+    The first column of each result row is the song id. Used directly by the
+    async server, which runs it on its own engine.
+    """
+    terms = _terms(query or '')
+    if not terms:
+        return None
+    limit, offset = _page_bounds(page, per_page)
+    return _STATEMENTS[backend or _get_backend()](terms, limit, offset)
+
+
+def search_song_ids(query, page=1, per_page=None):
+    """Return one page of song ids matching query, best match first"""
+    statement = search_statement(query, page, per_page)
+    if statement is None:
+        return []
+    return [row[0] for row in db.session.execute(*statement)]
@@ -0,0 +1,241 @@
+"""Pluggable session storage.
+
+SESSION_BACKEND selects where Flask sessions live:
+
+- 'sql': the sessions table in the app database, with an indexed
+  expires_at column and a background sweeper that deletes expired rows.
+- 'cookie': Flask's signed cookie (compressed when that is smaller); no
+  server state, so any host can serve any request.
+- 'memory': a per-process dict, for tests and the benchmark.
+- 'filesystem': Flask-Session's original one-file-per-session store.
+
+The server-side backends skip the store write when a session was not
+modified, and only re-store an unchanged session to extend its expiry once
+less than SESSION_REFRESH_THRESHOLD of its lifetime remains.
+"""
+import datetime
+import logging
+import threading
+from flask import g
+from flask_session.base import ServerSideSessionInterface
+from sqlalchemy import delete, select
+from config import SESSION_BACKEND, SESSION_REFRESH_THRESHOLD, SESSION_SWEEP_INTERVAL, SESSION_SWEEP_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('sql', 'cookie', 'memory', 'filesystem')
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+class StoreSessionInterface(ServerSideSessionInterface):
+    """Base for server-side stores that write only when needed"""
+    # Expired sessions are removed by sweep(), not by Flask-Session's hooks
+    ttl = True
+
+    def __init__(self, app):
+        super().__init__(
+            app,
+            key_prefix='',
+            permanent=app.config.get('SESSION_PERMANENT', True),
+            serialization_format='msgpack'
+        )
+
+    def should_set_storage(self, app, session):
+        if session.modified:
+            return True
+        if not app.config['SESSION_REFRESH_EACH_REQUEST']:
+            return False
+        # Set by _load() when the session was read from the store
+        expires_at = g.get('_session_expires_at')
+        if expires_at is None:
+            return True
+        lifetime = app.permanent_session_lifetime
+        return expires_at - _utcnow() < lifetime * SESSION_REFRESH_THRESHOLD
+
+    def _retrieve_session_data(self, store_id):
+        loaded = self._load(store_id)
+        if loaded is None:
+            return None
+        data, expires_at = loaded
+        g._session_expires_at = expires_at
+        return self.serializer.decode(data)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        self._store(store_id, self.serializer.encode(session), _utcnow() + session_lifetime)
+
+    def _delete_expired_sessions(self):
+        self.sweep()
+
+    def _load(self, store_id):
+        """Return (serialized data, expires_at) of a live session, or None"""
+        raise NotImplementedError
+
+    def _store(self, store_id, data, expires_at):
+        raise NotImplementedError
+
+    def sweep(self):
+        """Delete expired sessions; returns how many were removed"""
+        raise NotImplementedError
+
+
+class SqlSessionInterface(StoreSessionInterface):
+    """Sessions in the sessions table (models.SessionRecord).
+
+    Statements run on their own connection and transaction, so saving the
+    session never commits or rolls back the request's ORM session.
+    """
+
+    def __init__(self, app, db, table=None):
+        super().__init__(app)
+        self.db = db
+        self._table = table
+
+    @property
+    def table(self):
+        if self._table is None:
+            from models import SessionRecord
+            self._table = SessionRecord.__table__
+        return self._table
+
+    def _load(self, store_id):
+        table = self.table
+        with self.db.engine.connect() as connection:
+            row = connection.execute(
+                select(table.c.data, table.c.expires_at)
+                .where(table.c.session_id == store_id, table.c.expires_at > _utcnow())
+            ).first()
+        return None if row is None else (bytes(row.data), row.expires_at)
+
+    def _store(self, store_id, data, expires_at):
+        table = self.table
+        values = {'session_id': store_id, 'data': data, 'expires_at': expires_at}
+        with self.db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            if dialect == 'mysql':
+                from sqlalchemy.dialects.mysql import insert
+                stmt = insert(table).values(values)
+                stmt = stmt.on_duplicate_key_update(data=stmt.inserted.data, expires_at=stmt.inserted.expires_at)
+            else:
+                if dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert
+                stmt = insert(table).values(values)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['session_id'],
+                    set_={'data': stmt.excluded.data, 'expires_at': stmt.excluded.expires_at}
+                )
+            connection.execute(stmt)
+
+    def _delete_session(self, store_id):
+        table = self.table
+        with self.db.engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.session_id == store_id))
+
+    def sweep(self, batch_size=SESSION_SWEEP_BATCH_SIZE):
+        # Small batches keep each delete's locks short
+        table = self.table
+        removed = 0
+        while True:
+            with self.db.engine.begin() as connection:
+                ids = connection.execute(
+                    select(table.c.session_id).where(table.c.expires_at <= _utcnow())
+                    .order_by(table.c.expires_at).limit(batch_size)
+                ).scalars().all()
+                if ids:
+                    connection.execute(delete(table).where(table.c.session_id.in_(ids)))
+            removed += len(ids)
+            if len(ids) < batch_size:
+                return removed
+
+
+class MemorySessionInterface(StoreSessionInterface):
+    """Sessions in a dict, private to one process"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._sessions = {}  # store_id -> (data, expires_at)
+        self._lock = threading.Lock()
+
+    def _load(self, store_id):
+        with self._lock:
+            entry = self._sessions.get(store_id)
+        if entry is None or entry[1] <= _utcnow():
+            return None
+        return entry
+
+    def _store(self, store_id, data, expires_at):
+        with self._lock:
+            self._sessions[store_id] = (data, expires_at)
+
+    def _delete_session(self, store_id):
+        with self._lock:
+            self._sessions.pop(store_id, None)
+
+    def sweep(self):
+        now = _utcnow()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for key in expired:
+                del self._sessions[key]
+        return len(expired)
+
+
+class SessionSweeper:
+    """Background thread that periodically deletes expired sessions"""
+
+    def __init__(self, app, interval=SESSION_SWEEP_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    removed = self.app.session_interface.sweep()
+                if removed:
+                    logger.info("Swept %d expired sessions", removed)
+            except Exception:
+                logger.exception("Session sweep failed")
+
+
+def init_app(app, db=None):
+    """Install the session interface named by SESSION_BACKEND"""
+    backend = app.config.setdefault('SESSION_BACKEND', SESSION_BACKEND)
+    if backend == 'sql':
+        if db is None:
+            from app import db
+        app.session_interface = SqlSessionInterface(app, db)
+    elif backend == 'memory':
+        app.session_interface = MemorySessionInterface(app)
+    elif backend == 'filesystem':
+        from flask_session import Session
+        app.config['SESSION_TYPE'] = 'filesystem'
+        Session(app)
+    elif backend != 'cookie':
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend!r} (expected one of {', '.join(BACKENDS)})")
+    # 'cookie' keeps Flask's default SecureCookieSessionInterface
+    return app.session_interface
+
+
+def start_sweeper(app):
+    """Start a sweeper thread when the backend keeps expired sessions around"""
+    if not isinstance(app.session_interface, StoreSessionInterface):
+        return None
+    sweeper = SessionSweeper(app)
+    sweeper.start()
+    return sweeper
@@ -0,0 +1,75 @@
+"""Process-local LRU/TTL cache for serialized songs.
+
+Song metadata almost never changes, so Song.get_dict/get_many serve
+Song.to_dict() payloads from here and only query the database for misses.
+Entries are dropped by the Song mapper events in models.py when a song is
+updated or deleted in this process; changes made by other processes are
+picked up once SONG_CACHE_TTL expires.
+"""
+import collections
+import threading
+import time
+from config import SONG_CACHE_MAX_SIZE, SONG_CACHE_TTL
+
+
+class LRUCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys):
+        """Return ({key: value} for cached keys, [missing keys])"""
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    if entry is not None:
+                        del self._entries[key]
+                    missing.append(key)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def set_many(self, items):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+songs = LRUCache(SONG_CACHE_MAX_SIZE, SONG_CACHE_TTL)
@@ -0,0 +1,241 @@
+"""Per-request SQL instrumentation.
+
+Cursor events on the app's engine count the statements each request runs,
+their total time and the slowest ones. At the end of a request the numbers
+are folded into per-endpoint aggregates, which routes/metrics.py exposes
+in the Prometheus text format at /metrics.
+
+Within one request, a statement shape (the SQL with literals and IN lists
+collapsed) that runs SQL_N_PLUS_ONE_THRESHOLD times or more is reported
+as a likely N+1 query. Requests slower than SLOW_REQUEST_MS are logged
+with their slowest statements.
+
+Only statements run by the request's own thread are attributed to it;
+background threads (history buffer, charts) are not counted. Aggregates
+are per process.
+"""
+import collections
+import contextvars
+import heapq
+import logging
+import re
+import threading
+import time
+from flask import request
+from sqlalchemy import event
+from config import SLOW_REQUEST_MS, SQL_N_PLUS_ONE_THRESHOLD, SQL_SLOW_STATEMENTS_KEPT
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERIES_PER_REQUEST_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+_current = contextvars.ContextVar('sql_metrics_request', default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_SPACES = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Collapse literals, placeholder lists and whitespace so repeats compare equal"""
+    shape = _LITERALS.sub('?', statement)
+    shape = _IN_LISTS.sub('(?)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'sql_seconds', 'slowest', 'shapes')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slowest = []  # min-heap of (seconds, statement)
+        self.shapes = collections.Counter()
+
+    def record(self, statement, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+        if len(self.slowest) < SQL_SLOW_STATEMENTS_KEPT:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+    def repeated_shapes(self):
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if count >= SQL_N_PLUS_ONE_THRESHOLD]
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = collections.Counter()  # status code -> count
+        self.request_seconds = Histogram(REQUEST_SECONDS_BUCKETS)
+        self.queries = Histogram(QUERIES_PER_REQUEST_BUCKETS)
+        self.sql_seconds = 0.0
+        self.n_plus_one = 0
+        self.slow_requests = 0
+
+
+class Registry:
+    """Per-endpoint request and SQL aggregates for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = collections.defaultdict(EndpointStats)
+        # (endpoint, shape) -> requests in which the shape repeated
+        self.n_plus_one_shapes = collections.Counter()
+
+    def observe(self, endpoint, status, seconds, stats, repeated):
+        with self._lock:
+            endpoint_stats = self.endpoints[endpoint]
+            endpoint_stats.requests[status] += 1
+            endpoint_stats.request_seconds.observe(seconds)
+            endpoint_stats.queries.observe(stats.queries)
+            endpoint_stats.sql_seconds += stats.sql_seconds
+            if repeated:
+                endpoint_stats.n_plus_one += 1
+                for shape, _ in repeated:
+                    self.n_plus_one_shapes[(endpoint, shape)] += 1
+            if seconds * 1000 >= SLOW_REQUEST_MS:
+                endpoint_stats.slow_requests += 1
+
+    def snapshot(self):
+        """Copy of the aggregates, safe to render without holding the lock"""
+        import copy
+        with self._lock:
+            return copy.deepcopy(dict(self.endpoints)), dict(self.n_plus_one_shapes)
+
+
+registry = Registry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own execution context, so a statement that raises
+    # (and never reaches after_cursor_execute) leaves nothing behind
+    if _current.get() is not None and context is not None:
+        context._sql_metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, '_sql_metrics_started', None)
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def _start_request():
+    _current.set(RequestStats())
+
+
+def _finish_request(response):
+    stats = _current.get()
+    if stats is None:
+        return response
+    _current.set(None)
+    seconds = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unmatched'
+    repeated = stats.repeated_shapes()
+    registry.observe(endpoint, response.status_code, seconds, stats, repeated)
+
+    for shape, count in repeated:
+        logger.warning("Possible N+1 in %s %s: %d x %s", request.method, request.path, count, shape[:500])
+    if seconds * 1000 >= SLOW_REQUEST_MS:
+        slowest = '; '.join(f'{s * 1000:.1f}ms {statement[:200]}'
+                            for s, statement in sorted(stats.slowest, reverse=True))
+        logger.warning("Slow request %s %s: %.0f ms, %d queries, %.0f ms SQL; slowest: %s",
+                       request.method, request.path, seconds * 1000, stats.queries,
+                       stats.sql_seconds * 1000, slowest)
+    return response
+
+
+def init_app(app, db):
+    """Instrument the app's engine and requests"""
+    from config import SQL_METRICS_ENABLED
+    if not app.config.setdefault('SQL_METRICS_ENABLED', SQL_METRICS_ENABLED):
+        return
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.total}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def render_prometheus(extra_gauges=None, extra_counters=None):
+    """Render the aggregates as Prometheus text.
+
+    extra_gauges and extra_counters are {name: (help, {labels: value})};
+    counter names should end in _total.
+    """
+    endpoints, shapes = registry.snapshot()
+    lines = [
+        '# HELP hertz_http_requests_total Requests handled, by endpoint and status.',
+        '# TYPE hertz_http_requests_total counter',
+    ]
+    for endpoint, stats in sorted(endpoints.items()):
+        for status, count in sorted(stats.requests.items()):
+            lines.append(f'hertz_http_requests_total{{endpoint="{_escape(endpoint)}",status="{status}"}} {count}')
+
+    lines += ['# HELP hertz_http_request_seconds Request latency.',
+              '# TYPE hertz_http_request_seconds histogram']
+    for endpoint, stats in sorted(endpoints.items()):
+        lines += _histogram_lines('hertz_http_request_seconds', f'endpoint="{_escape(endpoint)}"', stats.request_seconds)
+
+    lines += ['# HELP hertz_sql_queries_per_request SQL statements run per request.',
+              '# TYPE hertz_sql_queries_per_request histogram']
+    for endpoint, stats in sorted(endpoints.items()):
+        lines += _histogram_lines('hertz_sql_queries_per_request', f'endpoint="{_escape(endpoint)}"', stats.queries)
+
+    for name, help_text, attribute in (
+        ('hertz_sql_seconds_total', 'Time spent executing SQL.', 'sql_seconds'),
+        ('hertz_n_plus_one_requests_total', 'Requests that repeated a statement shape.', 'n_plus_one'),
+        ('hertz_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS.', 'slow_requests'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for endpoint, stats in sorted(endpoints.items()):
+            lines.append(f'{name}{{endpoint="{_escape(endpoint)}"}} {getattr(stats, attribute)}')
+
+    lines += ['# HELP hertz_n_plus_one_shape_total Requests in which a statement shape repeated.',
+              '# TYPE hertz_n_plus_one_shape_total counter']
+    for (endpoint, shape), count in sorted(shapes.items()):
+        lines.append(f'hertz_n_plus_one_shape_total{{endpoint="{_escape(endpoint)}",'
+                     f'statement="{_escape(shape[:300])}"}} {count}')
+
+    extra = [(name, 'gauge', metric) for name, metric in (extra_gauges or {}).items()]
+    extra += [(name, 'counter', metric) for name, metric in (extra_counters or {}).items()]
+    for name, kind, (help_text, samples) in sorted(extra):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels, value in samples.items():
+            lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
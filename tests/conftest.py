@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Hash passwords in-process, so tests don't start a worker pool
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+import pytest
+import app as app_module
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Register only the blueprints whose modules exist in this checkout
+    monkeypatch.setattr(app_module, 'BLUEPRINT_MODULES', tuple(
+        name for name in app_module.BLUEPRINT_MODULES if importlib.util.find_spec(f'routes.{name}') is not None
+    ))
+    import recent_plays
+    import song_cache
+    flask_app = app_module.create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'hertz.db'),
+        'SESSION_BACKEND': 'memory',
+        'SQL_METRICS_ENABLED': False,
+        'TESTING': True,
+    })
+    with flask_app.app_context():
+        app_module.init_db()
+        song_cache.songs.clear()
+        recent_plays.get_store().clear()
+        yield flask_app
+        app_module.db.session.remove()
+        app_module.db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    from models import User
+
+    def make(name='listener'):
+        user = User(username=name, email=f'{name}@example.com', password_hash='x')
+        app_module.db.session.add(user)
+        app_module.db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_song(app):
+    from models import Song
+
+    def make(title='Song', **fields):
+        fields.setdefault('artist', 'Artist')
+        fields.setdefault('file_path', f'/static/music/{title}.mp3')
+        song = Song(title=title, **fields)
+        app_module.db.session.add(song)
+        app_module.db.session.commit()
+        return song
+    return make
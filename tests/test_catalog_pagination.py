@@ -0,0 +1,68 @@
+import datetime
+import pytest
+from sqlalchemy import text
+from app import db
+from models import Song, _encode_cursor
+
+
+def _all_pages(limit, **kwargs):
+    ids, cursor = [], None
+    while True:
+        songs, cursor = Song.get_page(cursor=cursor, limit=limit, **kwargs)
+        ids += [song.id for song in songs]
+        if cursor is None:
+            return ids
+
+
+@pytest.fixture
+def songs(make_song):
+    base = datetime.datetime(2024, 1, 1)
+    # Several songs share a created_at, so the id breaks ties
+    return [make_song(f'song-{i}', genre='rock' if i % 2 else 'jazz', created_at=base + datetime.timedelta(days=i // 3))
+            for i in range(10)]
+
+
+def test_pages_by_id(songs):
+    assert _all_pages(3) == [song.id for song in songs]
+    assert _all_pages(2, genre='rock') == [song.id for song in songs if song.genre == 'rock']
+
+
+def test_pages_by_created_at(songs):
+    expected = [song.id for song in sorted(songs, key=lambda song: (song.created_at, song.id))]
+    for limit in (1, 3, 4, 20):
+        assert _all_pages(limit, order_by='created_at') == expected
+
+
+def test_undated_songs_are_backfilled_and_listed_first(songs):
+    undated = [songs[4].id, songs[7].id]
+    # A songs table from before created_at was NOT NULL
+    for statement in ('ALTER TABLE songs RENAME TO songs_dated',
+                      'CREATE TABLE songs AS SELECT * FROM songs_dated',
+                      'DROP TABLE songs_dated',
+                      f'UPDATE songs SET created_at = NULL WHERE id IN ({undated[0]}, {undated[1]})'):
+        db.session.execute(text(statement))
+    db.session.commit()
+    assert Song.ensure_created_at() == 2
+    db.session.expire_all()
+    ids = _all_pages(3, order_by='created_at')
+    assert ids[:2] == undated
+    assert sorted(ids) == [song.id for song in songs]
+
+
+@pytest.mark.parametrize('order_by, cursor', [
+    ('id', 'not a cursor'),
+    ('id', _encode_cursor(['2024-01-01T00:00:00', 1])),
+    ('id', _encode_cursor({'id': 1})),
+    ('id', _encode_cursor([True])),
+    ('created_at', _encode_cursor([1])),
+    ('created_at', _encode_cursor([1, '2024-01-01T00:00:00'])),
+    ('created_at', _encode_cursor(['yesterday', 1])),
+])
+def test_malformed_cursor(songs, order_by, cursor):
+    with pytest.raises(ValueError):
+        Song.get_page(cursor=cursor, order_by=order_by)
+
+
+def test_unknown_ordering(songs):
+    with pytest.raises(ValueError):
+        Song.get_page(order_by='title')
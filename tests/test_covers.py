@@ -0,0 +1,61 @@
+import pytest
+from PIL import Image
+import thumbnails
+from routes import covers
+
+
+@pytest.fixture
+def static_dir(app, tmp_path, monkeypatch):
+    (tmp_path / 'static' / 'covers').mkdir(parents=True)
+    app.static_folder = str(tmp_path / 'static')
+    app.static_url_path = '/static'
+    for module in (thumbnails, covers):
+        monkeypatch.setattr(module, 'THUMBNAIL_CACHE_DIR', str(tmp_path / 'thumbnails'))
+    covers._broken_covers.clear()
+    return tmp_path / 'static' / 'covers'
+
+
+def _cover(static_dir, name, size=(400, 300)):
+    Image.new('RGB', size, 'red').save(static_dir / name)
+    return f'/static/covers/{name}'
+
+
+def test_thumbnail_redirects_to_immutable_variant(client, static_dir, make_song):
+    song = make_song(album_cover=_cover(static_dir, 'a.png'))
+    response = client.get(f'/covers/{song.id}/128.webp')
+    assert response.status_code == 302
+    variant = client.get(response.headers['Location'])
+    assert variant.status_code == 200
+    assert 'immutable' in variant.headers['Cache-Control']
+    variant.close()
+
+
+def test_remote_cover_redirects_to_original(client, static_dir, make_song):
+    song = make_song(album_cover='https://images.example.com/a.jpg')
+    response = client.get(f'/covers/{song.id}/128.webp')
+    assert response.status_code == 302
+    assert response.headers['Location'] == 'https://images.example.com/a.jpg'
+
+
+def test_corrupt_cover_redirects_to_original(client, static_dir, make_song):
+    (static_dir / 'broken.jpg').write_bytes(b'not an image')
+    song = make_song(album_cover='/static/covers/broken.jpg')
+    response = client.get(f'/covers/{song.id}/128.webp')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/static/covers/broken.jpg'
+
+
+def test_decompression_bomb_redirects_to_original(client, static_dir, make_song, monkeypatch):
+    song = make_song(album_cover=_cover(static_dir, 'huge.png'))
+    # More than twice the limit raises DecompressionBombError instead of a warning
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    response = client.get(f'/covers/{song.id}/128.webp')
+    assert response.status_code == 302
+    assert response.headers['Location'] == song.album_cover
+
+
+def test_missing_cover_and_unsupported_size(client, static_dir, make_song):
+    assert client.get(f'/covers/{make_song("plain").id}/128.webp').status_code == 404
+    song = make_song(album_cover=_cover(static_dir, 'b.png'))
+    assert client.get(f'/covers/{song.id}/129.webp').status_code == 404
+    assert client.get(f'/covers/{song.id}/128.gif').status_code == 404
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+import pytest
+from sqlalchemy import event, text
+from app import db
+import history_buffer
+from models import History
+
+
+@pytest.fixture
+def buffer(app, tmp_path):
+    buffer = history_buffer.HistoryBuffer(app, str(tmp_path / 'spill'), batch_size=50, flush_interval=0.05,
+                                          max_retries=3)
+    buffer.start()
+    yield buffer
+    buffer.stop()
+
+
+def _dead_lettered(buffer):
+    path = os.path.join(buffer.spill_dir, f'dead-letter-{os.getpid()}.log')
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_plays_are_flushed(buffer, make_user, make_song):
+    user, song = make_user(), make_song()
+    for _ in range(3):
+        buffer.record(user.id, song.id)
+    assert [play[0] for play in buffer.pending_plays(user.id)] == [song.id] * 3
+    buffer.stop()
+    assert History.query.filter_by(user_id=user.id).count() == 3
+    assert buffer.stats()['flushed_rows'] == 3
+
+
+def test_concurrent_records_share_fsyncs(buffer, monkeypatch, make_user, make_song):
+    user, song = make_user(), make_song()
+    real_fsync = os.fsync
+    calls = []
+    free = []
+
+    def lock_is_free():
+        if buffer._cond.acquire(blocking=False):
+            buffer._cond.release()
+            return True
+        return False
+
+    def slow_fsync(fd):
+        # The buffer lock must be free while the disk is busy; checked from
+        # another thread, since the lock is reentrant
+        probe = []
+        checker = threading.Thread(target=lambda: probe.append(lock_is_free()))
+        checker.start()
+        checker.join()
+        free.extend(probe)
+        calls.append(fd)
+        time.sleep(0.02)
+        real_fsync(fd)
+    monkeypatch.setattr(history_buffer.os, 'fsync', slow_fsync)
+
+    threads = [threading.Thread(target=buffer.record, args=(user.id, song.id)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert buffer._synced == buffer._written == 20
+    assert len(calls) < 20
+    assert all(free)
+    buffer.stop()
+    assert History.query.filter_by(user_id=user.id).count() == 20
+
+
+def test_constraint_violations_are_dead_lettered(app, tmp_path, make_user, make_song):
+    user, song = make_user(), make_song()
+    db.engine.dispose()
+
+    def enforce_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+    event.listen(db.engine, 'connect', enforce_foreign_keys)
+    try:
+        buffer = history_buffer.HistoryBuffer(app, str(tmp_path / 'spill'), flush_interval=0.05)
+        buffer.start()
+        for song_id in (song.id, song.id + 100, song.id, song.id):
+            buffer.record(user.id, song_id)
+        buffer.stop()
+    finally:
+        event.remove(db.engine, 'connect', enforce_foreign_keys)
+    assert History.query.count() == 3
+    assert [row['song_id'] for row in _dead_lettered(buffer)] == [song.id + 100]
+    assert buffer.stats()['dead_lettered'] == 1
+
+
+def test_failing_batch_is_dead_lettered_after_max_retries(buffer, make_user, make_song):
+    user, song = make_user(), make_song()
+    db.session.execute(text('ALTER TABLE history RENAME TO history_away'))
+    db.session.commit()
+    try:
+        buffer.record(user.id, song.id)
+        _wait_for(lambda: buffer.stats()['dead_lettered'])
+    finally:
+        db.session.execute(text('ALTER TABLE history_away RENAME TO history'))
+        db.session.commit()
+    assert buffer.stats()['failed_flushes'] == 3
+    assert [row['song_id'] for row in _dead_lettered(buffer)] == [song.id]
+
+
+def test_spill_segments_are_replayed(app, tmp_path, make_user, make_song):
+    user, song = make_user(), make_song()
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    # A segment left by a worker that died, ending in a torn line
+    with open(spill_dir / 'history-999999999-1.log', 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'user_id': user.id, 'song_id': song.id, 'played_at': '2024-01-01T00:00:00'}) + '\n')
+        f.write('{"user_id": ')
+    buffer = history_buffer.HistoryBuffer(app, str(spill_dir), flush_interval=0.05)
+    buffer.start()
+    buffer.stop()
+    assert buffer.stats()['replayed'] == 1
+    assert History.query.filter_by(user_id=user.id).count() == 1
+    assert not list(spill_dir.glob('history-*'))
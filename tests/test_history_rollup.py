@@ -0,0 +1,27 @@
+import datetime
+from app import db
+import history_rollup
+from models import History, HistoryDaily
+
+NOW = datetime.datetime(2024, 6, 30, 12)
+
+
+def _play(user, song, played_at):
+    db.session.add(History(user_id=user.id, song_id=song.id, played_at=played_at))
+    db.session.commit()
+
+
+def test_late_old_plays_behind_recent_ones_are_compacted(make_user, make_song):
+    user, song = make_user(), make_song()
+    old = datetime.datetime(2024, 1, 10, 8)
+    _play(user, song, old)
+    for _ in range(5):
+        _play(user, song, NOW)
+    # Replayed from a spill file after recent plays were already written
+    _play(user, song, old + datetime.timedelta(hours=1))
+
+    stats = history_rollup.compact_history(db, retention_days=90, batch_size=2, pause=0, now=NOW)
+    assert stats['rows'] == 2
+    assert History.query.count() == 5
+    daily = HistoryDaily.query.one()
+    assert (daily.day, daily.plays) == (old.date(), 2)
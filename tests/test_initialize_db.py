@@ -0,0 +1,50 @@
+import io
+import pytest
+
+initialize_db = pytest.importorskip('initialize_db', exc_type=ImportError)
+
+
+def _statements(script):
+    return list(initialize_db.iter_sql_statements(io.StringIO(script)))
+
+
+def test_delimiters_inside_literals_and_identifiers():
+    script = ("INSERT INTO songs VALUES (1, 'a;b', \"c;d\", 'it''s', 'back\\\\slash\\';');\n"
+              "SELECT `odd;name` FROM t;")
+    assert _statements(script) == [
+        "INSERT INTO songs VALUES (1, 'a;b', \"c;d\", 'it''s', 'back\\\\slash\\';')",
+        "SELECT `odd;name` FROM t",
+    ]
+
+
+def test_statements_spanning_lines():
+    assert _statements("INSERT INTO t VALUES ('line one;\nline two');\nSELECT 1;\n") == [
+        "INSERT INTO t VALUES ('line one;\nline two')",
+        "SELECT 1",
+    ]
+
+
+def test_comments():
+    script = ("-- leading comment;\n"
+              "# hash comment;\n"
+              "SELECT 1; /* block; comment */\n"
+              "/*!40101 SET NAMES utf8mb4 */;\n"
+              "SELECT 5--1;\n")
+    assert _statements(script) == ["SELECT 1", "/*!40101 SET NAMES utf8mb4 */", "SELECT 5--1"]
+
+
+def test_delimiter_changes():
+    script = ("DELIMITER //\n"
+              "CREATE TRIGGER t AFTER INSERT ON songs FOR EACH ROW BEGIN\n"
+              "  UPDATE stats SET n = n + 1;\n"
+              "END//\n"
+              "DELIMITER ;\n"
+              "SELECT 2;\n")
+    assert _statements(script) == [
+        "CREATE TRIGGER t AFTER INSERT ON songs FOR EACH ROW BEGIN\n  UPDATE stats SET n = n + 1;\nEND",
+        "SELECT 2",
+    ]
+
+
+def test_trailing_statement_without_delimiter():
+    assert _statements("SELECT 1;\nSELECT 2\n") == ["SELECT 1", "SELECT 2"]
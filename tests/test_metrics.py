@@ -0,0 +1,52 @@
+import pytest
+
+TOKEN = 'secret-token'
+
+
+@pytest.fixture
+def metrics_config(app):
+    app.config.update(METRICS_TOKEN=TOKEN, METRICS_ALLOWED_NETWORKS='127.0.0.0/8', METRICS_PROXY_HOPS=0)
+    return app.config
+
+
+def test_denied_by_default(app, client):
+    app.config.update(METRICS_TOKEN='', METRICS_ALLOWED_NETWORKS='', METRICS_PROXY_HOPS=0)
+    assert client.get('/metrics').status_code == 403
+
+
+def test_allowed_network(metrics_config, client):
+    assert client.get('/metrics').status_code == 200
+
+
+def test_proxied_request_without_token_is_denied(metrics_config, client):
+    # nginx on the same host: the peer is loopback, the client is not
+    response = client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7'},
+                          environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 403
+
+
+def test_proxied_request_with_token(metrics_config, client):
+    response = client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7', 'Authorization': f'Bearer {TOKEN}'})
+    assert response.status_code == 200
+
+
+def test_wrong_token_is_denied(metrics_config, client):
+    response = client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7', 'Authorization': 'Bearer nope'})
+    assert response.status_code == 403
+
+
+def test_proxy_hops_use_forwarded_address(metrics_config, client):
+    metrics_config['METRICS_PROXY_HOPS'] = 1
+    # A client-supplied entry left of the proxy's is not trusted
+    spoofed = client.get('/metrics', headers={'X-Forwarded-For': '127.0.0.1, 203.0.113.7'})
+    assert spoofed.status_code == 403
+    internal = client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7, 127.0.0.5'})
+    assert internal.status_code == 200
+    assert client.get('/metrics').status_code == 403
+
+
+def test_running_totals_are_counters(metrics_config, client):
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE hertz_song_cache_hits_total counter' in body
+    assert '# TYPE hertz_song_cache_size gauge' in body
+    assert '# TYPE hertz_db_pool_checkouts_total counter' in body
@@ -0,0 +1,45 @@
+import datetime
+import sqlite3
+import pytest
+
+migrate_mysql = pytest.importorskip('migrate_mysql')
+
+ROWS = [
+    (1, 'Blue Monday', '2024-01-01 10:00:00.654321'),
+    (2, "It's; fine", None),
+    (3, None, '2024-02-29 23:59:59'),
+]
+
+
+def _sqlite_table(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE songs (id INTEGER PRIMARY KEY, title TEXT, created_at DATETIME)')
+    conn.executemany('INSERT INTO songs VALUES (?, ?, ?)', rows)
+    return conn
+
+
+def test_sqlite_checksum_matches_rows_as_mysql_stores_them():
+    # MySQL DATETIME drops the fraction and comes back as datetime objects
+    mysql_rows = [(1, 'Blue Monday', datetime.datetime(2024, 1, 1, 10, 0, 0)),
+                  (2, "It's; fine", None),
+                  (3, None, datetime.datetime(2024, 2, 29, 23, 59, 59))]
+    expected = sum(migrate_mysql._row_digest(row) for row in mysql_rows) % migrate_mysql.CHECKSUM_MODULUS
+    assert migrate_mysql.table_checksum_sqlite(_sqlite_table(ROWS), 'songs') == (3, expected)
+
+
+def test_checksum_ignores_row_order():
+    forward = migrate_mysql.table_checksum_sqlite(_sqlite_table(ROWS), 'songs')
+    backward = migrate_mysql.table_checksum_sqlite(_sqlite_table(ROWS[::-1]), 'songs')
+    assert forward == backward
+
+
+def test_checksum_detects_changed_and_missing_rows():
+    original = migrate_mysql.table_checksum_sqlite(_sqlite_table(ROWS), 'songs')
+    changed = migrate_mysql.table_checksum_sqlite(_sqlite_table([(1, 'Blue Tuesday', ROWS[0][2])] + ROWS[1:]), 'songs')
+    missing = migrate_mysql.table_checksum_sqlite(_sqlite_table(ROWS[:2]), 'songs')
+    assert changed[1] != original[1]
+    assert missing[0] == 2 and missing[1] != original[1]
+
+
+def test_null_and_string_null_differ():
+    assert migrate_mysql._row_digest([None]) != migrate_mysql._row_digest(['None'])
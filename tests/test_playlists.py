@@ -0,0 +1,34 @@
+import pytest
+from app import db
+from models import Playlist, PlaylistSong
+
+
+@pytest.fixture
+def playlist(make_user):
+    playlist = Playlist(name='Mix', user_id=make_user().id)
+    db.session.add(playlist)
+    db.session.commit()
+    return playlist
+
+
+def _positions(playlist):
+    return db.session.query(PlaylistSong.song_id, PlaylistSong.position).filter(
+        PlaylistSong.playlist_id == playlist.id
+    ).order_by(PlaylistSong.position).all()
+
+
+def test_skipped_songs_leave_no_gaps(playlist, make_song):
+    a, b, c, d = (make_song(title).id for title in 'abcd')
+    assert playlist.add_songs([a, b]) == 2
+    assert playlist.add_songs([b, c, a, d, c]) == 2
+    assert _positions(playlist) == [(a, 1), (b, 2), (c, 3), (d, 4)]
+    assert playlist.add_songs([a, d]) == 0
+
+
+def test_reorder_and_remove(playlist, make_song):
+    a, b, c = (make_song(title).id for title in 'abc')
+    playlist.add_songs([a, b, c])
+    assert playlist.reorder([c, a]) == 3
+    assert [song.id for song in playlist.get_songs()] == [c, a, b]
+    assert playlist.remove_songs([a, a, 999]) == 1
+    assert [song.id for song in playlist.get_songs()] == [c, b]
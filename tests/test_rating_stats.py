@@ -0,0 +1,48 @@
+from app import db
+from models import Rating, SongRatingStats
+import rating_stats
+
+
+def _rate(user, song, stars):
+    rating = Rating(user_id=user.id, song_id=song.id, rating=stars)
+    db.session.add(rating)
+    db.session.commit()
+    return rating
+
+
+def test_aggregates_follow_inserts_updates_and_deletes(make_user, make_song):
+    song, other = make_song('a'), make_song('b')
+    alice, bob = make_user('alice'), make_user('bob')
+    _rate(alice, song, 5)
+    bobs = _rate(bob, song, 2)
+    stats = db.session.get(SongRatingStats, song.id)
+    assert (stats.rating_sum, stats.rating_count, stats.stars_5, stats.stars_2) == (7, 2, 1, 1)
+    assert Rating.get_average_for_song(song.id) == 3.5
+
+    bobs.rating = 4
+    db.session.commit()
+    db.session.refresh(stats)
+    assert (stats.rating_sum, stats.stars_2, stats.stars_4) == (9, 0, 1)
+
+    # Moving a rating to another song moves it between aggregates
+    bobs.song_id = other.id
+    db.session.commit()
+    assert Rating.get_averages_for_songs([song.id, other.id]) == {song.id: 5, other.id: 4}
+
+    db.session.delete(bobs)
+    db.session.commit()
+    assert db.session.get(SongRatingStats, other.id).rating_count == 0
+    assert Rating.get_average_for_song(other.id) == 0
+    assert rating_stats.rebuild_rating_stats(check_only=True) == []
+
+
+def test_rebuild_repairs_drift(make_user, make_song):
+    song = make_song()
+    _rate(make_user(), song, 3)
+    # Bulk updates bypass the mapper events
+    Rating.query.update({Rating.rating: 1})
+    db.session.commit()
+    drift = rating_stats.rebuild_rating_stats()
+    assert [song_id for song_id, _, _ in drift] == [song.id]
+    assert rating_stats.rebuild_rating_stats(check_only=True) == []
+    assert Rating.get_average_for_song(song.id) == 1
@@ -0,0 +1,35 @@
+import app as app_module
+from app import db
+import search
+from models import Song
+
+
+def test_search_ranks_and_prefix_matches(make_song):
+    ballad = make_song('Midnight Ballad', artist='Nova')
+    make_song('Morning', artist='Midnight Riders')
+    make_song('Unrelated', artist='Someone')
+    ids = search.search_song_ids('midn')
+    assert len(ids) == 2 and ids[0] == ballad.id
+    assert search.search_song_ids('') == []
+
+
+def test_backend_is_kept_per_database(app, tmp_path, make_song):
+    make_song('Blue Monday')
+    assert search._get_backend() == 'fts5'
+    search.search_song_ids('blue')
+
+    # A second database without the FTS table must not reuse the first one's backend
+    other = app_module.create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'other.db'),
+        'SESSION_BACKEND': 'memory',
+        'SQL_METRICS_ENABLED': False,
+    })
+    with other.app_context():
+        db.create_all()
+        db.session.add(Song(title='Blue Velvet', artist='Bobby', file_path='/static/music/velvet.mp3'))
+        db.session.commit()
+        assert search._get_backend() == 'like'
+        assert len(search.search_song_ids('blue')) == 1
+        db.session.remove()
+        db.engine.dispose()
+    assert search._get_backend() == 'fts5'
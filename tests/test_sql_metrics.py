@@ -0,0 +1,38 @@
+import pytest
+import sqlalchemy
+from sqlalchemy import event, text
+import sql_metrics
+
+
+@pytest.fixture
+def engine():
+    engine = sqlalchemy.create_engine('sqlite://')
+    event.listen(engine, 'before_cursor_execute', sql_metrics._before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', sql_metrics._after_cursor_execute)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def stats():
+    stats = sql_metrics.RequestStats()
+    token = sql_metrics._current.set(stats)
+    yield stats
+    sql_metrics._current.reset(token)
+
+
+def test_statement_shape():
+    assert (sql_metrics.statement_shape("SELECT * FROM song WHERE id IN (?, ?, ?) AND title = 'x'  AND n = 3")
+            == "SELECT * FROM song WHERE id IN (?) AND title = ? AND n = ?")
+
+
+def test_failed_statement_leaves_no_state(engine, stats):
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(sqlalchemy.exc.OperationalError):
+                conn.execute(text('SELECT * FROM missing_table'))
+        conn.execute(text('SELECT 1'))
+        assert not conn.info
+    assert stats.queries == 1
+    assert stats.shapes == {'SELECT ?': 1}
+
@@ -0,0 +1,73 @@
+import logging
+import pytest
+import history_buffer
+from models import History
+from routes import stream
+
+AUDIO = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def audio_song(app, tmp_path, make_song):
+    (tmp_path / 'music').mkdir()
+    (tmp_path / 'music' / 'track.mp3').write_bytes(AUDIO)
+    app.static_folder = str(tmp_path)
+    app.static_url_path = '/static'
+    stream._recent_plays.clear()
+    return make_song('track', file_path='/static/music/track.mp3')
+
+
+@pytest.fixture
+def listener(client, make_user):
+    user = make_user()
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+    return user
+
+
+def test_range_request(client, audio_song):
+    response = client.get(f'/stream/{audio_song.id}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == AUDIO[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(AUDIO)}'
+
+
+def test_full_buffer_does_not_fail_the_stream(client, audio_song, listener, monkeypatch, caplog):
+    def full(user_id, song_id):
+        raise history_buffer.HistoryBufferFull("Play history buffer is full")
+    monkeypatch.setattr(History, 'add_entry', full)
+    with caplog.at_level(logging.WARNING, logger='routes.stream'):
+        response = client.get(f'/stream/{audio_song.id}')
+    assert response.status_code == 200
+    assert response.data == AUDIO
+    assert 'history buffer full' in caplog.text
+
+
+def _plays(user):
+    return History.query.filter_by(user_id=user.id).count()
+
+
+def test_only_the_start_of_a_listen_is_a_play(client, audio_song, listener):
+    url = f'/stream/{audio_song.id}'
+    assert client.get(url, headers={'Range': 'bytes=0-1'}).status_code == 206
+    assert _plays(listener) == 0
+    client.get(url, headers={'Range': 'bytes=0-'})
+    client.get(url, headers={'Range': 'bytes=4096-'})
+    assert _plays(listener) == 1
+    # A player reopening the stream right away is the same listen
+    client.get(url, headers={'Range': 'bytes=0-'})
+    assert _plays(listener) == 1
+
+
+def test_resumed_download_is_not_a_play(client, audio_song, listener):
+    url = f'/stream/{audio_song.id}'
+    etag = client.head(url).headers['ETag']
+    client.get(url, headers={'Range': 'bytes=0-', 'If-Range': etag})
+    assert _plays(listener) == 0
+
+
+def test_repeat_listens_are_counted(client, audio_song, listener, monkeypatch):
+    monkeypatch.setattr(stream, 'STREAM_PLAY_DEDUPE_SECONDS', 0)
+    for _ in range(3):
+        client.get(f'/stream/{audio_song.id}')
+    assert _plays(listener) == 3
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Hertz Album Cover Thumbnails
+
+Generates fixed-size square variants of album covers (THUMBNAIL_SIZES in
+THUMBNAIL_FORMATS) and stores them in a content-addressed cache: a variant
+lives at <THUMBNAIL_CACHE_DIR>/<digest[:2]>/<digest>-<size>.<format>, where
+digest is the SHA-256 of the source image. A changed cover therefore gets new
+URLs, so variants can be served as immutable.
+
+Variants are rendered on first request, or ahead of time by this script
+using a process pool.
+
+Usage:
+    python thumbnails.py                 # pre-warm every cover
+    python thumbnails.py --workers 8
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import THUMBNAIL_SIZES, THUMBNAIL_FORMATS, THUMBNAIL_QUALITY, THUMBNAIL_CACHE_DIR
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+# (path, mtime_ns, size) -> content digest
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def static_file_path(app, url_path):
+    """Map a /static/... URL path to a file under the app's static folder"""
+    from werkzeug.security import safe_join
+    static_url = app.static_url_path.rstrip('/') + '/'
+    if not url_path or not url_path.startswith(static_url):
+        return None
+    return safe_join(app.static_folder, url_path[len(static_url):])
+
+
+def source_digest(path):
+    """SHA-256 of a source image, cached until the file changes"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+    return digest
+
+
+def variant_name(digest, size, fmt):
+    return f'{digest}-{size}.{EXTENSIONS[fmt]}'
+
+
+def variant_path(digest, size, fmt, cache_dir=None):
+    cache_dir = cache_dir or THUMBNAIL_CACHE_DIR
+    return os.path.join(cache_dir, digest[:2], variant_name(digest, size, fmt))
+
+
+def unreadable_image_errors():
+    """Exceptions meaning a source cannot be rendered: corrupt, not an image, or too large to decode"""
+    from PIL import Image
+    # PIL.UnidentifiedImageError is an OSError
+    return (OSError, Image.DecompressionBombError)
+
+
+def render_variant(source, destination, size, fmt, quality=THUMBNAIL_QUALITY):
+    """Render one square variant; safe to call concurrently for the same file"""
+    from PIL import Image, ImageOps
+    if os.path.exists(destination):
+        return destination
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        # Write to a temporary file and rename, so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, format=fmt.upper(), quality=quality, optimize=True)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return destination
+
+
+def ensure_variant(source, size, fmt):
+    """Return (digest, path) of a variant, rendering it if it is not cached"""
+    if size not in THUMBNAIL_SIZES or fmt not in THUMBNAIL_FORMATS:
+        raise ValueError(f"Unsupported thumbnail variant: {size}px {fmt}")
+    digest = source_digest(source)
+    path = variant_path(digest, size, fmt)
+    if not os.path.exists(path):
+        render_variant(source, path, size, fmt)
+    return digest, path
+
+
+def _render_task(task):
+    source, destination, size, fmt = task
+    try:
+        render_variant(source, destination, size, fmt)
+        return None
+    except Exception as e:
+        return f"{source} ({size}px {fmt}): {e}"
+
+
+def prewarm(app, workers=None):
+    """Render every missing variant of every song's cover; returns (rendered, errors)"""
+    from models import Song
+    from app import db
+    sources = set()
+    for (cover,) in db.session.query(Song.album_cover).filter(Song.album_cover.isnot(None)).distinct():
+        path = static_file_path(app, cover)
+        if path and os.path.isfile(path):
+            sources.add(path)
+
+    # Keyed by destination, so covers shared by many songs render once
+    pending = {}
+    for source in sorted(sources):
+        digest = source_digest(source)
+        for size in THUMBNAIL_SIZES:
+            for fmt in THUMBNAIL_FORMATS:
+                destination = variant_path(digest, size, fmt)
+                if destination not in pending and not os.path.exists(destination):
+                    pending[destination] = (source, destination, size, fmt)
+    tasks = list(pending.values())
+
+    errors = []
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for error in pool.map(_render_task, tasks, chunksize=8):
+                if error:
+                    errors.append(error)
+    return len(tasks) - len(errors), errors
+
+
+if __name__ == "__main__":
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Pre-render album cover thumbnails")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    with app.app_context():
+        started = time.perf_counter()
+        rendered, errors = prewarm(app, workers=args.workers)
+    for error in errors:
+        print(f"Failed: {error}")
+    print(f"Rendered {rendered} thumbnails in {time.perf_counter() - started:.2f}s")